@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+Serve through this entry point (e.g. ``uvicorn autumn_assignment.asgi:application``)
+for the /events/ stream: each open stream is a task on the event loop rather
+than a worker thread.
 """
 
 import os
@@ -10,8 +10,14 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+from datetime import timedelta
 from pathlib import Path
 
+from dotenv import load_dotenv
+
+load_dotenv()
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -52,6 +58,7 @@ SITE_ID = 1  # Add this as well for `django-allauth`
 LOGIN_REDIRECT_URL = '/'
 
 MIDDLEWARE = [
+    'review_system.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,6 +69,14 @@ MIDDLEWARE = [
     'allauth.account.middleware.AccountMiddleware',
 ]
 
+# Request instrumentation (review_system.middleware.PerformanceMiddleware),
+# scraped from /metrics/ by staff users or with "Authorization: Bearer $METRICS_TOKEN".
+PERF_DUPLICATE_QUERY_THRESHOLD = 5  # same query shape this many times in one request is logged as N+1
+PERF_PROFILE_SAMPLE_RATE = 0.0  # fraction of requests run under cProfile
+PERF_PROFILE_HEADER_ENABLED = DEBUG  # allow "X-Profile: 1" to profile a single request
+PERF_PROFILE_DIR = None  # write .prof files here instead of logging the top functions
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # unset disables token scraping
+
 ROOT_URLCONF = 'autumn_assignment.urls'
 
 TEMPLATES = [
@@ -86,12 +101,39 @@ WSGI_APPLICATION = 'autumn_assignment.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# SQLite production profile (review_system.db): WAL and the pragmas below
+# on every connection, persistent connections, and reads routed to a
+# query-only connection ('replica', the same file) while writes go to
+# 'default', whose IMMEDIATE transactions take the write lock up front.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',  # durable across crashes in WAL mode; may lose the last commits on power loss
+    'busy_timeout': 5000,  # ms a writer waits for the lock before "database is locked"
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32000,  # KiB (negative) per connection
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 5},
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'timeout': 5},
+        'READ_ONLY': True,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
+DATABASE_ROUTERS = ['review_system.db.ReadWriteRouter']
+READ_DATABASE_ALIAS = 'replica'
 
 
 # Password validation
@@ -112,6 +154,79 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+REST_FRAMEWORK = {
+    # orjson-backed JSON output (byte-identical to DRF's JSONRenderer).
+    'DEFAULT_RENDERER_CLASSES': [
+        'review_system.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'review_system.authentication.TokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+}
+
+# API tokens issued by LoginView (review_system.tokens). Resolved tokens are
+# cached per process for AUTH_TOKEN_CACHE_TTL seconds.
+AUTH_TOKEN_TTL = timedelta(days=14)
+AUTH_TOKEN_CACHE_TTL = 60
+AUTH_TOKEN_CACHE_MAX_ENTRIES = 10000
+
+# Responses to create requests sent with an Idempotency-Key header are replayed
+# to retries for this long (review_system.idempotency); purge_idempotency_keys
+# deletes them afterwards.
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+# The response cache (review_system.cache) lives in its own LRU-bounded
+# alias. Local memory is per process: deployments with several workers should
+# point 'responses' at a shared backend (Redis, Memcached) instead.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'review-system-responses',
+        'TIMEOUT': 3600,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+RESPONSE_CACHE_ALIAS = 'responses'
+
+# Channeli OAuth (review_system.oauth). The redirect URI registered with
+# Channeli must point at the login-channeli-callback route.
+CHANNELI_CLIENT_ID = os.getenv('CLIENT_ID')
+CHANNELI_CLIENT_SECRET = os.getenv('CLIENT_SECRET')
+CHANNELI_REDIRECT_URI = os.getenv('CHANNELI_REDIRECT_URI', 'http://127.0.0.1:8000/login/channeli/callback/')
+CHANNELI_AUTHORIZE_URL = 'https://channeli.in/oauth/authorise'
+CHANNELI_TOKEN_URL = 'https://channeli.in/open_auth/token/'
+CHANNELI_USER_DATA_URL = 'https://channeli.in/open_auth/get_user_data/'
+CHANNELI_HTTP_TIMEOUT = 5.0
+CHANNELI_HTTP_RETRIES = 2
+CHANNELI_HTTP_MAX_CONNECTIONS = 20
+
+# Background jobs (review_system.jobs), run by `manage.py run_jobs`. A
+# claimed job is leased for JOB_LEASE seconds; failures are retried after
+# JOB_RETRY_BACKOFF * 2**(attempt - 1) seconds (with jitter), capped at
+# JOB_RETRY_BACKOFF_MAX.
+JOB_LEASE = 300
+JOB_RETRY_BACKOFF = 5
+JOB_RETRY_BACKOFF_MAX = 3600
+
+# Server-sent events (review_system.push, /events/), served by the ASGI
+# application. LocalBackend only reaches streams held by the same process; run
+# several ASGI workers with 'review_system.push.RedisBackend' and
+# PUSH_REDIS_URL. A stream whose PUSH_QUEUE_SIZE events go unread is dropped.
+PUSH_BACKEND = 'review_system.push.LocalBackend'
+PUSH_QUEUE_SIZE = 100
+PUSH_MAX_SUBSCRIBERS = 10000
+PUSH_HEARTBEAT = 15  # seconds between keep-alive comments on an idle stream
+
+# Review and comment notifications are sent by the job worker.
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'reviews@localhost')
+
 AUTH_USER_MODEL = 'review_system.User'  # replace 'your_app_name' with the actual name of your app
 
 
@@ -133,6 +248,24 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_URL = 'media/'
+
+# Attachments are stored by content hash (review_system.storage).
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'attachments': {'BACKEND': 'review_system.storage.ContentAddressedStorage'},
+}
+
+# Attachment downloads are streamed by Django (with sendfile() under servers
+# that provide wsgi.file_wrapper) unless a front server takes over:
+# 'X-Accel-Redirect' for nginx, with an internal location at
+# ATTACHMENT_SENDFILE_PREFIX aliased to MEDIA_ROOT, or 'X-Sendfile' for
+# Apache mod_xsendfile / lighttpd.
+ATTACHMENT_SENDFILE_HEADER = None
+ATTACHMENT_SENDFILE_PREFIX = '/protected-media/'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
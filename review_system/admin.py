@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Role, Team, Assignment, Submission, Subtask, Review, ReviewComment, Attachment
+from .models import User, Role, Team, Assignment, Submission, Subtask, Review, ReviewComment, Attachment, SubtaskReviewSummary, AssignmentReviewee, Change, AuthToken, Blob, Job, IdempotencyKey
 
 admin.site.register(User)
 admin.site.register(Role)
@@ -11,6 +11,13 @@ admin.site.register(Subtask)
 admin.site.register(Review)
 admin.site.register(ReviewComment)
 admin.site.register(Attachment)
+admin.site.register(SubtaskReviewSummary)
+admin.site.register(AssignmentReviewee)
+admin.site.register(Change)
+admin.site.register(AuthToken)
+admin.site.register(Blob)
+admin.site.register(Job)
+admin.site.register(IdempotencyKey)
 # Unregister the existing User model if it has been registered before
 admin.site.unregister(User)  # Comment this line if your custom User model has not been registered yet
 
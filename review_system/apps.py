@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ReviewSystemConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'review_system'
+
+    def ready(self):
+        from . import blobs, cache, changes, db, notifications, push, reviewees, roles, rollup, search, tokens  # noqa: F401 (connects signal receivers)
@@ -0,0 +1,31 @@
+import copy
+
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from . import tokens
+
+
+class TokenAuthentication(BaseAuthentication):
+    # "Authorization: Token <token>" with tokens issued by LoginView.
+    # request.auth is the cached tokens.Principal (role names, team ids).
+    keyword = 'Token'
+
+    def authenticate(self, request):
+        header = get_authorization_header(request).split()
+        if not header or header[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(header) != 2:
+            raise AuthenticationFailed('Invalid token header.')
+        try:
+            raw = header[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed('Invalid token header.')
+        principal = tokens.resolve(raw)
+        if principal is None:
+            raise AuthenticationFailed('Invalid or expired token.')
+        # The cached user is shared between requests; hand each one a copy.
+        return copy.copy(principal.user), principal
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -0,0 +1,322 @@
+import asyncio
+import json
+import os
+import random
+import statistics
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+from django.test import AsyncClient
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .models import Assignment, Change, Submission, Subtask, User
+from .renderers import FastJSONRenderer
+from .serializers import ReviewSerializer, SubmissionSerializer, ValuesSerializer
+
+# Benchmark cases for the review system, run by the run_benchmarks command on
+# a throwaway database filled by review_system.seed. Each case is a function
+# taking the BenchmarkContext and doing one unit of work; the runner repeats it
+# and records the median wall time and the query count of one run.
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+class BenchmarkContext:
+    def __init__(self, password='password'):
+        self.password = password
+        self.client = APIClient()
+        self.user = User.objects.filter(roles__role_name='reviewee', effective_assignments__isnull=False).first()
+        self.reviewer = User.objects.filter(roles__role_name='reviewer').first()
+        self.staff = User.objects.create_user(username=f'bench-staff-{uuid.uuid4().hex[:8]}', is_staff=True)
+        self.assignment = Assignment.objects.order_by('pk').first()
+        self.subtask = Subtask.objects.filter(assignment=self.assignment).order_by('pk').first()
+        self.submission_ids = list(Submission.objects.order_by('pk').values_list('pk', flat=True)[:500])
+        self.authenticated = None
+
+    def authenticate(self, user):
+        # Only switch when needed: force_authenticate(None) logs the client out,
+        # which would add session queries to every measured run.
+        if user is not self.authenticated:
+            self.client.force_authenticate(user)
+            self.authenticated = user
+
+    def get(self, name, *args, user=None, **params):
+        self.authenticate(user)
+        response = self.client.get(reverse(name, args=args), params)
+        if response.status_code != 200:
+            raise AssertionError(f'{name} returned {response.status_code}')
+        if getattr(response, 'streaming', False):
+            for _ in response.streaming_content:
+                pass
+        return response
+
+
+@benchmark('serializer.submissions_1000')
+def serialize_submissions(ctx):
+    SubmissionSerializer(list(Submission.objects.order_by('pk')[:1000]), many=True).data
+
+
+@benchmark('serializer.submissions_1000_render')
+def render_submissions(ctx):
+    JSONRenderer().render(SubmissionSerializer(list(Submission.objects.order_by('pk')[:1000]), many=True).data)
+
+
+@benchmark('serializer.submissions_1000_fast_render')
+def fast_render_submissions(ctx):
+    fast = ValuesSerializer.for_serializer(SubmissionSerializer)
+    FastJSONRenderer().render(fast.to_representation(Submission.objects.order_by('pk').values(*fast.columns)[:1000]))
+
+
+@benchmark('serializer.reviews_validate_200')
+def validate_reviews(ctx):
+    payload = [{'review_content': 'ok', 'status': 'passed', 'submission': pk, 'reviewer': ctx.reviewer.pk}
+               for pk in ctx.submission_ids[:200]]
+    serializer = ReviewSerializer(data=payload, many=True)
+    if not serializer.is_valid():
+        raise AssertionError(serializer.errors)
+
+
+@benchmark('api.assignment_detail')
+def assignment_detail(ctx):
+    ctx.get('assignment-detail', ctx.assignment.pk, user=ctx.staff)
+
+
+@benchmark('api.submission_list')
+def submission_list(ctx):
+    ctx.get('submission-list', user=ctx.staff, subtask=ctx.subtask.pk, page_size=100)
+
+
+@benchmark('api.review_list')
+def review_list(ctx):
+    ctx.get('review-list', user=ctx.staff, page_size=100)
+
+
+@benchmark('api.review_queue')
+def review_queue(ctx):
+    ctx.get('review-queue', user=ctx.reviewer, page_size=100)
+
+
+@benchmark('api.my_assignments')
+def my_assignments(ctx):
+    ctx.get('my-assignments', user=ctx.user)
+
+
+@benchmark('api.search')
+def search_endpoint(ctx):
+    ctx.get('search', user=ctx.user, q='parser review')
+
+
+@benchmark('api.export_jsonl')
+def export_jsonl(ctx):
+    ctx.get('assignment-export', ctx.assignment.pk, user=ctx.staff, output='jsonl')
+
+
+@benchmark('api.signup')
+def signup(ctx):
+    ctx.authenticate(None)
+    name = f'bench-{uuid.uuid4().hex[:12]}'
+    response = ctx.client.post(reverse('signup'), {'username': name, 'password': ctx.password, 'email': f'{name}@example.com'})
+    if response.status_code != 201:
+        raise AssertionError(f'signup returned {response.status_code}')
+
+
+@benchmark('api.login')
+def login(ctx):
+    ctx.authenticate(None)
+    response = ctx.client.post(reverse('login'), {'username': ctx.user.username, 'password': ctx.password})
+    if response.status_code != 200:
+        raise AssertionError(f'login returned {response.status_code}')
+
+
+@benchmark('load.login_storm_32')
+def login_storm(ctx, concurrency=32):
+    # Concurrent logins through the ASGI stack. Hashing runs in the bounded
+    # pool, so every request either succeeds or is shed with a 503.
+    async def storm():
+        return await asyncio.gather(*(
+            AsyncClient().post(reverse('login'), {'username': ctx.user.username, 'password': ctx.password})
+            for _ in range(concurrency)
+        ))
+    statuses = {response.status_code for response in async_to_sync(storm)()}
+    if statuses - {200, 503}:
+        raise AssertionError(f'login storm returned {sorted(statuses)}')
+
+
+@benchmark('api.bulk_create_submissions_500')
+def bulk_create_submissions(ctx):
+    payload = [{'submission_description': 'bench', 'files_link': 'https://example.com/bench',
+                'subtask': ctx.subtask.pk, 'reviewee': ctx.user.pk} for _ in range(500)]
+    ctx.authenticate(ctx.user)
+    response = ctx.client.post(reverse('submission-bulk'), payload, format='json')
+    if response.status_code != 201:
+        raise AssertionError(f'bulk create returned {response.status_code}')
+
+
+def run(names=None, repeat=5, ctx=None):
+    ctx = ctx or BenchmarkContext()
+    results = {}
+    for name, func in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        func(ctx)  # warm up caches and lazy imports
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(ctx)
+            timings.append(time.perf_counter() - start)
+        executed = []
+
+        def count(execute, sql, params, many, context):
+            executed.append(sql)
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            # Reads and writes go to different aliases (review_system.db).
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(count))
+            func(ctx)
+        results[name] = {'seconds': round(statistics.median(timings), 6), 'queries': len(executed)}
+    return results
+
+
+def compare(results, baseline, threshold, min_delta=0.002):
+    # List of human-readable regressions: a case is slower than its baseline by
+    # more than ``threshold`` (a fraction, ignoring deltas under ``min_delta``
+    # seconds of noise) or runs more queries.
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        limit = base['seconds'] * (1 + threshold)
+        if result['seconds'] > limit and result['seconds'] - base['seconds'] > min_delta:
+            regressions.append(f"{name}: {result['seconds']:.4f}s vs baseline {base['seconds']:.4f}s")
+        if result['queries'] > base['queries']:
+            regressions.append(f"{name}: {result['queries']} queries vs baseline {base['queries']}")
+    return regressions
+
+
+def load_baseline(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path, results):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+# SQLite concurrency benchmark (run_sqlite_benchmark). Worker threads act as
+# concurrent requests against a scratch database file: most read a page of
+# rows, the rest run a read-then-write transaction, the pattern that makes a
+# deferred SQLite transaction fail with "database is locked". Each profile
+# gets its own file, since journal_mode=WAL sticks to the file.
+#   baseline:   the old settings: default journal, no pragmas, deferred
+#               transactions, a new connection per request.
+#   production: SQLITE_PRAGMAS, IMMEDIATE writes, persistent connections and
+#               reads on a separate query-only connection.
+
+SQLITE_PROFILES = {
+    'baseline': {'pragmas': {}, 'options': {}, 'persistent': False, 'split_reads': False},
+    'production': {'pragmas': None, 'options': {'transaction_mode': 'IMMEDIATE'}, 'persistent': True,
+                   'split_reads': True},
+}
+
+
+def add_sqlite_alias(alias, name, pragmas, options, read_only=False):
+    entry = {**connections.settings['default'], 'NAME': name, 'OPTIONS': {'timeout': 5, **options},
+             'CONN_MAX_AGE': None, 'TEST': {}, 'READ_ONLY': read_only}
+    if pragmas is not None:
+        entry['PRAGMAS'] = pragmas
+    connections.settings[alias] = entry
+
+
+def sqlite_concurrency(profile, directory, threads=8, requests=200, write_ratio=0.2, rows=5000):
+    # {'requests_per_second', 'p50_ms', 'p95_ms', 'errors'} for ``profile``.
+    config = SQLITE_PROFILES[profile]
+    prefix = f'sqlite-bench-{profile}-{uuid.uuid4().hex[:6]}'
+    name = os.path.join(directory, f'{prefix}.sqlite3')
+    pragmas = settings.SQLITE_PRAGMAS if config['pragmas'] is None else config['pragmas']
+    write_alias, read_alias = f'{prefix}-write', f'{prefix}-read'
+    add_sqlite_alias(write_alias, name, pragmas, config['options'])
+    if config['split_reads']:
+        add_sqlite_alias(read_alias, name, pragmas, {}, read_only=True)
+    else:
+        read_alias = write_alias
+
+    with connections[write_alias].schema_editor() as editor:
+        editor.create_model(Change)
+    Change.objects.using(write_alias).bulk_create(
+        [Change(object_type='review', object_id=i) for i in range(rows)], batch_size=1000)
+    connections[write_alias].close()
+
+    latencies, errors, lock = [], [0], threading.Lock()
+    start_line = threading.Barrier(threads)
+
+    def request(rng):
+        if rng.random() < write_ratio:
+            with transaction.atomic(using=write_alias):
+                latest = Change.objects.using(write_alias).order_by('-seq').values_list('seq', flat=True).first()
+                Change.objects.using(write_alias).create(object_type='review', object_id=(latest or 0) + 1)
+        else:
+            list(Change.objects.using(read_alias).filter(object_type='review')
+                 .order_by('-seq').values_list('seq', 'object_id')[:50])
+
+    def worker(seed):
+        rng = random.Random(seed)
+        mine, failed = [], 0
+        start_line.wait()
+        try:
+            for _ in range(requests):
+                started = time.perf_counter()
+                try:
+                    request(rng)
+                except OperationalError:
+                    failed += 1
+                mine.append(time.perf_counter() - started)
+                if not config['persistent']:
+                    connections[write_alias].close()
+                    connections[read_alias].close()
+        finally:
+            connections.close_all()
+            with lock:
+                latencies.extend(mine)
+                errors[0] += failed
+
+    pool = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    for alias in {write_alias, read_alias}:
+        connections[alias].close()
+        del connections.settings[alias]
+    latencies.sort()
+    return {
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 3),
+        'errors': errors[0],
+    }
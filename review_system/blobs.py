@@ -0,0 +1,95 @@
+import os
+import time
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Attachment, Blob
+from .storage import BLOB_PREFIX, TEMP_PREFIX, attachment_storage, blob_name, blob_sha256
+
+# Reference counts for content-addressed attachment blobs. Every Attachment
+# pointing at a blob holds one reference: taken when it is created or its file
+# replaced, dropped when it is deleted or its file replaced. Counts only ever
+# reach zero here; collect() removes the files later, after a grace period,
+# so an upload that just found its content already stored cannot lose it.
+# The Blob row goes first and stays deleted only once the file is gone (see
+# ContentAddressedStorage.purge); an upload's acquire() waits on that write
+# and then finds either the row or its own fresh copy of the file.
+
+
+def acquire(name):
+    sha256 = blob_sha256(name)
+    if sha256 is None:
+        return
+    Blob.objects.bulk_create([Blob(sha256=sha256, size=attachment_storage().size(name))], ignore_conflicts=True)
+    Blob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1)
+
+
+def release(name):
+    sha256 = blob_sha256(name)
+    if sha256 is not None:
+        Blob.objects.filter(sha256=sha256, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+
+
+def collect(grace=3600):
+    # Delete unreferenced blobs, stray files with no Blob row (their attachment
+    # was rolled back) and abandoned temporary uploads, if untouched for
+    # ``grace`` seconds. Returns the number of files removed.
+    storage = attachment_storage()
+    cutoff = time.time() - grace
+    removed = 0
+
+    def stale(name):
+        try:
+            return os.path.getmtime(storage.path(name)) < cutoff
+        except FileNotFoundError:
+            return True
+
+    for sha256 in Blob.objects.filter(ref_count=0).values_list('sha256', flat=True).iterator():
+        name = blob_name(sha256)
+        if not stale(name):
+            continue
+        with transaction.atomic():
+            if not Blob.objects.filter(sha256=sha256, ref_count=0).delete()[0]:
+                continue
+            if storage.purge(name, cutoff):
+                removed += 1
+            else:
+                transaction.set_rollback(True)
+
+    root = storage.path(BLOB_PREFIX)
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            name = os.path.relpath(os.path.join(directory, filename), storage.location).replace(os.sep, '/')
+            sha256 = blob_sha256(name)
+            orphan = sha256 is not None and not Blob.objects.filter(sha256=sha256).exists()
+            if (orphan or filename.startswith(TEMP_PREFIX)) and stale(name) and storage.purge(name, cutoff):
+                removed += 1
+    return removed
+
+
+@receiver(pre_save, sender=Attachment)
+def _attachment_pre_save(sender, instance, raw=False, **kwargs):
+    if instance.file and not instance.file._committed:
+        instance.filename = os.path.basename(instance.file.name)[:255]
+    instance._stored_file = None
+    if not raw and not instance._state.adding:
+        instance._stored_file = Attachment.objects.filter(pk=instance.pk).values_list('file', flat=True).first()
+
+
+@receiver(post_save, sender=Attachment)
+def _attachment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_stored_file', None)
+    if created or instance.file.name != previous:
+        acquire(instance.file.name)
+        if previous:
+            release(previous)
+
+
+@receiver(post_delete, sender=Attachment)
+def _attachment_deleted(sender, instance, **kwargs):
+    release(instance.file.name)
@@ -0,0 +1,193 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.response import Response
+
+from .conditional import ConditionalGetMixin
+from .models import Assignment, Review, ReviewComment, Submission, Subtask, Team, User
+from .signals import rows_bulk_saved
+
+# Versioned response cache for the read-mostly assignment endpoints.
+#
+# Cached responses are keyed by the request path plus the current value of
+# every version counter the response depends on:
+#   "assignments"       any assignment tree changed (the tree list)
+#   "assignment:<id>"   something inside that assignment's tree changed
+#   "memberships"       reviewee or team membership changed
+#   "users"             a user changed (responses with ?expand= of users)
+# Writes bump counters instead of deleting entries; old entries are never
+# looked up again and age out of the backend's LRU. Counters are bumped when
+# the write happens and again on commit, so a reader that cached the old data
+# while the transaction was open cannot outlive it.
+#
+# The backend is the RESPONSE_CACHE_ALIAS cache (local memory by default).
+# With several worker processes it must be a shared backend such as Redis or
+# Memcached, otherwise a write only invalidates its own process.
+
+ASSIGNMENTS = 'assignments'
+MEMBERSHIPS = 'memberships'
+USERS = 'users'
+
+
+def assignment(assignment_id):
+    return f'assignment:{assignment_id}'
+
+
+def backend():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def _version_key(name):
+    return f'review-version:{name}'
+
+
+def versions(names):
+    cache = backend()
+    keys = [_version_key(name) for name in names]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Start a missing (new or evicted) counter at the clock, never at a
+            # value an older entry could have been stored under.
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def _bump_now(names):
+    cache = backend()
+    for name in names:
+        key = _version_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump(*names):
+    names = [name for name in names if name]
+    if not names:
+        return
+    _bump_now(names)
+    transaction.on_commit(lambda: _bump_now(names))
+
+
+def response_key(request, names, per_user=False):
+    user = request.user.pk if per_user else ''
+    return 'review-response:{}:{}:{}'.format(
+        request.get_full_path(), user, ':'.join(str(value) for value in versions(names)),
+    )
+
+
+class CachedResponseMixin(ConditionalGetMixin):
+    # For DRF views: serve GET from the response cache while the versions from
+    # get_cache_versions() are unchanged. The conditional GET ETag is
+    # cached alongside the body, so neither a hit nor a 304 runs any SQL. Only
+    # JSON responses are cached, and only successful ones.
+
+    def get_cache_versions(self):
+        return [ASSIGNMENTS]
+
+    def get_cache_key(self):
+        if getattr(self.request, 'accepted_renderer', None) is None or self.request.accepted_renderer.format != 'json':
+            return None
+        if not hasattr(self, '_cache_key'):
+            self._cache_key = response_key(self.request, self.get_cache_versions(), self.per_user)
+        return self._cache_key
+
+    def get_validators(self):
+        key = self.get_cache_key()
+        if key is None:
+            return super().get_validators()
+        found = backend().get(key + ':etag')
+        if found is None:
+            found = super().get_validators()
+            backend().set(key + ':etag', found)
+        return found
+
+    def get_fresh_response(self, request, *args, **kwargs):
+        key = self.get_cache_key()
+        if key is None:
+            return super().get_fresh_response(request, *args, **kwargs)
+        data = backend().get(key)
+        if data is not None:
+            return Response(data)
+        response = super().get_fresh_response(request, *args, **kwargs)
+        if response.status_code == 200:
+            backend().set(key, response.data)
+        return response
+
+
+def _assignment_ids_for(model, objs):
+    if model is Assignment:
+        return {obj.pk for obj in objs}
+    if model is Subtask:
+        return {obj.assignment_id for obj in objs}
+    if model is Submission:
+        lookup = Subtask.objects.filter(pk__in={obj.subtask_id for obj in objs})
+    elif model is Review:
+        lookup = Subtask.objects.filter(submissions__in={obj.submission_id for obj in objs})
+    else:
+        lookup = Subtask.objects.filter(submissions__reviews__in={obj.review_id for obj in objs})
+    return set(lookup.values_list('assignment_id', flat=True))
+
+
+def _tree_changed(model, objs):
+    bump(ASSIGNMENTS, *(assignment(pk) for pk in _assignment_ids_for(model, objs)))
+
+
+@receiver(pre_save, sender=Subtask)
+def _subtask_pre_save(sender, instance, raw=False, **kwargs):
+    # A subtask moved to another assignment changes the old tree as well.
+    if not raw and not instance._state.adding:
+        previous = Subtask.objects.filter(pk=instance.pk).values_list('assignment_id', flat=True).first()
+        if previous is not None and previous != instance.assignment_id:
+            bump(assignment(previous))
+
+
+@receiver(post_save, sender=Assignment)
+@receiver(post_save, sender=Subtask)
+@receiver(post_save, sender=Submission)
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=ReviewComment)
+@receiver(post_delete, sender=Assignment)
+@receiver(post_delete, sender=Subtask)
+@receiver(post_delete, sender=Submission)
+@receiver(post_delete, sender=Review)
+@receiver(post_delete, sender=ReviewComment)
+def _tree_object_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _tree_changed(sender, [instance])
+
+
+@receiver(rows_bulk_saved, sender=Submission)
+@receiver(rows_bulk_saved, sender=Review)
+@receiver(rows_bulk_saved, sender=ReviewComment)
+def _tree_objects_bulk_saved(sender, instances, previous=(), **kwargs):
+    _tree_changed(sender, [*instances, *previous])
+
+
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def _team_changed(sender, raw=False, **kwargs):
+    if not raw:
+        bump(MEMBERSHIPS)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _user_changed(sender, raw=False, **kwargs):
+    if not raw:
+        bump(USERS)
+
+
+@receiver(m2m_changed, sender=Assignment.individual_reviewees.through)
+@receiver(m2m_changed, sender=Assignment.team_reviewees.through)
+@receiver(m2m_changed, sender=User.teams.through)
+def _membership_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump(MEMBERSHIPS)
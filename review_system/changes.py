@@ -0,0 +1,184 @@
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Assignment, AssignmentReviewee, Change, Review, ReviewComment, Submission, Subtask
+from .serializers import (
+    AssignmentSerializer, ReviewCommentSerializer, ReviewSerializer, SubmissionSerializer, SubtaskSerializer,
+    ValuesSerializer,
+)
+from .signals import rows_bulk_saved
+
+# Change log for delta sync. Every save, bulk write and delete of a synced
+# model appends a Change row; deletes append tombstones. post_delete is sent
+# for each object Django's collector removes, so the CASCADE chain below a
+# deleted Assignment leaves a tombstone per subtask, submission, review and
+# comment. Superseded rows can be dropped with prune().
+#
+# seq is allocated at insert time. SQLite serializes writers, so seq order is
+# commit order there; on a database with concurrent writers a client could
+# read seq N+1 before N commits and skip N.
+#
+# Readers other than staff, reviewers and admins only get what downloads lets
+# them open: their own submissions and reviews of them, reviews they wrote,
+# assignments (and subtasks) they were given, and anything under an
+# assignment they created. Live rows are checked when they are loaded; a
+# tombstone carries the deleted row's assignment, reviewee and reviewer,
+# looked up from its parents, which a cascade deletes after it. An assignment
+# or subtask gets one more tombstone per reviewee of the assignment, as their
+# AssignmentReviewee rows go in the same cascade.
+
+SYNCED = {
+    'assignment': (Assignment, AssignmentSerializer),
+    'subtask': (Subtask, SubtaskSerializer),
+    'submission': (Submission, SubmissionSerializer),
+    'review': (Review, ReviewSerializer),
+    'comment': (ReviewComment, ReviewCommentSerializer),
+}
+OBJECT_TYPES = {model: object_type for object_type, (model, _) in SYNCED.items()}
+
+
+# object type: (path to the assignment, to the reviewee, to the reviewer)
+SCOPES = {
+    'assignment': ('', None, None),
+    'subtask': ('assignment__', None, None),
+    'submission': ('subtask__assignment__', 'reviewee', None),
+    'review': ('submission__subtask__assignment__', 'submission__reviewee', 'reviewer'),
+    'comment': ('review__submission__subtask__assignment__', 'review__submission__reviewee', 'review__reviewer'),
+}
+
+
+def record(model, ids, deleted=False):
+    object_type = OBJECT_TYPES[model]
+    Change.objects.bulk_create([Change(object_type=object_type, object_id=pk, deleted=deleted) for pk in ids],
+                               batch_size=1000)
+
+
+def _scope(model, instance):
+    # The deleted row's scope, read through its parent (still there) inside
+    # the tombstone's INSERT.
+    if model is Assignment:
+        return {'assignment_id': instance.pk}
+    if model is Subtask:
+        return {'assignment_id': instance.assignment_id}
+    if model is Submission:
+        parent = Subtask.objects.filter(pk=instance.subtask_id)
+        return {'assignment_id': Subquery(parent.values('assignment_id')), 'reviewee_id': instance.reviewee_id}
+    if model is Review:
+        parent = Submission.objects.filter(pk=instance.submission_id)
+        return {'assignment_id': Subquery(parent.values('subtask__assignment_id')),
+                'reviewee_id': Subquery(parent.values('reviewee_id')), 'reviewer_id': instance.reviewer_id}
+    parent = Review.objects.filter(pk=instance.review_id)
+    return {'assignment_id': Subquery(parent.values('submission__subtask__assignment_id')),
+            'reviewee_id': Subquery(parent.values('submission__reviewee_id')),
+            'reviewer_id': Subquery(parent.values('reviewer_id'))}
+
+
+def readable(object_type, user):
+    # Q over the object type's model for the rows ``user`` may read.
+    assignment, reviewee, reviewer = SCOPES[object_type]
+    condition = Q(**{f'{assignment}created_by': user})
+    if reviewee is None:
+        condition |= Exists(AssignmentReviewee.objects.filter(assignment_id=OuterRef(f'{assignment}pk'), user=user))
+    else:
+        condition |= Q(**{reviewee: user})
+    if reviewer is not None:
+        condition |= Q(**{reviewer: user})
+    return condition
+
+
+def _readable_changes(user):
+    return (Q(deleted=False) | Q(assignment_id__in=Assignment.objects.filter(created_by=user).values('pk'))
+            | Q(reviewee_id=user.pk) | Q(reviewer_id=user.pk))
+
+
+def since(seq, limit, user=None):
+    # (entries, last seq, has_more). An object changed several times within
+    # the page appears once, at its latest seq; rows deleted after the page's
+    # change are left out, since their tombstone follows in a later page.
+    # With ``user`` only what they may read is returned; live rows are checked
+    # after the page is cut, so it can come back short.
+    changes = Change.objects.filter(seq__gt=seq)
+    if user is not None:
+        changes = changes.filter(_readable_changes(user))
+    rows = list(changes.order_by('seq').values_list('seq', 'object_type', 'object_id', 'deleted')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest = {}
+    for row_seq, object_type, object_id, deleted in rows:
+        latest.pop((object_type, object_id), None)
+        latest[(object_type, object_id)] = (row_seq, deleted)
+
+    wanted = {}
+    for (object_type, object_id), (_, deleted) in latest.items():
+        if not deleted:
+            wanted.setdefault(object_type, []).append(object_id)
+    data = {}
+    for object_type, ids in wanted.items():
+        model, serializer_class = SYNCED[object_type]
+        fast = ValuesSerializer.for_serializer(serializer_class)
+        pk_name = model._meta.pk.name
+        queryset = model.objects.filter(pk__in=ids)
+        if user is not None:
+            queryset = queryset.filter(readable(object_type, user))
+        for item in fast.to_representation(queryset.values(*fast.columns)):
+            data[(object_type, item[pk_name])] = item
+
+    entries = []
+    for key, (row_seq, deleted) in latest.items():
+        if not deleted and key not in data:
+            continue
+        entries.append({'seq': row_seq, 'type': key[0], 'id': key[1], 'deleted': deleted,
+                        'data': None if deleted else data[key]})
+    return entries, rows[-1][0] if rows else seq, has_more
+
+
+def prune():
+    # Drop rows superseded by a later change to the same object. The newest
+    # row per object is kept, so no client cursor can miss a change; the
+    # tombstones of one delete, each for different readers, all stay.
+    newer = Change.objects.filter(object_type=OuterRef('object_type'), object_id=OuterRef('object_id'),
+                                  seq__gt=OuterRef('seq'))
+    superseded = Q(Exists(newer), deleted=False) | Q(Exists(newer.filter(deleted=False)), deleted=True)
+    deleted, _ = Change.objects.filter(superseded).delete()
+    return deleted
+
+
+@receiver(post_save, sender=Assignment)
+@receiver(post_save, sender=Subtask)
+@receiver(post_save, sender=Submission)
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=ReviewComment)
+def _saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record(sender, [instance.pk])
+
+
+@receiver(pre_delete, sender=Assignment)
+@receiver(pre_delete, sender=Subtask)
+def _deleting(sender, instance, **kwargs):
+    # pre_delete runs for the whole cascade before anything is deleted.
+    assignment_id = instance.pk if sender is Assignment else instance.assignment_id
+    instance._sync_reviewee_ids = set(AssignmentReviewee.objects.filter(assignment_id=assignment_id)
+                                      .values_list('user_id', flat=True))
+
+
+@receiver(post_delete, sender=Assignment)
+@receiver(post_delete, sender=Subtask)
+@receiver(post_delete, sender=Submission)
+@receiver(post_delete, sender=Review)
+@receiver(post_delete, sender=ReviewComment)
+def _deleted(sender, instance, **kwargs):
+    object_type, scope = OBJECT_TYPES[sender], _scope(sender, instance)
+    tombstones = [Change(object_type=object_type, object_id=instance.pk, deleted=True, **scope)]
+    tombstones += [Change(object_type=object_type, object_id=instance.pk, deleted=True, reviewee_id=user_id, **scope)
+                   for user_id in sorted(getattr(instance, '_sync_reviewee_ids', ()))]
+    Change.objects.bulk_create(tombstones)
+
+
+@receiver(rows_bulk_saved, sender=Submission)
+@receiver(rows_bulk_saved, sender=Review)
+@receiver(rows_bulk_saved, sender=ReviewComment)
+def _bulk_saved(sender, instances, **kwargs):
+    record(sender, [instance.pk for instance in instances])
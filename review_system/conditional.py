@@ -0,0 +1,73 @@
+import hashlib
+
+from django.db.models import DateTimeField, F, Func, IntegerField, Subquery
+from django.utils.cache import get_conditional_response
+
+# Conditional GET for the read APIs. A response's validators come from the
+# querysets it is built from: MAX(updated_at) and COUNT(*) of each (the count
+# catches deletions), fetched in a single aggregate query without loading or
+# serializing any rows. An If-None-Match that still matches is answered with
+# 304 Not Modified before the body is built. No Last-Modified is sent: a
+# deletion leaves MAX(updated_at) where it was, so If-Modified-Since would
+# keep answering 304 for a response that lost rows.
+
+
+def _latest():
+    return Func(F('updated_at'), function='MAX', output_field=DateTimeField())
+
+
+def _count():
+    return Func(F('pk'), function='COUNT', output_field=IntegerField())
+
+
+def state(querysets):
+    # [(latest updated_at or None, row count), ...] for each queryset, in one
+    # query: the first queryset is aggregated directly and the others ride
+    # along as scalar subqueries.
+    first, *others = [queryset.order_by() for queryset in querysets]
+    columns = {'latest_0': _latest(), 'count_0': _count()}
+    for i, queryset in enumerate(others, start=1):
+        columns[f'latest_{i}'] = Subquery(queryset.values(value=_latest()), output_field=DateTimeField())
+        columns[f'count_{i}'] = Subquery(queryset.values(value=_count()), output_field=IntegerField())
+    row = next(iter(first.values(**columns)))
+    return [(row[f'latest_{i}'], row[f'count_{i}'] or 0) for i in range(len(querysets))]
+
+
+def validators(request, querysets, per_user=False, extra=()):
+    # The response's ETag. Besides the querysets' state it covers the URL
+    # (filters, cursor), the negotiated media type, for per-user responses
+    # the user, and any ``extra`` values for data without an updated_at.
+    states = state(querysets)
+    parts = [request.get_full_path(), getattr(request, 'accepted_media_type', ''),
+             str(request.user.pk) if per_user else '', *(str(value) for value in extra)]
+    parts.extend(f'{latest.isoformat() if latest else ""}:{count}' for latest, count in states)
+    return 'W/"{}"'.format(hashlib.sha1('|'.join(parts).encode()).hexdigest())
+
+
+class ConditionalGetMixin:
+    # For DRF GET views. Subclasses list the querysets the response is built
+    # from in get_validator_querysets(); set per_user when the response
+    # depends on request.user.
+    per_user = False
+
+    def get_validator_querysets(self):
+        raise NotImplementedError
+
+    def get_validator_extra(self):
+        return ()
+
+    def get_validators(self):
+        return validators(self.request, self.get_validator_querysets(), self.per_user, self.get_validator_extra())
+
+    def get_fresh_response(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_validators()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = self.get_fresh_response(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        return response
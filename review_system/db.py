@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# SQLite production profile. Every new SQLite connection gets the PRAGMAS of
+# its DATABASES entry, or SQLITE_PRAGMAS: WAL, so readers never block the
+# writer and vice versa, and busy_timeout, so a writer waits for the lock
+# instead of failing with "database is locked". Entries marked READ_ONLY also
+# get query_only, so a routing mistake fails loudly instead of writing through
+# the read connection.
+#
+# ReadWriteRouter sends reads to READ_DATABASE_ALIAS and everything else to
+# default. default runs with transaction_mode IMMEDIATE, so a write
+# transaction takes SQLite's single write lock at BEGIN and concurrent writers
+# wait their turn on busy_timeout. A deferred transaction would only take it
+# at its first write, and fail outright if another writer got there first.
+# Reads made inside a transaction on default stay on default, so they see
+# that transaction's own uncommitted writes.
+
+WRITE_ALIAS = 'default'
+
+
+@receiver(connection_created)
+def _configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        pragmas = connection.settings_dict.get('PRAGMAS', getattr(settings, 'SQLITE_PRAGMAS', {}))
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        if connection.settings_dict.get('READ_ONLY'):
+            cursor.execute('PRAGMA query_only = ON')
+
+
+def read_alias():
+    alias = getattr(settings, 'READ_DATABASE_ALIAS', None)
+    return alias if alias in connections.settings else WRITE_ALIAS
+
+
+class ReadWriteRouter:
+    def db_for_read(self, model, **hints):
+        if connections[WRITE_ALIAS].in_atomic_block:
+            return WRITE_ALIAS
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        return WRITE_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # both aliases are the same database
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == WRITE_ALIAS or db != read_alias()
@@ -0,0 +1,121 @@
+import os
+import re
+from urllib.parse import quote
+
+from django.db.models import BooleanField, Exists, ExpressionWrapper, OuterRef, Q, Value
+from django.db.models.functions import Coalesce
+
+from .models import Assignment, AssignmentReviewee, Attachment, User
+from .storage import blob_sha256
+
+# Attachment downloads. Access is decided by the same query that loads the
+# attachment: staff, reviewers and admins may read every attachment; anyone
+# else only what is attached to
+#   - their own submissions, and reviews of them,
+#   - reviews they wrote,
+#   - subtasks of assignments they were given,
+#   - anything under an assignment they created.
+#
+# Bytes are served with FileResponse, which WSGI servers with a
+# wsgi.file_wrapper (gunicorn, uWSGI) send with os.sendfile(); a byte range is
+# a FileRange over the open file, positioned at the range's start, so the
+# sendfile path still applies. With ATTACHMENT_SENDFILE_HEADER set the front
+# server reads the file instead and Django only sends headers.
+
+PRIVILEGED_ROLES = ('reviewer', 'admin')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def attachment_for(user, pk, privileged=None):
+    # (file name, filename, updated_at, allowed) for attachment ``pk``, or None
+    # if it does not exist, in one query. ``privileged`` is the caller's
+    # already known answer to "is a reviewer or admin"; left as None it is
+    # worked out in the same query.
+    queryset = Attachment.objects.filter(pk=pk)
+    if user.is_staff or privileged:
+        allowed = Value(True)
+    else:
+        assignment_id = Coalesce('subtask__assignment_id', 'submission__subtask__assignment_id',
+                                 'review__submission__subtask__assignment_id')
+        queryset = queryset.annotate(assignment_id=assignment_id)
+        condition = (
+            Q(submission__reviewee=user) | Q(review__submission__reviewee=user) | Q(review__reviewer=user)
+            | Exists(Assignment.objects.filter(pk=OuterRef('assignment_id'), created_by=user))
+            | Q(subtask__isnull=False) & Exists(AssignmentReviewee.objects.filter(
+                assignment_id=OuterRef('subtask__assignment_id'), user=user))
+        )
+        if privileged is None:
+            condition |= Exists(User.roles.through.objects.filter(user=user, role__role_name__in=PRIVILEGED_ROLES))
+        allowed = ExpressionWrapper(condition, output_field=BooleanField())
+    return queryset.annotate(allowed=allowed).values_list('file', 'filename', 'updated_at', 'allowed').first()
+
+
+def etag(name, size, mtime):
+    # Strong validator: a blob's name is its SHA-256, so it changes exactly
+    # when the bytes do. Files stored before content addressing fall back to
+    # size and mtime.
+    sha256 = blob_sha256(name)
+    return f'"{sha256}"' if sha256 else f'"{size:x}-{int(mtime * 1e6):x}"'
+
+
+def byte_range(header, size):
+    # (start, end) inclusive for a single-range "Range: bytes=..." header,
+    # None when the whole file should be sent (no header, a syntax the server
+    # may ignore, or several ranges), or False when it cannot be satisfied.
+    match = RANGE.match(header.replace(' ', '')) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        length = int(last)
+        if length == 0 or size == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return False
+    return start, end
+
+
+class FileRange:
+    # File-like view of bytes [start, start + length) of an open file. It has
+    # no tell()/seek(), so FileResponse leaves Content-Length to the caller,
+    # and fileno() lets a WSGI file_wrapper sendfile() from the current
+    # offset.
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def open_range(path, start, end):
+    return FileRange(open(path, 'rb'), start, end - start + 1)
+
+
+def sendfile_target(path, media_root, header, prefix):
+    # Header value handing ``path`` to the front server: the absolute path
+    # for X-Sendfile, or for X-Accel-Redirect the path below ``prefix`` (an
+    # nginx "internal" location aliased to MEDIA_ROOT).
+    if header.lower() == 'x-accel-redirect':
+        relative = os.path.relpath(path, media_root).replace(os.sep, '/')
+        return quote(prefix.rstrip('/') + '/' + relative)
+    return path
@@ -0,0 +1,99 @@
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from .models import Review, ReviewComment, Submission
+
+# Streaming export of an assignment's submissions, reviews and comments as
+# flat records. Submissions are read in submission_id order with
+# QuerySet.iterator() and handled chunk_size at a time: each chunk costs one
+# query for its reviews and one for their comments, and only the chunk is held
+# in memory. ``after`` resumes an interrupted export after that submission_id.
+#
+# Under ASGI Django reads a sync iterator to the end before sending any of it,
+# so the view hands over in_batches() instead: an async iterator pulling
+# ``batch`` lines at a time on the request's thread-sensitive executor, where
+# the open cursor's connection lives.
+
+SUBMISSION_COLUMNS = ['submission_id', 'subtask_id', 'reviewee_id', 'submitted_at', 'files_link', 'submission_description']
+REVIEW_COLUMNS = ['review_id', 'reviewer_id', 'status', 'reviewed_at', 'review_content', 'additional_comments']
+COMMENT_COLUMNS = ['comment_id', 'commenter_id', 'commented_at', 'comment']
+COLUMNS = ['record_type', *SUBMISSION_COLUMNS, *REVIEW_COLUMNS, *COMMENT_COLUMNS]
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def records(assignment_id, after=None, chunk_size=2000):
+    submissions = Submission.objects.filter(subtask__assignment_id=assignment_id).order_by('submission_id')
+    if after is not None:
+        submissions = submissions.filter(submission_id__gt=after)
+    chunk = []
+    for row in submissions.values_list(*SUBMISSION_COLUMNS).iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from _chunk_records(chunk, chunk_size)
+            chunk = []
+    if chunk:
+        yield from _chunk_records(chunk, chunk_size)
+
+
+def _chunk_records(submissions, chunk_size):
+    submission_ids = [row[0] for row in submissions]
+    reviews = {}
+    for row in (Review.objects.filter(submission_id__in=submission_ids).order_by('reviewed_at', 'review_id')
+                .values_list('submission_id', *REVIEW_COLUMNS).iterator(chunk_size=chunk_size)):
+        reviews.setdefault(row[0], []).append(row[1:])
+    review_ids = [review[0] for rows in reviews.values() for review in rows]
+    comments = {}
+    for row in (ReviewComment.objects.filter(review_id__in=review_ids).order_by('commented_at', 'comment_id')
+                .values_list('review_id', *COMMENT_COLUMNS).iterator(chunk_size=chunk_size)):
+        comments.setdefault(row[0], []).append(row[1:])
+
+    for submission in submissions:
+        submission_record = dict.fromkeys(COLUMNS)
+        submission_record.update(zip(SUBMISSION_COLUMNS, submission), record_type='submission')
+        yield submission_record
+        for review in reviews.get(submission[0], ()):
+            review_record = dict(submission_record, record_type='review', **dict(zip(REVIEW_COLUMNS, review)))
+            yield review_record
+            for comment in comments.get(review[0], ()):
+                yield dict(review_record, record_type='comment', **dict(zip(COMMENT_COLUMNS, comment)))
+
+
+def _encode(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+class _Echo:
+    # File-like object whose write() hands the line back to the caller, so
+    # csv.writer can format rows without buffering them.
+    def write(self, value):
+        return value
+
+
+def as_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow([_encode(row[column]) for column in COLUMNS])
+
+
+def as_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row, default=_encode, separators=(',', ':')) + '\n'
+
+
+def render(rows, output):
+    return as_csv(rows) if output == 'csv' else as_jsonl(rows)
+
+
+async def in_batches(lines, batch=500):
+    lines = iter(lines)
+    take = sync_to_async(lambda: ''.join(islice(lines, batch)))
+    while chunk := await take():
+        yield chunk
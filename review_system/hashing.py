@@ -0,0 +1,60 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+
+# Bounded worker pool for password hashing, used by the async SignUpView and
+# LoginView so PBKDF2 never runs on the event loop. hashlib releases the GIL
+# while it hashes, so threads hash in parallel. At most
+# PASSWORD_HASHING_WORKERS hashes run at once and PASSWORD_HASHING_QUEUE more
+# may wait; beyond that callers get PoolSaturated straight away (the views
+# answer 503 with Retry-After) instead of piling up behind a login storm.
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class HashingPool:
+    def __init__(self, workers, queue):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+        self.slots = threading.BoundedSemaphore(workers + queue)
+
+    async def run(self, func, *args):
+        if not self.slots.acquire(blocking=False):
+            raise PoolSaturated
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.slots.release()
+
+    async def make_password(self, password):
+        return await self.run(make_password, password)
+
+    async def check_password(self, password, encoded):
+        # (matches, upgraded hash or None). Hashes made by another hasher or
+        # with outdated parameters are re-made, as Django does on login.
+        if not await self.run(check_password, password, encoded):
+            return False, None
+        preferred = get_hasher('default')
+        if identify_hasher(encoded).algorithm != preferred.algorithm or preferred.must_update(encoded):
+            return True, await self.run(make_password, password)
+        return True, None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = getattr(settings, 'PASSWORD_HASHING_WORKERS', None) or os.cpu_count() or 1
+                _pool = HashingPool(workers, getattr(settings, 'PASSWORD_HASHING_QUEUE', workers * 4))
+    return _pool
@@ -0,0 +1,113 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+# Idempotency-Key support for the create endpoints. A client that may retry
+# a POST sends the same Idempotency-Key header (e.g. a UUID) with every
+# attempt. The first attempt runs normally and, if it succeeds, its response
+# is stored in the same transaction as the rows it created; retries within
+# IDEMPOTENCY_KEY_TTL get that stored response back from a single primary
+# key lookup, without running the view or touching the main tables.
+#
+# Keys are per user (anonymous requests are not deduplicated) and stored only
+# as SHA-256 digests. Reusing a key for a different request body is a 422.
+# Failed attempts store nothing, so a retry runs again. Two attempts racing
+# each other serialize on the key's primary key: the second waits for the
+# first to commit and then replays it. Expired keys are removed by the
+# purge_idempotency_keys command.
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def _ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', timedelta(hours=24))
+
+
+def key_hash(user, key):
+    return hashlib.sha256(f'{user.pk}:{key}'.encode()).hexdigest()
+
+
+def _canonical(value):
+    if isinstance(value, MultiValueDict):
+        return {name: [_canonical(item) for item in value.getlist(name)] for name in value}
+    if isinstance(value, dict):
+        return {str(name): _canonical(item) for name, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, UploadedFile):
+        digest = hashlib.sha256()
+        for chunk in value.chunks():
+            digest.update(chunk)
+        value.seek(0)
+        return {'name': value.name, 'sha256': digest.hexdigest()}
+    return value
+
+
+def request_hash(request):
+    body = json.dumps([request.method, request.path, _canonical(request.data)], sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _replay(stored, fingerprint):
+    if stored.request_hash != fingerprint:
+        return Response({'detail': f'This {HEADER} was already used for a different request.'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(stored.response, status=stored.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def respond(request, handler):
+    # Run ``handler`` (returning a DRF Response) at most once per
+    # Idempotency-Key, replaying its stored response afterwards.
+    key = request.headers.get(HEADER)
+    if key is None or not request.user.is_authenticated:
+        return handler()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return Response({'detail': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    digest = key_hash(request.user, key)
+    fingerprint = request_hash(request)
+    now = timezone.now()
+    stored = IdempotencyKey.objects.filter(pk=digest).first()
+    if stored is not None and stored.expires_at > now:
+        return _replay(stored, fingerprint)
+
+    with transaction.atomic():
+        if stored is not None:
+            IdempotencyKey.objects.filter(pk=digest, expires_at__lte=now).delete()
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(key_hash=digest, request_hash=fingerprint, status_code=0,
+                                              expires_at=now + _ttl())
+        except IntegrityError:
+            # A concurrent attempt with the same key committed first.
+            return _replay(IdempotencyKey.objects.get(pk=digest), fingerprint)
+        response = handler()
+        if status.is_success(response.status_code):
+            IdempotencyKey.objects.filter(pk=digest).update(status_code=response.status_code, response=response.data)
+        else:
+            transaction.set_rollback(True)
+    return response
+
+
+def purge():
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+class IdempotentCreateMixin:
+    # For DRF views: honour Idempotency-Key on POST.
+
+    def post(self, request, *args, **kwargs):
+        handler = super().post
+        return respond(request, lambda: handler(request, *args, **kwargs))
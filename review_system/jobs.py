@@ -0,0 +1,175 @@
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+# Database-backed job queue. enqueue() inserts Job rows in the caller's
+# transaction, so a job commits or rolls back with the write that asked for it
+# and the request only pays for one INSERT. Workers (the run_jobs command)
+# claim ready jobs in batches:
+#   - with SELECT ... FOR UPDATE SKIP LOCKED where the database has it, so
+#     workers never wait on each other's rows;
+#   - elsewhere (SQLite) with a conditional UPDATE stamping a claim token on
+#     jobs that are still claimable, then reading back what it got. SQLite
+#     serializes writers, so each job goes to exactly one claim.
+# A claim is a lease of JOB_LEASE seconds; a worker that dies mid-job leaves
+# it to be claimed again when the lease runs out, so handlers must tolerate
+# running more than once. Failures are retried with exponential backoff and
+# jitter until the job's max_attempts, then left as ``failed``.
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def job(name, max_attempts=5):
+    # Register the decorated function as the handler for jobs called
+    # ``name``. It is called with the job's payload as keyword arguments.
+    def register(func):
+        HANDLERS[name] = (func, max_attempts)
+        return func
+    return register
+
+
+def enqueue(name, delay=0, **payload):
+    return enqueue_many(name, [payload], delay=delay)[0]
+
+
+def enqueue_many(name, payloads, delay=0):
+    _, max_attempts = HANDLERS[name]
+    run_after = timezone.now() + timedelta(seconds=delay)
+    return Job.objects.bulk_create([Job(name=name, payload=payload, max_attempts=max_attempts, run_after=run_after)
+                                    for payload in payloads])
+
+
+def _lease():
+    return timedelta(seconds=getattr(settings, 'JOB_LEASE', 300))
+
+
+def backoff(attempts):
+    # Seconds to wait before retrying a job that has failed ``attempts`` times.
+    base = getattr(settings, 'JOB_RETRY_BACKOFF', 5)
+    cap = getattr(settings, 'JOB_RETRY_BACKOFF_MAX', 3600)
+    delay = min(base * 2 ** (attempts - 1), cap)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _claimable(now):
+    return Job.objects.filter(Q(status='queued', run_after__lte=now) | Q(status='running', locked_until__lt=now))
+
+
+def claim(worker, limit):
+    # Up to ``limit`` ready jobs, now leased to ``worker``.
+    now = timezone.now()
+    token = f'{worker}:{uuid.uuid4().hex[:12]}'
+    changes = {'status': 'running', 'locked_by': token, 'locked_until': now + _lease(), 'attempts': F('attempts') + 1}
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            ids = list(_claimable(now).select_for_update(skip_locked=True)
+                       .order_by('run_after', 'id').values_list('id', flat=True)[:limit])
+            Job.objects.filter(id__in=ids).update(**changes)
+        else:
+            ids = list(_claimable(now).order_by('run_after', 'id').values_list('id', flat=True)[:limit])
+            _claimable(now).filter(id__in=ids).update(**changes)
+        return list(Job.objects.filter(id__in=ids, locked_by=token).order_by('run_after', 'id'))
+
+
+def run(job):
+    # Run a claimed job. Success deletes it; failure schedules a retry or, on
+    # the last attempt, marks it failed. The ``locked_by`` check keeps a worker
+    # whose lease ran out from overwriting the job's new owner.
+    try:
+        handler, _ = HANDLERS[job.name]
+        handler(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Job %s (%s) failed on attempt %s/%s', job.id, job.name, job.attempts, job.max_attempts,
+                       exc_info=True)
+        mine = Job.objects.filter(id=job.id, locked_by=job.locked_by)
+        if job.attempts >= job.max_attempts:
+            mine.update(status='failed', locked_by='', locked_until=None, last_error=error)
+        else:
+            mine.update(status='queued', locked_by='', locked_until=None, last_error=error,
+                        run_after=timezone.now() + timedelta(seconds=backoff(job.attempts)))
+        return False
+    Job.objects.filter(id=job.id, locked_by=job.locked_by).delete()
+    return True
+
+
+def run_pending(limit=100, worker='inline'):
+    # Claim and run up to ``limit`` ready jobs on this thread. Returns the
+    # number run.
+    jobs = claim(worker, limit)
+    for claimed in jobs:
+        run(claimed)
+    return len(jobs)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class Worker:
+    # Claims jobs for a pool of ``threads`` threads, never holding more than
+    # it has idle threads for, and polls every ``poll`` seconds while the
+    # queue is empty or cannot be read (e.g. "database is locked"). stop()
+    # lets running jobs finish.
+
+    def __init__(self, threads=4, poll=1.0, name=None):
+        self.threads = threads
+        self.poll = poll
+        self.name = name or worker_name()
+        self.idle = threading.Semaphore(threads)
+        self.stopping = threading.Event()
+
+    def stop(self):
+        self.stopping.set()
+
+    def serve(self, once=False):
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='job') as pool:
+            while not self.stopping.is_set():
+                free = 0
+                while self.idle.acquire(blocking=False):
+                    free += 1
+                if not free:
+                    self.idle.acquire()
+                    free = 1
+                close_old_connections()
+                try:
+                    jobs = claim(self.name, free)
+                except DatabaseError:
+                    logger.warning('Worker %s could not claim jobs', self.name, exc_info=True)
+                    for _ in range(free):
+                        self.idle.release()
+                    self.stopping.wait(self.poll)
+                    continue
+                for claimed in jobs:
+                    pool.submit(self._run, claimed)
+                for _ in range(free - len(jobs)):
+                    self.idle.release()
+                if once and not jobs:
+                    break
+                if not jobs:
+                    self.stopping.wait(self.poll)
+
+    def _run(self, claimed):
+        try:
+            close_old_connections()
+            run(claimed)
+        except Exception:
+            logger.exception('Job %s could not be finished', claimed.id)
+        finally:
+            connection.close()
+            self.idle.release()
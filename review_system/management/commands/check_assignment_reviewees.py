@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from review_system import reviewees
+
+
+class Command(BaseCommand):
+    help = 'Check the materialized assignment reviewee table against assignment and team membership, or repair it with --fix.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Insert missing rows and delete stale ones.')
+
+    def handle(self, *args, **options):
+        if options['fix']:
+            added, removed = reviewees.sync()
+            self.stdout.write(self.style.SUCCESS(f'Added {len(added)} row(s), removed {len(removed)} row(s).'))
+            return
+
+        missing, stale = reviewees.diff()
+        for assignment_id, user_id, team_id in sorted(missing, key=str):
+            self.stderr.write(f'missing: assignment {assignment_id}, user {user_id}, team {team_id}')
+        if stale:
+            self.stderr.write(f'stale row ids: {sorted(stale)}')
+        if missing or stale:
+            raise CommandError(f'{len(missing)} missing and {len(stale)} stale row(s); run with --fix to repair.')
+        self.stdout.write(self.style.SUCCESS('Assignment reviewees are consistent.'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from review_system import export
+from review_system.models import Assignment
+
+
+class Command(BaseCommand):
+    help = "Stream an assignment's submissions, reviews and comments as CSV or JSON lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('assignment_id', type=int)
+        parser.add_argument('--output', choices=list(export.FORMATS), default='csv')
+        parser.add_argument('--after', type=int, help='Resume after this submission_id.')
+        parser.add_argument('--file', help='Write to this path instead of stdout.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if not Assignment.objects.filter(pk=options['assignment_id']).exists():
+            raise CommandError(f"Assignment {options['assignment_id']} does not exist.")
+        rows = export.records(options['assignment_id'], after=options['after'], chunk_size=options['chunk_size'])
+        if options['file']:
+            with open(options['file'], 'w', newline='', encoding='utf-8') as out:
+                out.writelines(export.render(rows, options['output']))
+        else:
+            for line in export.render(rows, options['output']):
+                self.stdout.write(line, ending='')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from review_system import blobs
+
+
+class Command(BaseCommand):
+    help = 'Delete attachment blobs no attachment refers to any more, and abandoned partial uploads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=3600,
+                            help='Only remove files untouched for this many seconds (default 3600).')
+
+    def handle(self, *args, **options):
+        removed = blobs.collect(grace=options['grace'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} file(s).'))
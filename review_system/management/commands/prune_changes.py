@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from review_system import changes
+
+
+class Command(BaseCommand):
+    help = 'Drop sync change log rows superseded by a later change to the same object.'
+
+    def handle(self, *args, **options):
+        deleted = changes.prune()
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} superseded change(s).'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from review_system import idempotency
+
+
+class Command(BaseCommand):
+    help = 'Delete stored Idempotency-Key responses past their expiry.'
+
+    def handle(self, *args, **options):
+        deleted = idempotency.purge()
+        self.stdout.write(self.style.SUCCESS(f'Purged {deleted} expired idempotency key(s).'))
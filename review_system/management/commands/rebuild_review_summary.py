@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from review_system import rollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-subtask review summary table from Submission and Review, or verify it with --verify.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Compare the table against a full recompute without changing it.')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            mismatches = rollup.verify()
+            for subtask_id, (stored, expected) in sorted(mismatches.items()):
+                self.stderr.write(f'subtask {subtask_id}: stored {stored}, expected {expected}')
+            if mismatches:
+                raise CommandError(f'{len(mismatches)} summary row(s) out of date; run without --verify to rebuild.')
+            self.stdout.write(self.style.SUCCESS('Review summary matches a full recompute.'))
+            return
+
+        computed = rollup.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt review summary for {len(computed)} subtask(s).'))
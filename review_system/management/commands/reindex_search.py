@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from review_system import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index from assignments, subtasks, submissions and reviews.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if not search.available():
+            self.stdout.write('Full-text index not available on this database; search uses the fallback scan.')
+            return
+        total = search.reindex(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} object(s).'))
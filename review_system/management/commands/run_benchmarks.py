@@ -0,0 +1,53 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+
+from review_system import benchmarks, seed
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway test database, run the review system benchmarks and compare them with a JSON '
+            'baseline. Fails when a case is slower than the threshold allows or runs more queries.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(seed.SCALES), default='small')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--only', nargs='*', choices=list(benchmarks.BENCHMARKS), help='Run only these cases.')
+        # Timings only compare on the machine that recorded them, so the
+        # default baseline lives in a git-ignored directory.
+        parser.add_argument('--baseline', default=str(Path(settings.BASE_DIR) / '.benchmarks' / 'baseline.json'),
+                            help='Baseline JSON file (default .benchmarks/baseline.json, not tracked by git).')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Allowed slowdown as a fraction of the baseline time (default 0.25).')
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Write these results as the new baseline instead of comparing.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            _, counts = seed.seed(**seed.SCALES[options['scale']])
+            self.stdout.write('Seeded ' + ', '.join(f'{count} {name}' for name, count in counts.items()))
+            results = benchmarks.run(names=options['only'], repeat=options['repeat'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        for name, result in results.items():
+            self.stdout.write(f"{name:40} {result['seconds'] * 1000:10.2f} ms {result['queries']:6d} queries")
+
+        path = Path(options['baseline'])
+        baseline = benchmarks.load_baseline(path)
+        if options['update_baseline'] or baseline is None:
+            benchmarks.save_baseline(path, {**(baseline or {}), **results})
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {path}.'))
+            return
+
+        regressions = benchmarks.compare(results, baseline, options['threshold'])
+        if regressions:
+            raise CommandError('Performance regressions:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
@@ -0,0 +1,26 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from review_system import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the job queue until stopped (SIGINT/SIGTERM let running jobs finish).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Jobs run concurrently (default 4).')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Seconds to wait between polls while the queue is empty (default 1).')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is ready.')
+
+    def handle(self, *args, **options):
+        worker = jobs.Worker(threads=options['threads'], poll=options['poll'])
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                signal.signal(signum, lambda *_: worker.stop())
+            except ValueError:
+                pass  # not the main thread (e.g. called from tests)
+        self.stdout.write(f'Worker {worker.name} running {options["threads"]} thread(s).')
+        worker.serve(once=options['once'])
+        self.stdout.write(self.style.SUCCESS('Worker stopped.'))
@@ -0,0 +1,27 @@
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from review_system import benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Compare the old SQLite setup with the production profile (WAL, pragmas, IMMEDIATE writes, '
+            'persistent connections, split reads) under concurrent reads and writes on scratch databases.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per thread.')
+        parser.add_argument('--write-ratio', type=float, default=0.2)
+        parser.add_argument('--profile', nargs='*', choices=list(benchmarks.SQLITE_PROFILES),
+                            default=list(benchmarks.SQLITE_PROFILES))
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            for profile in options['profile']:
+                result = benchmarks.sqlite_concurrency(profile, directory, threads=options['threads'],
+                                                       requests=options['requests'],
+                                                       write_ratio=options['write_ratio'])
+                self.stdout.write(f"{profile:12} {result['requests_per_second']:10.1f} req/s "
+                                  f"p50 {result['p50_ms']:8.3f} ms  p95 {result['p95_ms']:8.3f} ms  "
+                                  f"{result['errors']} error(s)")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from review_system import seed
+
+
+class Command(BaseCommand):
+    help = 'Bulk-generate synthetic users, teams, assignments, submissions, reviews and comments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(seed.SCALES), default='small')
+        parser.add_argument('--users', type=int)
+        parser.add_argument('--teams', type=int)
+        parser.add_argument('--assignments', type=int)
+        parser.add_argument('--subtasks', type=int, help='Subtasks per assignment.')
+        parser.add_argument('--reviewees-per-assignment', type=int)
+        parser.add_argument('--iterations', type=int, help='Submissions per (subtask, reviewee).')
+        parser.add_argument('--comments-per-review', type=int)
+        parser.add_argument('--random-seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        params = dict(seed.SCALES[options['scale']])
+        for name in ('users', 'teams', 'assignments', 'subtasks', 'reviewees_per_assignment', 'iterations',
+                     'comments_per_review'):
+            if options[name] is not None:
+                params[name] = options[name]
+        prefix, counts = seed.seed(random_seed=options['random_seed'], **params)
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Seeded {prefix}: {summary}.'))
@@ -0,0 +1,97 @@
+import bisect
+import threading
+
+# Minimal in-process metrics for PerformanceMiddleware, rendered in the
+# Prometheus text exposition format by MetricsView. Each process keeps its own
+# numbers; Prometheus sums them across workers.
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        # Caller holds the registry lock.
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # name -> {labels: Histogram}
+        self.counters = {}  # name -> {labels: int}
+        self.help = {}
+
+    def describe(self, name, kind, text):
+        self.help[name] = (kind, text)
+
+    def observe(self, name, labels, value, buckets):
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, name, labels, amount=1):
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + amount
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.histograms.items()):
+                self._header(lines, name, 'histogram')
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+                    lines.append(f'{name}_sum{_labels(labels)} {histogram.total}')
+                    lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+            for name, series in sorted(self.counters.items()):
+                self._header(lines, name, 'counter')
+                for labels, value in sorted(series.items()):
+                    lines.append(f'{name}{_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, lines, name, kind):
+        kind, text = self.help.get(name, (kind, ''))
+        if text:
+            lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+registry = Registry()
+registry.describe('review_request_duration_seconds', 'histogram', 'Wall time per request.')
+registry.describe('review_request_sql_queries', 'histogram', 'SQL queries per request.')
+registry.describe('review_request_sql_duration_seconds', 'histogram', 'Time spent in SQL per request.')
+registry.describe('review_response_size_bytes', 'histogram', 'Response body size.')
+registry.describe('review_duplicate_queries_total', 'counter',
+                  'Requests that repeated one query shape past the N+1 threshold, by view and query fingerprint.')
+registry.describe('review_profiled_requests_total', 'counter', 'Requests run under cProfile.')
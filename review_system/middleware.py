@@ -0,0 +1,180 @@
+import cProfile
+import hashlib
+import io
+import logging
+import pstats
+import random
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from types import SimpleNamespace
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.dispatch import receiver
+
+from .metrics import DURATION_BUCKETS, QUERY_BUCKETS, SIZE_BUCKETS, registry
+
+logger = logging.getLogger('review_system.performance')
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+
+def fingerprint(sql):
+    # Query shape with literals and IN lists collapsed, so the same statement
+    # with different parameters counts as a repeat.
+    return _IN_LISTS.sub('(?)', _LITERALS.sub('?', sql))
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[fingerprint(sql)] += 1
+
+
+# The QueryRecorder of the request being measured. Context variables follow
+# the request into the sync_to_async threads that run sync views under ASGI,
+# whose connections are not the event loop thread's; every connection that
+# may serve a request carries _record_query, which reports to it.
+_recorder = ContextVar('review_query_recorder', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder():
+    # Hook this thread's connections; idempotent.
+    for alias in connections:
+        wrappers = connections[alias].execute_wrappers
+        if _record_query not in wrappers:
+            wrappers.append(_record_query)
+
+
+@receiver(request_started)
+def _request_started(sender, **kwargs):
+    # Sent from the thread that runs sync views (thread-sensitive under ASGI).
+    install_query_recorder()
+
+
+class PerformanceMiddleware:
+    # Records wall time, SQL query count and time, and response size per URL
+    # name into the in-process histograms served by MetricsView, and flags
+    # requests that run one query shape PERF_DUPLICATE_QUERY_THRESHOLD or more
+    # times (a likely N+1).
+    #
+    # A request is run under cProfile when it is sampled by
+    # PERF_PROFILE_SAMPLE_RATE, or sends "X-Profile: 1" while
+    # PERF_PROFILE_HEADER_ENABLED is on (defaults to DEBUG). Profiles are
+    # written to PERF_PROFILE_DIR if set, otherwise logged.
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.duplicate_threshold = getattr(settings, 'PERF_DUPLICATE_QUERY_THRESHOLD', 5)
+        self.sample_rate = getattr(settings, 'PERF_PROFILE_SAMPLE_RATE', 0.0)
+        self.header_enabled = getattr(settings, 'PERF_PROFILE_HEADER_ENABLED', settings.DEBUG)
+        self.profile_dir = getattr(settings, 'PERF_PROFILE_DIR', None)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with self.measure(request) as measurement:
+            measurement.response = self.get_response(request)
+        return measurement.response
+
+    async def __acall__(self, request):
+        # Under ASGI the profiler also sees whatever else the event loop runs
+        # while this request awaits.
+        with self.measure(request) as measurement:
+            measurement.response = await self.get_response(request)
+        return measurement.response
+
+    @contextmanager
+    def measure(self, request):
+        measurement = SimpleNamespace(response=None)
+        recorder = QueryRecorder()
+        profiler = cProfile.Profile() if self.should_profile(request) else None
+        start = time.perf_counter()
+        install_query_recorder()
+        token = _recorder.set(recorder)
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield measurement
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            _recorder.reset(token)
+        elapsed = time.perf_counter() - start
+
+        view = self.view_name(request)
+        self.record(request, measurement.response, view, recorder, elapsed)
+        if profiler is not None:
+            self.save_profile(profiler, request, view)
+
+    def should_profile(self, request):
+        if self.header_enabled and request.headers.get('X-Profile') == '1':
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def view_name(self, request):
+        match = getattr(request, 'resolver_match', None)
+        return match.view_name if match is not None and match.view_name else 'unmatched'
+
+    def record(self, request, response, view, recorder, elapsed):
+        labels = (('view', view), ('method', request.method))
+        registry.observe('review_request_duration_seconds', labels, elapsed, DURATION_BUCKETS)
+        registry.observe('review_request_sql_queries', labels, recorder.count, QUERY_BUCKETS)
+        registry.observe('review_request_sql_duration_seconds', labels, recorder.duration, DURATION_BUCKETS)
+        size = self.response_size(response)
+        if size is not None:
+            registry.observe('review_response_size_bytes', labels, size, SIZE_BUCKETS)
+
+        for shape, count in recorder.shapes.items():
+            if count < self.duplicate_threshold:
+                continue
+            digest = hashlib.sha1(shape.encode()).hexdigest()[:12]
+            registry.increment('review_duplicate_queries_total', (('view', view), ('fingerprint', digest)))
+            logger.warning('%s ran a query %d times (fingerprint %s): %s', view, count, digest, shape[:500])
+
+    def response_size(self, response):
+        if getattr(response, 'streaming', False):
+            length = response.get('Content-Length')
+            return int(length) if length and length.isascii() and length.isdigit() else None
+        return len(response.content)
+
+    def save_profile(self, profiler, request, view):
+        registry.increment('review_profiled_requests_total', (('view', view),))
+        if self.profile_dir:
+            directory = Path(self.profile_dir)
+            directory.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(directory / f'{view.replace(":", "-")}-{time.time_ns()}.prof')
+            return
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(30)
+        logger.info('Profile for %s %s\n%s', request.method, request.path, out.getvalue())
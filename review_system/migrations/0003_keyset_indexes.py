@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review_system', '0002_alter_user_first_name_alter_user_groups_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['submission', 'reviewed_at', 'review_id'], name='review_submission_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['reviewed_at', 'review_id'], name='review_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewcomment',
+            index=models.Index(fields=['review', 'commented_at', 'comment_id'], name='comment_review_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewcomment',
+            index=models.Index(fields=['commented_at', 'comment_id'], name='comment_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['subtask', 'submitted_at', 'submission_id'], name='submission_subtask_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['submitted_at', 'submission_id'], name='submission_keyset'),
+        ),
+    ]
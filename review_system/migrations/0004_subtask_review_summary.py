@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review_system', '0003_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubtaskReviewSummary',
+            fields=[
+                ('subtask', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='review_summary', serialize=False, to='review_system.subtask')),
+                ('passed_count', models.PositiveIntegerField(default=0)),
+                ('suggest_iteration_count', models.PositiveIntegerField(default=0)),
+                ('pending_count', models.PositiveIntegerField(default=0)),
+                ('latest_activity', models.DateTimeField(blank=True, null=True)),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='review_summaries', to='review_system.assignment')),
+            ],
+        ),
+    ]
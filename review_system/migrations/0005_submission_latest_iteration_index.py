@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review_system', '0004_subtask_review_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['subtask', 'reviewee', 'submitted_at', 'submission_id'], name='submission_latest_iteration'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_reviewees(apps, schema_editor):
+    Assignment = apps.get_model('review_system', 'Assignment')
+    User = apps.get_model('review_system', 'User')
+    AssignmentReviewee = apps.get_model('review_system', 'AssignmentReviewee')
+    team_members = {}
+    for team_id, user_id in User.teams.through.objects.values_list('team_id', 'user_id'):
+        team_members.setdefault(team_id, []).append(user_id)
+    rows = [
+        AssignmentReviewee(assignment_id=assignment_id, user_id=user_id, source='individual')
+        for assignment_id, user_id in Assignment.individual_reviewees.through.objects.values_list('assignment_id', 'user_id')
+    ]
+    for assignment_id, team_id in Assignment.team_reviewees.through.objects.values_list('assignment_id', 'team_id'):
+        rows.extend(
+            AssignmentReviewee(assignment_id=assignment_id, user_id=user_id, team_id=team_id, source='team')
+            for user_id in team_members.get(team_id, [])
+        )
+    AssignmentReviewee.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review_system', '0005_submission_latest_iteration_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssignmentReviewee',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('individual', 'Individual'), ('team', 'Team')], max_length=20)),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_reviewees', to='review_system.assignment')),
+                ('team', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='review_system.team')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_assignments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'assignment'], name='reviewee_user_assignment')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('team__isnull', True)), fields=('assignment', 'user'), name='unique_individual_reviewee'), models.UniqueConstraint(condition=models.Q(('team__isnull', False)), fields=('assignment', 'user', 'team'), name='unique_team_reviewee')],
+            },
+        ),
+        migrations.RunPython(backfill_reviewees, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, OperationalError
+
+
+# FTS5 index used by review_system.search. Only created on SQLite builds with
+# FTS5; search falls back to icontains scans everywhere else.
+def create_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE review_system_search USING fts5(title, body, tokenize = 'porter unicode61')"
+        )
+    except OperationalError:
+        pass
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS review_system_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review_system', '0006_assignment_reviewee'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:11
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    # Existing rows were last touched no later than they were created as far
+    # as we know; start them there rather than at migration time.
+    for model_name, created_field in [('Assignment', 'assigned_date'), ('Attachment', 'uploaded_at'),
+                                      ('Review', 'reviewed_at'), ('ReviewComment', 'commented_at'),
+                                      ('Submission', 'submitted_at')]:
+        apps.get_model('review_system', model_name).objects.update(updated_at=F(created_field))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review_system', '0007_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='reviewcomment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='subtask',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='team',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:14
+
+from django.db import migrations, models
+
+
+def backfill_changes(apps, schema_editor):
+    # Existing rows start in the log so a client syncing from seq 0 gets them.
+    Change = apps.get_model('review_system', 'Change')
+    for object_type, model_name in [('assignment', 'Assignment'), ('subtask', 'Subtask'),
+                                    ('submission', 'Submission'), ('review', 'Review'),
+                                    ('comment', 'ReviewComment')]:
+        ids = apps.get_model('review_system', model_name).objects.order_by('pk').values_list('pk', flat=True)
+        Change.objects.bulk_create([Change(object_type=object_type, object_id=pk) for pk in ids.iterator()],
+                                   batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review_system', '0008_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('object_type', models.CharField(choices=[('assignment', 'Assignment'), ('subtask', 'Subtask'), ('submission', 'Submission'), ('review', 'Review'), ('comment', 'Review comment')], max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['object_type', 'object_id', 'seq'], name='change_object')],
+            },
+        ),
+        migrations.RunPython(backfill_changes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:24
+
+import os
+
+import review_system.storage
+from django.db import migrations, models
+
+
+def backfill_filenames(apps, schema_editor):
+    # Files stored before content addressing keep their path; their name is
+    # just its last component.
+    Attachment = apps.get_model('review_system', 'Attachment')
+    for attachment in Attachment.objects.filter(filename='').only('file').iterator():
+        Attachment.objects.filter(pk=attachment.pk).update(filename=os.path.basename(attachment.file.name)[:255])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review_system', '0010_auth_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='filename',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='attachment',
+            name='file',
+            field=models.FileField(storage=review_system.storage.attachment_storage, upload_to='attachments/'),
+        ),
+        migrations.RunPython(backfill_filenames, migrations.RunPython.noop),
+    ]
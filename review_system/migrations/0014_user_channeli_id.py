@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:57
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.db import migrations, models
+
+
+def link_channeli_users(apps, schema_editor):
+    # Channeli sign-ins were matched on username and created without a usable
+    # password; keep those accounts linked. Accounts with a password signed
+    # up locally and are left alone.
+    User = apps.get_model('review_system', 'User')
+    users = User.objects.filter(password__startswith=UNUSABLE_PASSWORD_PREFIX)
+    for user in users.only('pk', 'username'):
+        User.objects.filter(pk=user.pk).update(channeli_id=user.username[:50])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review_system', '0013_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='channeli_id',
+            field=models.CharField(blank=True, max_length=50, null=True, unique=True),
+        ),
+        migrations.RunPython(link_channeli_users, migrations.RunPython.noop),
+    ]
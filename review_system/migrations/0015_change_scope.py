@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review_system', '0014_user_channeli_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='change',
+            name='assignment_id',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='change',
+            name='reviewee_id',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='change',
+            name='reviewer_id',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
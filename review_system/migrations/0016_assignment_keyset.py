@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review_system', '0015_change_scope'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['assigned_date', 'assignment_id'], name='assignment_keyset'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import AbstractUser, Group, Permission
+from django.utils import timezone
+from .storage import attachment_storage
 # Create your models here.
 
 
@@ -22,6 +24,7 @@ class User(AbstractUser):
     user_id = models.AutoField(primary_key=True)
     email = models.EmailField(unique=True, db_index=True)
     second_name = models.CharField(max_length=50)
+    channeli_id = models.CharField(max_length=50, unique=True, null=True, blank=True)  # set for Channeli sign-ins
     
     # Remove first_name as it already exists in AbstractUser
     # If you want to keep first_name as is, you can just customize it:
@@ -44,6 +47,7 @@ class User(AbstractUser):
 class Team(models.Model):
     team_id = models.AutoField(primary_key=True)
     team_name = models.CharField(max_length=100, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.team_name
@@ -54,6 +58,7 @@ class Assignment(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
     assigned_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     # ForeignKey to User (created_by)
     created_by = models.ForeignKey('User', on_delete=models.CASCADE, related_name='created_assignments')
@@ -64,6 +69,11 @@ class Assignment(models.Model):
     # Many-to-Many relationship for team reviewees (Teams)
     team_reviewees = models.ManyToManyField(Team, related_name='assignments_as_team')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['assigned_date', 'assignment_id'], name='assignment_keyset'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -73,6 +83,7 @@ class Submission(models.Model):
     submission_description = models.TextField()
     files_link = models.URLField(max_length=500)
     submitted_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     # ForeignKey to Subtask
     subtask = models.ForeignKey('Subtask', on_delete=models.CASCADE, related_name='submissions')
@@ -83,12 +94,23 @@ class Submission(models.Model):
     def __str__(self):
         return f"Submission {self.submission_id} by {self.reviewee}"
 
+    class Meta:
+        # Keyset pagination indexes: (timestamp, pk) optionally prefixed by the
+        # parent the listing is filtered on.
+        indexes = [
+            models.Index(fields=['subtask', 'submitted_at', 'submission_id'], name='submission_subtask_keyset'),
+            models.Index(fields=['submitted_at', 'submission_id'], name='submission_keyset'),
+            # Latest iteration per (subtask, reviewee), for the reviewer queue.
+            models.Index(fields=['subtask', 'reviewee', 'submitted_at', 'submission_id'], name='submission_latest_iteration'),
+        ]
+
 
 class Subtask(models.Model):
     subtask_id = models.AutoField(primary_key=True)
     title = models.CharField(max_length=255)
     description = models.TextField()
     due_date = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
 
     # Foreign Key to Assignment
     assignment = models.ForeignKey('Assignment', on_delete=models.CASCADE, related_name='subtasks')
@@ -102,6 +124,7 @@ class Review(models.Model):
     review_content = models.TextField()
     additional_comments = models.TextField(blank=True, null=True)
     reviewed_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     # Status as an Enum field (choices in Django)
     STATUS_CHOICES = [
@@ -117,11 +140,18 @@ class Review(models.Model):
     def __str__(self):
         return f"Review {self.review_id} - {self.status}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['submission', 'reviewed_at', 'review_id'], name='review_submission_keyset'),
+            models.Index(fields=['reviewed_at', 'review_id'], name='review_keyset'),
+        ]
+
 
 class ReviewComment(models.Model):
     comment_id = models.AutoField(primary_key=True)
     comment = models.TextField()
     commented_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     # Foreign Keys
     review = models.ForeignKey('Review', on_delete=models.CASCADE, related_name='comments')
@@ -130,11 +160,19 @@ class ReviewComment(models.Model):
     def __str__(self):
         return f"Comment {self.comment_id} on Review {self.review.review_id}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['review', 'commented_at', 'comment_id'], name='comment_review_keyset'),
+            models.Index(fields=['commented_at', 'comment_id'], name='comment_keyset'),
+        ]
+
 
 class Attachment(models.Model):
     attachment_id = models.AutoField(primary_key=True)
-    file = models.FileField(upload_to='attachments/')
+    file = models.FileField(upload_to='attachments/', storage=attachment_storage)
+    filename = models.CharField(max_length=255, blank=True)  # as uploaded; file.name is the content hash
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     submission = models.ForeignKey('Submission', on_delete=models.CASCADE, related_name='attachments', null=True, blank=True)
     review = models.ForeignKey('Review', on_delete=models.CASCADE, related_name='attachments', null=True, blank=True)
@@ -152,3 +190,150 @@ class Attachment(models.Model):
     def __str__(self):
         return f"Attachment {self.attachment_id} uploaded at {self.uploaded_at}"
 
+
+
+class SubtaskReviewSummary(models.Model):
+    # Denormalized per-subtask review status counts, maintained by
+    # review_system.rollup. Every submission is counted once, under the status
+    # of its latest review, or as pending if it has no review yet.
+    subtask = models.OneToOneField('Subtask', on_delete=models.CASCADE, primary_key=True, related_name='review_summary')
+    assignment = models.ForeignKey('Assignment', on_delete=models.CASCADE, related_name='review_summaries')
+    passed_count = models.PositiveIntegerField(default=0)
+    suggest_iteration_count = models.PositiveIntegerField(default=0)
+    pending_count = models.PositiveIntegerField(default=0)
+    latest_activity = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Review summary for {self.subtask}"
+
+
+class AssignmentReviewee(models.Model):
+    # Materialized "assignment applies to user" rows: one per individual
+    # assignment and one per (team assignment, team member). Maintained from
+    # m2m_changed by review_system.reviewees.
+    SOURCE_CHOICES = [
+        ('individual', 'Individual'),
+        ('team', 'Team'),
+    ]
+
+    assignment = models.ForeignKey('Assignment', on_delete=models.CASCADE, related_name='effective_reviewees')
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='effective_assignments')
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    team = models.ForeignKey('Team', on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['assignment', 'user'], condition=models.Q(team__isnull=True),
+                                    name='unique_individual_reviewee'),
+            models.UniqueConstraint(fields=['assignment', 'user', 'team'], condition=models.Q(team__isnull=False),
+                                    name='unique_team_reviewee'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'assignment'], name='reviewee_user_assignment'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} on {self.assignment} ({self.source})"
+
+
+class Change(models.Model):
+    # Append-only change log behind the delta-sync endpoint, written by
+    # review_system.changes on every save, bulk write and delete. ``seq`` only
+    # grows, so clients resume from the last seq they saw; a deleted row is a
+    # tombstone. Tombstones also keep who could read the deleted row (see
+    # review_system.changes.readable), since the row is gone by then.
+    OBJECT_TYPES = [
+        ('assignment', 'Assignment'),
+        ('subtask', 'Subtask'),
+        ('submission', 'Submission'),
+        ('review', 'Review'),
+        ('comment', 'Review comment'),
+    ]
+
+    seq = models.BigAutoField(primary_key=True)
+    object_type = models.CharField(max_length=20, choices=OBJECT_TYPES)
+    object_id = models.PositiveIntegerField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now_add=True)
+    assignment_id = models.PositiveIntegerField(null=True, blank=True)
+    reviewee_id = models.PositiveIntegerField(null=True, blank=True)
+    reviewer_id = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['object_type', 'object_id', 'seq'], name='change_object'),
+        ]
+
+    def __str__(self):
+        return f"{self.object_type} {self.object_id} {'deleted' if self.deleted else 'changed'} (#{self.seq})"
+
+
+class AuthToken(models.Model):
+    # API token issued by LoginView. Only the SHA-256 of the token is stored;
+    # see review_system.tokens.
+    key_hash = models.CharField(max_length=64, primary_key=True)
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='auth_tokens')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Token for {self.user} (expires {self.expires_at})"
+
+
+class Blob(models.Model):
+    # One row per stored attachment content (see review_system.storage), with
+    # the number of Attachment rows pointing at it. Maintained by
+    # review_system.blobs; rows at zero are collected by gc_blobs.
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Blob {self.sha256[:12]} ({self.ref_count} refs)"
+
+
+class Job(models.Model):
+    # Background job run by the run_jobs worker (review_system.jobs). A job
+    # is ``queued`` until run_after, ``running`` while a worker holds its lease
+    # (until locked_until), and is deleted once it succeeds; one that keeps
+    # failing ends up ``failed`` with the last traceback.
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after', 'id'], name='job_ready'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} {self.name} ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    # Stored response of a create request sent with an Idempotency-Key
+    # header, replayed for retries until expires_at. Keyed by the SHA-256 of
+    # the user and the client's key; see review_system.idempotency.
+    key_hash = models.CharField(max_length=64, primary_key=True)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField(null=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Idempotency key {self.key_hash[:12]} ({self.status_code}, expires {self.expires_at})"
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import jobs
+from .models import Review, ReviewComment
+from .signals import rows_bulk_saved
+
+# Email notifications for new reviews and comments, sent by the job worker
+# rather than the request that wrote them. One job covers every row of a
+# write, however many the batch endpoints created; its handler loads them in
+# one query and fans out a send_email job per recipient, so a mail server
+# failing partway through only retries the messages it did not take.
+
+
+def _fan_out(messages):
+    jobs.enqueue_many('send_email', [{'subject': subject, 'body': body, 'to': email}
+                                     for subject, body, recipients in messages for email in recipients])
+
+
+@jobs.job('send_email')
+def send_email(subject, body, to):
+    EmailMessage(subject=subject, body=body, from_email=settings.DEFAULT_FROM_EMAIL, to=[to]).send()
+
+
+@jobs.job('notify_reviews')
+def notify_reviews(review_ids):
+    reviews = (Review.objects.filter(pk__in=review_ids)
+               .select_related('submission__reviewee', 'submission__subtask', 'reviewer'))
+    _fan_out(
+        (f'Your submission for "{review.submission.subtask.title}" was reviewed',
+         f'{review.reviewer.username} reviewed your submission: {review.get_status_display()}.\n\n'
+         f'{review.review_content}',
+         [email for email in [review.submission.reviewee.email] if email])
+        for review in reviews
+    )
+
+
+@jobs.job('notify_comments')
+def notify_comments(comment_ids):
+    comments = (ReviewComment.objects.filter(pk__in=comment_ids)
+                .select_related('commenter', 'review__reviewer', 'review__submission__reviewee',
+                                'review__submission__subtask'))
+    messages = []
+    for comment in comments:
+        recipients = {comment.review.reviewer, comment.review.submission.reviewee} - {comment.commenter}
+        messages.append((
+            f'New comment on the review of "{comment.review.submission.subtask.title}"',
+            f'{comment.commenter.username} commented:\n\n{comment.comment}',
+            sorted(user.email for user in recipients if user.email),
+        ))
+    _fan_out(messages)
+
+
+JOBS = {Review: 'notify_reviews', ReviewComment: 'notify_comments'}
+PAYLOAD_KEYS = {Review: 'review_ids', ReviewComment: 'comment_ids'}
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=ReviewComment)
+def _created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        jobs.enqueue(JOBS[sender], **{PAYLOAD_KEYS[sender]: [instance.pk]})
+
+
+@receiver(rows_bulk_saved, sender=Review)
+@receiver(rows_bulk_saved, sender=ReviewComment)
+def _bulk_created(sender, instances, created, **kwargs):
+    if created and instances:
+        jobs.enqueue(JOBS[sender], **{PAYLOAD_KEYS[sender]: [instance.pk for instance in instances]})
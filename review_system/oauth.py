@@ -0,0 +1,148 @@
+import asyncio
+import secrets
+import weakref
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+
+from . import tokens
+from .models import User
+
+# Channeli OAuth code exchange for ChanneliCallbackView. All calls go through
+# one pooled httpx.AsyncClient per event loop (under ASGI, one per process)
+# with timeouts and retries. Each request builds its own parameters; nothing
+# module-level is mutated.
+#
+# Retries: connection failures are retried for every call, since the request
+# never reached the server. Timeouts, dropped connections and 502/503/504 are
+# only retried for the user data GET, because an authorization code can be
+# redeemed once and a lost token response cannot be replayed.
+
+RETRY_STATUSES = {502, 503, 504}
+BACKOFF = 0.2
+
+_clients = weakref.WeakKeyDictionary()
+
+
+class OAuthError(Exception):
+    def __init__(self, message, status=502):
+        super().__init__(message)
+        self.status = status
+
+
+# The authorize redirect carries a random state, remembered in the session,
+# which the callback must echo back: a callback the user did not start (login
+# CSRF) has no matching state.
+STATE_SESSION_KEY = 'channeli_oauth_state'
+
+
+def new_state(session):
+    state = session[STATE_SESSION_KEY] = secrets.token_urlsafe(32)
+    return state
+
+
+async def check_state(session, state):
+    # One use per state.
+    expected = await session.apop(STATE_SESSION_KEY, None)
+    return bool(expected and state) and secrets.compare_digest(expected, state)
+
+
+def _json(response):
+    try:
+        data = response.json()
+    except ValueError as exc:
+        raise OAuthError('Channeli returned a malformed response') from exc
+    if not isinstance(data, dict):
+        raise OAuthError('Channeli returned a malformed response')
+    return data
+
+
+def client():
+    loop = asyncio.get_running_loop()
+    http = _clients.get(loop)
+    if http is None:
+        limits = httpx.Limits(max_connections=settings.CHANNELI_HTTP_MAX_CONNECTIONS,
+                              max_keepalive_connections=settings.CHANNELI_HTTP_MAX_CONNECTIONS)
+        http = _clients[loop] = httpx.AsyncClient(timeout=settings.CHANNELI_HTTP_TIMEOUT, limits=limits)
+    return http
+
+
+async def _request(method, url, idempotent, **kwargs):
+    retries = settings.CHANNELI_HTTP_RETRIES
+    for attempt in range(retries + 1):
+        last = attempt == retries
+        try:
+            response = await client().request(method, url, **kwargs)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as exc:
+            if last:
+                raise OAuthError(f'Channeli unreachable: {exc}') from exc
+        except httpx.TransportError as exc:
+            if last or not idempotent:
+                raise OAuthError(f'Channeli request failed: {exc}') from exc
+        else:
+            if response.status_code not in RETRY_STATUSES or last or not idempotent:
+                return response
+        await asyncio.sleep(BACKOFF * 2 ** attempt)
+
+
+async def exchange_code(code):
+    response = await _request('POST', settings.CHANNELI_TOKEN_URL, idempotent=False, data={
+        'client_id': settings.CHANNELI_CLIENT_ID,
+        'client_secret': settings.CHANNELI_CLIENT_SECRET,
+        'grant_type': 'authorization_code',
+        'code': code,
+        'redirect_uri': settings.CHANNELI_REDIRECT_URI,
+    })
+    if 400 <= response.status_code < 500:
+        raise OAuthError('Authorization code rejected by Channeli', status=400)
+    if response.status_code != 200:
+        raise OAuthError(f'Channeli token endpoint returned {response.status_code}')
+    access_token = _json(response).get('access_token')
+    if not access_token:
+        raise OAuthError('Channeli returned no access token')
+    return access_token
+
+
+async def fetch_user_data(access_token):
+    response = await _request('GET', settings.CHANNELI_USER_DATA_URL, idempotent=True,
+                              headers={'Authorization': f'Bearer {access_token}'})
+    if response.status_code != 200:
+        raise OAuthError(f'Channeli user data endpoint returned {response.status_code}')
+    return _json(response)
+
+
+def user_fields(data):
+    contact = data.get('contactInformation') or {}
+    email = contact.get('instituteWebmailAddress') or contact.get('emailAddress')
+    username = data.get('username')
+    if not username or not email:
+        raise OAuthError('Channeli user data has no username or email')
+    first_name, _, second_name = ((data.get('person') or {}).get('fullName') or '').partition(' ')
+    return {'username': str(username), 'email': User.objects.normalize_email(email),
+            'first_name': first_name[:150], 'second_name': second_name[:50]}
+
+
+def upsert_user(fields):
+    # Create or refresh the user and issue an API token in one transaction.
+    # Channeli accounts are matched on channeli_id, never on username, so a
+    # Channeli login can not take over a locally signed-up account that
+    # happens to share its username.
+    try:
+        with transaction.atomic():
+            user, _ = User.objects.update_or_create(
+                channeli_id=fields['username'],
+                defaults={key: value for key, value in fields.items() if key != 'username'},
+                create_defaults={**fields, 'password': make_password(None)},
+            )
+            token, expires_at = tokens.issue(user)
+    except IntegrityError as exc:
+        raise OAuthError('Username or email already belongs to another account', status=409) from exc
+    return user, token, expires_at
+
+
+async def sign_in(code):
+    data = await fetch_user_data(await exchange_code(code))
+    return await sync_to_async(upsert_user)(user_fields(data))
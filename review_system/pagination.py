@@ -0,0 +1,89 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    # Cursor pagination over a (timestamp, pk) pair. The cursor holds the last
+    # row's values and the next page is a range scan starting just after it, so
+    # with a matching composite index page 1000 costs the same as page 1.
+    #
+    # Views set ``keyset_ordering`` to the two fields, e.g.
+    # ('-submitted_at', '-submission_id'). Both must sort the same direction.
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = view.keyset_ordering
+        self.descending = self.ordering[0].startswith('-')
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(self.after(cursor))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def after(self, cursor):
+        timestamp, pk = cursor
+        lookup = 'lt' if self.descending else 'gt'
+        ts_field, pk_field = self.fields
+        return Q(**{f'{ts_field}__{lookup}': timestamp}) | Q(**{ts_field: timestamp, f'{pk_field}__{lookup}': pk})
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            timestamp, pk = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            return datetime.fromisoformat(timestamp), int(pk)
+        except (TypeError, ValueError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj):
+        # Rows may be model instances or values() dicts.
+        values = [obj[field] if isinstance(obj, dict) else getattr(obj, field) for field in self.fields]
+        payload = json.dumps([values[0].isoformat(), values[1]], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
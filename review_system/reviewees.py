@@ -0,0 +1,99 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from .models import Assignment, AssignmentReviewee, User
+
+# Keeps AssignmentReviewee equal to the union of Assignment.individual_reviewees
+# and Assignment.team_reviewees x Team.members. Every m2m change re-derives the
+# rows for the narrowest scope it can affect (one assignment, user or team) and
+# applies the difference with one bulk INSERT and one DELETE.
+
+IndividualReviewees = Assignment.individual_reviewees.through
+TeamReviewees = Assignment.team_reviewees.through
+TeamMembers = User.teams.through
+
+
+def desired(assignment_ids=None, user_ids=None, team_ids=None):
+    # Set of (assignment_id, user_id, team_id) rows that should exist in the
+    # given scope; team_id is None for individual assignments.
+    individual = IndividualReviewees.objects.all()
+    assigned_teams = TeamReviewees.objects.all()
+    members = TeamMembers.objects.all()
+    if assignment_ids is not None:
+        individual = individual.filter(assignment_id__in=assignment_ids)
+        assigned_teams = assigned_teams.filter(assignment_id__in=assignment_ids)
+    if user_ids is not None:
+        individual = individual.filter(user_id__in=user_ids)
+        members = members.filter(user_id__in=user_ids)
+        assigned_teams = assigned_teams.filter(team_id__in=members.values('team_id'))
+    if team_ids is not None:
+        individual = individual.none()
+        assigned_teams = assigned_teams.filter(team_id__in=team_ids)
+    members = members.filter(team_id__in=assigned_teams.values('team_id'))
+
+    rows = {(assignment_id, user_id, None) for assignment_id, user_id in individual.values_list('assignment_id', 'user_id')}
+    team_members = defaultdict(list)
+    for team_id, user_id in members.values_list('team_id', 'user_id'):
+        team_members[team_id].append(user_id)
+    for assignment_id, team_id in assigned_teams.values_list('assignment_id', 'team_id'):
+        rows.update((assignment_id, user_id, team_id) for user_id in team_members[team_id])
+    return rows
+
+
+def stored(assignment_ids=None, user_ids=None, team_ids=None):
+    # {(assignment_id, user_id, team_id): pk} for the rows currently stored.
+    queryset = AssignmentReviewee.objects.all()
+    if assignment_ids is not None:
+        queryset = queryset.filter(assignment_id__in=assignment_ids)
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+    if team_ids is not None:
+        queryset = queryset.filter(team_id__in=team_ids)
+    return {
+        (assignment_id, user_id, team_id): pk
+        for pk, assignment_id, user_id, team_id in queryset.values_list('pk', 'assignment_id', 'user_id', 'team_id')
+    }
+
+
+def diff(**scope):
+    wanted, current = desired(**scope), stored(**scope)
+    return wanted - set(current), [pk for row, pk in current.items() if row not in wanted]
+
+
+def sync(**scope):
+    added, removed = diff(**scope)
+    with transaction.atomic():
+        if added:
+            AssignmentReviewee.objects.bulk_create([
+                AssignmentReviewee(assignment_id=assignment_id, user_id=user_id, team_id=team_id,
+                                   source='individual' if team_id is None else 'team')
+                for assignment_id, user_id, team_id in added
+            ])
+        if removed:
+            AssignmentReviewee.objects.filter(pk__in=removed).delete()
+    return added, removed
+
+
+def _scope(instance, reverse, forward_scope, reverse_scope):
+    return {reverse_scope if reverse else forward_scope: [instance.pk]}
+
+
+@receiver(m2m_changed, sender=IndividualReviewees)
+def _individual_reviewees_changed(sender, instance, action, reverse, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        sync(**_scope(instance, reverse, 'assignment_ids', 'user_ids'))
+
+
+@receiver(m2m_changed, sender=TeamReviewees)
+def _team_reviewees_changed(sender, instance, action, reverse, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        sync(**_scope(instance, reverse, 'assignment_ids', 'team_ids'))
+
+
+@receiver(m2m_changed, sender=TeamMembers)
+def _team_members_changed(sender, instance, action, reverse, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        sync(**_scope(instance, reverse, 'user_ids', 'team_ids'))
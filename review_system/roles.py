@@ -0,0 +1,66 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Role, User
+
+# Process-local cache of the Role table (role_name -> Role). The table only ever
+# holds the few ROLE_CHOICES rows, so it is loaded once and dropped whenever a
+# Role is saved or deleted: at the write and again on commit, so a reader that
+# reloaded it inside the writing transaction cannot keep the uncommitted rows.
+_roles = None
+_lock = threading.Lock()
+
+
+def get_roles():
+    global _roles
+    roles = _roles
+    if roles is None:
+        with _lock:
+            if _roles is None:
+                _roles = {role.role_name: role for role in Role.objects.all()}
+            roles = _roles
+    return roles
+
+
+def get_role(role_name):
+    role = get_roles().get(role_name)
+    if role is None:
+        role, _ = Role.objects.get_or_create(role_name=role_name)
+    return role
+
+
+def invalidate():
+    global _roles
+    with _lock:
+        _roles = None
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def _invalidate_roles(sender, **kwargs):
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+# Make ``user``'s roles exactly ``role_names`` by diffing the through table:
+# one SELECT for the current rows (skipped for a freshly created user), one
+# bulk INSERT for the additions and one DELETE for the removals.
+def set_user_roles(user, role_names, created=False):
+    through = User.roles.through
+    wanted = {get_role(name).pk for name in role_names}
+    current = set() if created else set(
+        through.objects.filter(user_id=user.pk).values_list('role_id', flat=True)
+    )
+    added, removed = wanted - current, current - wanted
+
+    if added:
+        through.objects.bulk_create([through(user_id=user.pk, role_id=role_id) for role_id in added])
+        m2m_changed.send(sender=through, instance=user, action='post_add', reverse=False,
+                         model=Role, pk_set=added, using=user._state.db)
+    if removed:
+        through.objects.filter(user_id=user.pk, role_id__in=removed).delete()
+        m2m_changed.send(sender=through, instance=user, action='post_remove', reverse=False,
+                         model=Role, pk_set=removed, using=user._state.db)
@@ -0,0 +1,288 @@
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Review, Submission, Subtask, SubtaskReviewSummary
+from .signals import rows_bulk_saved
+
+# Keeps SubtaskReviewSummary in step with Submission and Review writes. Each
+# write looks up the effective status (latest review status, or None for
+# pending) of the submissions it touches before and after the change, and
+# applies the difference to the counters with a single UPDATE per subtask.
+# The handlers run inside the writer's transaction, so the counters commit or
+# roll back together with the row that moved them.
+
+COUNT_FIELDS = {status: f'{status}_count' for status, _ in Review.STATUS_CHOICES}
+COUNT_FIELDS[None] = 'pending_count'
+
+# Subtasks being deleted on this thread. Their summary row goes with them in
+# the CASCADE, so the handlers for their submissions and reviews skip them.
+_deleting = threading.local()
+
+
+def _deleting_subtasks():
+    if not hasattr(_deleting, 'subtask_ids'):
+        _deleting.subtask_ids = set()
+    return _deleting.subtask_ids
+
+
+def latest_review_status():
+    return Subquery(
+        Review.objects.filter(submission=OuterRef('pk')).order_by('-reviewed_at', '-review_id').values('status')[:1]
+    )
+
+
+def effective_statuses(submission_ids):
+    # {submission_id: (subtask_id, status)} in one query.
+    if not submission_ids:
+        return {}
+    rows = (Submission.objects.filter(pk__in=submission_ids)
+            .annotate(latest_status=latest_review_status())
+            .values_list('pk', 'subtask_id', 'latest_status'))
+    return {pk: (subtask_id, status) for pk, subtask_id, status in rows}
+
+
+def apply_changes(before, after, activity=None):
+    # ``activity`` is {subtask_id: datetime} to move latest_activity forward.
+    deltas = defaultdict(lambda: defaultdict(int))
+    for submission_id in set(before) | set(after):
+        if before.get(submission_id) == after.get(submission_id):
+            continue
+        if submission_id in before:
+            subtask_id, status = before[submission_id]
+            deltas[subtask_id][COUNT_FIELDS[status]] -= 1
+        if submission_id in after:
+            subtask_id, status = after[submission_id]
+            deltas[subtask_id][COUNT_FIELDS[status]] += 1
+    activity = activity or {}
+    touched = (set(deltas) | set(activity)) - _deleting_subtasks()
+
+    missing = []
+    for subtask_id in touched:
+        updates = {field: F(field) + delta for field, delta in deltas[subtask_id].items() if delta}
+        if subtask_id in activity:
+            when = Value(activity[subtask_id])
+            updates['latest_activity'] = Greatest(Coalesce('latest_activity', when), when)
+        if updates and not SubtaskReviewSummary.objects.filter(subtask_id=subtask_id).update(**updates):
+            missing.append(subtask_id)
+    if missing:
+        # No summary row yet (e.g. data that predates the table): build it
+        # from scratch, which already includes this change.
+        rebuild(missing)
+
+
+def compute(subtask_ids=None):
+    # Full recompute: {subtask_id: {field: value}} straight from Submission and
+    # Review, used to (re)build and to verify the summary table.
+    subtasks = Subtask.objects.all()
+    submissions = Submission.objects.all()
+    reviews = Review.objects.all()
+    if subtask_ids is not None:
+        subtasks = subtasks.filter(pk__in=subtask_ids)
+        submissions = submissions.filter(subtask_id__in=subtask_ids)
+        reviews = reviews.filter(submission__subtask_id__in=subtask_ids)
+
+    result = {
+        pk: {'assignment_id': assignment_id, 'latest_activity': None, **{field: 0 for field in COUNT_FIELDS.values()}}
+        for pk, assignment_id in subtasks.values_list('pk', 'assignment_id')
+    }
+    aggregates = {field: Count('pk', filter=Q(latest_status=status)) for status, field in COUNT_FIELDS.items() if status}
+    aggregates['pending_count'] = Count('pk', filter=Q(latest_status__isnull=True))
+    rows = (submissions.annotate(latest_status=latest_review_status())
+            .values('subtask_id').order_by().annotate(latest_submitted=Max('submitted_at'), **aggregates))
+    for row in rows:
+        summary = result[row.pop('subtask_id')]
+        summary['latest_activity'] = row.pop('latest_submitted')
+        summary.update(row)
+    for subtask_id, latest_reviewed in (reviews.values_list('submission__subtask_id').order_by()
+                                        .annotate(latest=Max('reviewed_at'))):
+        current = result[subtask_id]['latest_activity']
+        if current is None or latest_reviewed > current:
+            result[subtask_id]['latest_activity'] = latest_reviewed
+    return result
+
+
+def rebuild(subtask_ids=None):
+    # Repair and backfill only; writes keep the table current through deltas.
+    computed = compute(subtask_ids)
+    with transaction.atomic():
+        if subtask_ids is None:
+            SubtaskReviewSummary.objects.exclude(subtask_id__in=list(computed)).delete()
+        SubtaskReviewSummary.objects.bulk_create(
+            [SubtaskReviewSummary(subtask_id=pk, **values) for pk, values in computed.items()],
+            update_conflicts=True,
+            unique_fields=['subtask'],
+            update_fields=['assignment', 'latest_activity', *COUNT_FIELDS.values()],
+        )
+    return computed
+
+
+def verify():
+    # Return {subtask_id: (stored, expected)} for every summary row that
+    # disagrees with a full recompute. latest_activity is not compared: it only
+    # ever moves forward, so deletions legitimately leave it ahead of the data.
+    fields = ['assignment_id', *COUNT_FIELDS.values()]
+    stored = {row.pop('subtask_id'): row for row in SubtaskReviewSummary.objects.values('subtask_id', *fields)}
+    mismatches = {}
+    for subtask_id, expected in compute().items():
+        expected = {field: expected[field] for field in fields}
+        if stored.pop(subtask_id, None) != expected:
+            mismatches[subtask_id] = (stored.get(subtask_id), expected)
+    for subtask_id, row in stored.items():
+        mismatches[subtask_id] = (row, None)
+    return mismatches
+
+
+@receiver(post_save, sender=Subtask)
+def _subtask_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        SubtaskReviewSummary.objects.create(subtask=instance, assignment_id=instance.assignment_id)
+    else:
+        SubtaskReviewSummary.objects.filter(subtask=instance).update(assignment_id=instance.assignment_id)
+
+
+@receiver(pre_delete, sender=Subtask)
+def _subtask_pre_delete(sender, instance, **kwargs):
+    _deleting_subtasks().add(instance.pk)
+
+
+@receiver(post_delete, sender=Subtask)
+def _subtask_deleted(sender, instance, **kwargs):
+    _deleting_subtasks().discard(instance.pk)
+
+
+@receiver(pre_save, sender=Submission)
+def _submission_pre_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance._rollup_before = {} if instance._state.adding else effective_statuses([instance.pk])
+
+
+@receiver(post_save, sender=Submission)
+def _submission_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_rollup_before', {})
+    if instance.pk in before and before[instance.pk][0] == instance.subtask_id:
+        return  # Same subtask, same reviews: nothing to count.
+    after = {instance.pk: (instance.subtask_id, before.get(instance.pk, (None, None))[1])}
+    apply_changes(before, after, activity={instance.subtask_id: instance.submitted_at})
+
+
+@receiver(post_delete, sender=Submission)
+def _submission_deleted(sender, instance, **kwargs):
+    # The CASCADE deletes a submission's reviews (and their handlers move it
+    # back to pending) before the submission row itself goes, so by now it is
+    # always counted as pending.
+    apply_changes({instance.pk: (instance.subtask_id, None)}, {})
+
+
+def _review_submission_ids(instance):
+    ids = {instance.submission_id}
+    if not instance._state.adding:
+        ids.update(Review.objects.filter(pk=instance.pk).values_list('submission_id', flat=True))
+    return ids
+
+
+@receiver(pre_save, sender=Review)
+def _review_pre_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance._rollup_before = effective_statuses(_review_submission_ids(instance))
+
+
+@receiver(post_save, sender=Review)
+def _review_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_rollup_before', {})
+    after = effective_statuses(list(before))
+    apply_changes(before, after, activity={subtask_id: instance.reviewed_at for subtask_id, _ in after.values()})
+
+
+@receiver(pre_delete, sender=Review)
+def _review_pre_delete(sender, instance, origin=None, **kwargs):
+    # One delete() can remove several reviews of a submission (a cascade, a
+    # queryset delete): every pre_delete runs before any row goes, so record
+    # each submission's state once per delete and settle it once, on the
+    # first post_delete that follows.
+    pending = _pending_review_deletes(origin)
+    if instance.submission_id not in pending:
+        pending.update(effective_statuses([instance.submission_id]))
+
+
+@receiver(post_delete, sender=Review)
+def _review_deleted(sender, instance, origin=None, **kwargs):
+    pending = _pending_review_deletes(origin)
+    if instance.submission_id in pending:
+        before = {instance.submission_id: pending.pop(instance.submission_id)}
+        apply_changes(before, effective_statuses(list(before)))
+
+
+def _pending_review_deletes(origin):
+    # {submission_id: (subtask_id, status)} recorded for the delete() started
+    # on ``origin``; entries left behind by an earlier, failed delete are
+    # dropped.
+    if getattr(_deleting, 'review_origin', None) is not origin:
+        _deleting.review_origin = origin
+        _deleting.review_before = {}
+    return _deleting.review_before
+
+
+def _latest_activity(pairs):
+    activity = {}
+    for subtask_id, when in pairs:
+        if when is not None and (subtask_id not in activity or when > activity[subtask_id]):
+            activity[subtask_id] = when
+    return activity
+
+
+def _statuses_before_reviews(submission_ids, instances, previous):
+    # Effective statuses as they were before a batch of reviews was written:
+    # the latest review outside the batch, unless the batch replaced a later
+    # one (``previous``). One query, like effective_statuses().
+    latest = (Review.objects.filter(submission=OuterRef('pk')).exclude(pk__in=[obj.pk for obj in instances])
+              .order_by('-reviewed_at', '-review_id'))
+    rows = (Submission.objects.filter(pk__in=submission_ids)
+            .annotate(latest_status=Subquery(latest.values('status')[:1]),
+                      latest_at=Subquery(latest.values('reviewed_at')[:1]),
+                      latest_id=Subquery(latest.values('pk')[:1]))
+            .values_list('pk', 'subtask_id', 'latest_status', 'latest_at', 'latest_id'))
+    before = {pk: (subtask_id, status, (at, review_id)) for pk, subtask_id, status, at, review_id in rows}
+    for obj in previous:
+        if obj.submission_id in before:
+            subtask_id, status, key = before[obj.submission_id]
+            if key[1] is None or (obj.reviewed_at, obj.pk) > key:
+                before[obj.submission_id] = (subtask_id, obj.status, (obj.reviewed_at, obj.pk))
+    return {pk: (subtask_id, status) for pk, (subtask_id, status, _) in before.items()}
+
+
+@receiver(rows_bulk_saved, sender=Submission)
+def _submissions_bulk_saved(sender, instances, created, previous=(), **kwargs):
+    # Same rules as _submission_saved, for the whole batch at once.
+    if created:
+        moved = list(instances)
+        before, after = {}, {obj.pk: (obj.subtask_id, None) for obj in moved}
+    else:
+        subtask_before = {obj.pk: obj.subtask_id for obj in previous}
+        moved = [obj for obj in instances if subtask_before.get(obj.pk) != obj.subtask_id]
+        after = effective_statuses([obj.pk for obj in moved])
+        before = {pk: (subtask_before[pk], status) for pk, (_, status) in after.items()}
+    apply_changes(before, after, activity=_latest_activity((obj.subtask_id, obj.submitted_at) for obj in moved))
+
+
+@receiver(rows_bulk_saved, sender=Review)
+def _reviews_bulk_saved(sender, instances, previous=(), **kwargs):
+    # Same rules as _review_saved, for the whole batch at once.
+    submission_ids = {obj.submission_id for obj in [*instances, *previous]}
+    before = _statuses_before_reviews(submission_ids, instances, previous)
+    after = effective_statuses(submission_ids)
+    subtask_of = {pk: subtask_id for pk, (subtask_id, _) in after.items()}
+    apply_changes(before, after, activity=_latest_activity(
+        (subtask_of[obj.submission_id], obj.reviewed_at) for obj in instances if obj.submission_id in subtask_of
+    ))
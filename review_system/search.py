@@ -0,0 +1,220 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import changes
+from .models import Assignment, Review, Submission, Subtask
+from .signals import rows_bulk_saved
+
+# Full-text search over assignments, subtasks, submissions and reviews.
+#
+# On SQLite the text lives in an FTS5 table (created by migration 0007) with a
+# ``title`` and a ``body`` column. The rowid encodes the object:
+# ``object_id * len(KINDS) + kind index``, so keeping a row current is a delete
+# and an insert by rowid. On other backends, or a SQLite build without FTS5,
+# search() falls back to icontains scans.
+#
+# Given a ``reader``, only hits they may read (changes.readable) come back:
+# the fallback filters its scans, and FTS5 hits are read in batches and
+# filtered until the page is full.
+
+TABLE = 'review_system_search'
+
+
+def _assignment_text(obj):
+    return obj.title, obj.description
+
+
+def _subtask_text(obj):
+    return obj.title, obj.description
+
+
+def _submission_text(obj):
+    return '', obj.submission_description
+
+
+def _review_text(obj):
+    return '', '\n'.join(filter(None, [obj.review_content, obj.additional_comments]))
+
+
+# kind -> (model, text extractor, fields for the icontains fallback)
+KINDS = {
+    'assignment': (Assignment, _assignment_text, ['title', 'description']),
+    'subtask': (Subtask, _subtask_text, ['title', 'description']),
+    'submission': (Submission, _submission_text, ['submission_description']),
+    'review': (Review, _review_text, ['review_content', 'additional_comments']),
+}
+KIND_NAMES = list(KINDS)
+MODEL_KINDS = {model: kind for kind, (model, _, _) in KINDS.items()}
+
+_available = None
+
+
+def available():
+    global _available
+    if _available is None:
+        _available = connection.vendor == 'sqlite' and TABLE in connection.introspection.table_names()
+    return _available
+
+
+def rowid(kind, object_id):
+    return object_id * len(KIND_NAMES) + KIND_NAMES.index(kind)
+
+
+def from_rowid(value):
+    object_id, kind_index = divmod(value, len(KIND_NAMES))
+    return KIND_NAMES[kind_index], object_id
+
+
+def index(objs):
+    objs = list(objs)
+    if not objs or not available():
+        return
+    rows = []
+    for obj in objs:
+        kind = MODEL_KINDS[type(obj)]
+        rows.append((rowid(kind, obj.pk), *KINDS[kind][1](obj)))
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(f'INSERT INTO {TABLE} (rowid, title, body) VALUES (%s, %s, %s)', rows)
+
+
+def unindex(kind, object_ids):
+    if not object_ids or not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(rowid(kind, pk),) for pk in object_ids])
+
+
+def reindex(chunk_size=2000):
+    if not available():
+        return 0
+    total = 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE}')
+        for model, _, _ in KINDS.values():
+            batch = []
+            for obj in model.objects.order_by().iterator(chunk_size=chunk_size):
+                batch.append(obj)
+                if len(batch) >= chunk_size:
+                    index(batch)
+                    total += len(batch)
+                    batch = []
+            index(batch)
+            total += len(batch)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return total
+
+
+def match_expression(query):
+    # Quote every word so user input can never be parsed as FTS5 syntax; the
+    # terms are ANDed, and the last one also matches as a prefix.
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return None
+    quoted = ['"%s"' % term for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search(query, kinds=None, limit=20, offset=0, reader=None, batch_size=200):
+    # Return up to ``limit`` hits as dicts with kind, id, title and snippet,
+    # best match first.
+    kinds = [kind for kind in (kinds or KIND_NAMES) if kind in KINDS]
+    if not kinds:
+        return []
+    if not available():
+        return _fallback_search(query, kinds, limit, offset, reader)
+    if reader is None:
+        return _fts_search(query, kinds, limit, offset)
+    hits, start = [], 0
+    while len(hits) < offset + limit:
+        batch = _fts_search(query, kinds, batch_size, start)
+        hits.extend(_readable(batch, reader))
+        if len(batch) < batch_size:
+            break
+        start += batch_size
+    return hits[offset:offset + limit]
+
+
+def _readable(hits, reader):
+    # ``hits`` without those ``reader`` may not read; one query per kind.
+    ids = {}
+    for hit in hits:
+        ids.setdefault(hit['kind'], []).append(hit['id'])
+    allowed = set()
+    for kind, object_ids in ids.items():
+        queryset = KINDS[kind][0].objects.filter(pk__in=object_ids).filter(changes.readable(kind, reader))
+        allowed.update((kind, pk) for pk in queryset.values_list('pk', flat=True))
+    return [hit for hit in hits if (hit['kind'], hit['id']) in allowed]
+
+
+def _fts_search(query, kinds, limit, offset):
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    params = [expression]
+    kind_filter = ''
+    if len(kinds) < len(KIND_NAMES):
+        kind_filter = 'AND (rowid %%%% %d) IN (%s)' % (len(KIND_NAMES), ', '.join(['%s'] * len(kinds)))
+        params.extend(KIND_NAMES.index(kind) for kind in kinds)
+    params.extend([limit, offset])
+    sql = (
+        f"SELECT rowid, title, snippet({TABLE}, 1, '[', ']', '...', 12) FROM {TABLE} "
+        f"WHERE {TABLE} MATCH %s {kind_filter} "
+        f"ORDER BY bm25({TABLE}, 10.0, 1.0) LIMIT %s OFFSET %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    hits = []
+    for value, title, snippet in rows:
+        kind, object_id = from_rowid(value)
+        hits.append({'kind': kind, 'id': object_id, 'title': title, 'snippet': snippet})
+    return hits
+
+
+def _fallback_search(query, kinds, limit, offset, reader=None):
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return []
+    hits = []
+    for kind in kinds:
+        model, text, fields = KINDS[kind]
+        condition = Q()
+        for term in terms:
+            condition &= Q(*[Q(**{f'{field}__icontains': term}) for field in fields], _connector=Q.OR)
+        if reader is not None:
+            condition &= changes.readable(kind, reader)
+        for obj in model.objects.filter(condition).order_by('-pk')[:offset + limit]:
+            title, body = text(obj)
+            hits.append({'kind': kind, 'id': obj.pk, 'title': title, 'snippet': body[:120]})
+    return hits[offset:offset + limit]
+
+
+@receiver(post_save, sender=Assignment)
+@receiver(post_save, sender=Subtask)
+@receiver(post_save, sender=Submission)
+@receiver(post_save, sender=Review)
+def _indexed_object_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index([instance])
+
+
+@receiver(post_delete, sender=Assignment)
+@receiver(post_delete, sender=Subtask)
+@receiver(post_delete, sender=Submission)
+@receiver(post_delete, sender=Review)
+def _indexed_object_deleted(sender, instance, **kwargs):
+    unindex(MODEL_KINDS[sender], [instance.pk])
+
+
+@receiver(rows_bulk_saved, sender=Submission)
+@receiver(rows_bulk_saved, sender=Review)
+def _indexed_objects_bulk_saved(sender, instances, **kwargs):
+    index(instances)
@@ -0,0 +1,142 @@
+import random
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache, changes, reviewees, roles, rollup, search
+from .models import Assignment, Review, ReviewComment, Submission, Subtask, Team, User
+
+# Synthetic data for benchmarks and load tests. Everything is written with
+# bulk_create, then the derived tables (review summary, effective reviewees,
+# search index, sync change log) are rebuilt once and the response cache is
+# invalidated, since bulk writes skip their signals.
+
+SCALES = {
+    'small': dict(users=200, teams=10, assignments=5, subtasks=3, reviewees_per_assignment=20, iterations=2),
+    'medium': dict(users=2000, teams=100, assignments=40, subtasks=4, reviewees_per_assignment=50, iterations=3),
+    'large': dict(users=20000, teams=1000, assignments=200, subtasks=5, reviewees_per_assignment=100, iterations=4),
+}
+
+LOREM = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore '
+         'et dolore magna aliqua parser lexer compiler database index cache review iteration design').split()
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(LOREM) for _ in range(words))
+
+
+def seed(users=2000, teams=100, team_size=8, assignments=40, subtasks=4, reviewees_per_assignment=50,
+         teams_per_assignment=3, iterations=3, reviewed_fraction=0.7, comments_per_review=2,
+         reviewer_fraction=0.05, batch_size=1000, random_seed=0, password='password'):
+    rng = random.Random(random_seed)
+    prefix = f'seed-{uuid.uuid4().hex[:8]}'
+    now = timezone.now()
+
+    with transaction.atomic():
+        password_hash = make_password(password)
+        user_objs = User.objects.bulk_create([
+            User(username=f'{prefix}-user-{i}', email=f'{prefix}-user-{i}@example.com', password=password_hash,
+                 first_name=f'First{i}', second_name=f'Second{i}')
+            for i in range(users)
+        ], batch_size=batch_size)
+        user_ids = [user.pk for user in user_objs]
+        reviewer_count = max(1, int(users * reviewer_fraction))
+        reviewer_ids, reviewee_ids = user_ids[:reviewer_count], user_ids[reviewer_count:] or user_ids
+        UserRoles = User.roles.through
+        reviewer_role, reviewee_role = roles.get_role('reviewer'), roles.get_role('reviewee')
+        UserRoles.objects.bulk_create(
+            [UserRoles(user_id=pk, role_id=reviewer_role.pk) for pk in reviewer_ids]
+            + [UserRoles(user_id=pk, role_id=reviewee_role.pk) for pk in reviewee_ids],
+            batch_size=batch_size,
+        )
+
+        team_objs = Team.objects.bulk_create(
+            [Team(team_name=f'{prefix}-team-{i}') for i in range(teams)], batch_size=batch_size,
+        )
+        team_ids = [team.pk for team in team_objs]
+        TeamMembers = User.teams.through
+        TeamMembers.objects.bulk_create([
+            TeamMembers(team_id=team_id, user_id=user_id)
+            for team_id in team_ids
+            for user_id in rng.sample(reviewee_ids, min(team_size, len(reviewee_ids)))
+        ], batch_size=batch_size)
+
+        assignment_objs = Assignment.objects.bulk_create([
+            Assignment(title=f'Assignment {i} {_text(rng, 3)}', description=_text(rng, 40),
+                       created_by_id=rng.choice(reviewer_ids))
+            for i in range(assignments)
+        ], batch_size=batch_size)
+        IndividualReviewees = Assignment.individual_reviewees.through
+        TeamReviewees = Assignment.team_reviewees.through
+        assignment_reviewees = {
+            assignment.pk: rng.sample(reviewee_ids, min(reviewees_per_assignment, len(reviewee_ids)))
+            for assignment in assignment_objs
+        }
+        IndividualReviewees.objects.bulk_create([
+            IndividualReviewees(assignment_id=assignment_id, user_id=user_id)
+            for assignment_id, members in assignment_reviewees.items() for user_id in members
+        ], batch_size=batch_size)
+        TeamReviewees.objects.bulk_create([
+            TeamReviewees(assignment_id=assignment.pk, team_id=team_id)
+            for assignment in assignment_objs
+            for team_id in rng.sample(team_ids, min(teams_per_assignment, len(team_ids)))
+        ], batch_size=batch_size)
+
+        subtask_objs = Subtask.objects.bulk_create([
+            Subtask(title=f'Subtask {j}', description=_text(rng, 25), assignment_id=assignment.pk,
+                    due_date=now + timedelta(days=rng.randint(1, 90)))
+            for assignment in assignment_objs for j in range(subtasks)
+        ], batch_size=batch_size)
+
+        # Iteration k of every (subtask, reviewee); all but the last iteration
+        # were sent back, the last one is reviewed with reviewed_fraction.
+        submission_objs, latest = [], set()
+        for subtask in subtask_objs:
+            for user_id in assignment_reviewees[subtask.assignment_id]:
+                for k in range(iterations):
+                    submission_objs.append(Submission(
+                        submission_description=_text(rng, 20), files_link=f'https://example.com/{prefix}/{k}',
+                        subtask_id=subtask.pk, reviewee_id=user_id,
+                    ))
+                latest.add(len(submission_objs) - 1)
+        submission_objs = Submission.objects.bulk_create(submission_objs, batch_size=batch_size)
+
+        review_objs = []
+        for index, submission in enumerate(submission_objs):
+            is_latest = index in latest
+            if is_latest and rng.random() > reviewed_fraction:
+                continue
+            review_objs.append(Review(
+                review_content=_text(rng, 30), additional_comments=_text(rng, 8) if rng.random() < 0.3 else None,
+                status='passed' if is_latest else 'suggest_iteration',
+                submission_id=submission.pk, reviewer_id=rng.choice(reviewer_ids),
+            ))
+        review_objs = Review.objects.bulk_create(review_objs, batch_size=batch_size)
+
+        comment_ids = []
+        comment_batch = []
+        for review in review_objs:
+            for _ in range(comments_per_review):
+                comment_batch.append(ReviewComment(comment=_text(rng, 12), review_id=review.pk,
+                                                   commenter_id=rng.choice(reviewer_ids)))
+            if len(comment_batch) >= batch_size:
+                comment_ids.extend(obj.pk for obj in ReviewComment.objects.bulk_create(comment_batch, batch_size=batch_size))
+                comment_batch = []
+        comment_ids.extend(obj.pk for obj in ReviewComment.objects.bulk_create(comment_batch, batch_size=batch_size))
+
+        rollup.rebuild([subtask.pk for subtask in subtask_objs])
+        reviewees.sync(assignment_ids=list(assignment_reviewees))
+        search.reindex()
+        for model, objs in [(Assignment, assignment_objs), (Subtask, subtask_objs), (Submission, submission_objs),
+                            (Review, review_objs)]:
+            changes.record(model, [obj.pk for obj in objs])
+        changes.record(ReviewComment, comment_ids)
+        cache.bump(cache.ASSIGNMENTS, cache.MEMBERSHIPS)
+
+    counts = dict(users=len(user_objs), teams=len(team_objs), assignments=len(assignment_objs),
+                  subtasks=len(subtask_objs), submissions=len(submission_objs), reviews=len(review_objs),
+                  comments=len(comment_ids))
+    return prefix, counts
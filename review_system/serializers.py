@@ -1,11 +1,251 @@
+import copy
+from typing import NamedTuple
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db import transaction
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from .models import User, Role, Team, Assignment, Submission, Subtask, Review, ReviewComment, Attachment
+from .roles import set_user_roles
+from .signals import rows_bulk_saved
+
+
+class ValuesSerializer:
+    # Read-only fast path for list endpoints. Produces exactly what
+    # ``serializer_class(objs, many=True).data`` would, but from
+    # QuerySet.values() rows: the field -> column mapping and the per-field
+    # conversion are worked out once per serializer class, and fields whose
+    # representation is the raw column value (ints, strings, choices, primary
+    # key relations) skip to_representation() entirely.
+    #
+    # ``fields`` keeps only those fields (and so only their columns), and
+    # ``expand`` inlines the EXPANSIONS of the serializer: a to-one relation is
+    # read from the same row through a JOIN, a to-many one is loaded for all
+    # the rows at once with one more query. Build shaped instances with
+    # shape(), which validates names before anything is cached.
+    _cache = {}
+
+    @classmethod
+    def for_serializer(cls, serializer_class, fields=None, expand=frozenset()):
+        key = (serializer_class, fields, expand)
+        instance = cls._cache.get(key)
+        if instance is None:
+            instance = cls._cache[key] = cls(serializer_class, fields, expand)
+        return instance
+
+    @classmethod
+    def shape(cls, serializer_class, fields=None, expand=None):
+        # ``fields``/``expand`` are lists of names from the query string, or
+        # None when the parameter is absent.
+        names = set(serializer_class().fields)
+        expansions = expansions_for(serializer_class)
+        errors = {}
+        if fields is not None and (not fields or set(fields) - names):
+            errors['fields'] = [f'Choose from: {", ".join(sorted(names))}.']
+        if expand is not None:
+            if set(expand) - set(expansions):
+                errors['expand'] = [f'Choose from: {", ".join(sorted(expansions)) or "nothing"}.']
+        if errors:
+            raise serializers.ValidationError(errors)
+        return cls.for_serializer(serializer_class, None if fields is None else frozenset(fields),
+                                  frozenset(expand or ()))
+
+    def __init__(self, serializer_class, fields=None, expand=frozenset(), prefix=''):
+        self.serializer_class = serializer_class
+        self.model = model = serializer_class.Meta.model
+        expansions = expansions_for(serializer_class)
+        self.fields = []  # (name, column, convert), or (name, None, nested ValuesSerializer)
+        self.many = []  # (name, Expansion)
+        for name, field in serializer_class().fields.items():
+            if fields is not None and name not in fields and name not in expand:
+                continue
+            if name in expand:
+                self.fields.append((name, None, ValuesSerializer(expansions[name].serializer_class,
+                                                                 prefix=f'{prefix}{field.source}__')))
+                continue
+            if isinstance(field, (serializers.BaseSerializer, serializers.ManyRelatedField)):
+                raise TypeError(f'{serializer_class.__name__}.{name} is nested and has no values() column')
+            try:
+                column = model._meta.get_field(field.source).attname
+            except FieldDoesNotExist:
+                column = field.source  # an annotation
+            if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+                convert = None
+            elif isinstance(field, serializers.RelatedField):
+                raise TypeError(f'{serializer_class.__name__}.{name} is not a primary key relation')
+            elif isinstance(field, (serializers.IntegerField, serializers.CharField, serializers.ChoiceField)):
+                convert = None
+            else:
+                convert = field.to_representation
+            self.fields.append((name, prefix + column, convert))
+        for name in sorted(expand):
+            if expansions[name].many:
+                self.many.append((name, expansions[name]))
+
+        self.pk_column = prefix + model._meta.pk.attname
+        self.columns = []
+        for _, column, nested in self.fields:
+            self.columns.extend(nested.columns if column is None else [column])
+        if (self.many or prefix) and self.pk_column not in self.columns:
+            self.columns.append(self.pk_column)
+
+    def to_representation(self, rows):
+        rows = list(rows) if self.many else rows
+        data = [self.item(row) for row in rows]
+        for name, expansion in self.many:
+            child = ValuesSerializer.for_serializer(expansion.serializer_class)
+            model = expansion.serializer_class.Meta.model
+            related = {}
+            parent_ids = {row[self.pk_column] for row in rows}
+            children = (model.objects.filter(**{f'{expansion.fk}__in': parent_ids}).order_by(*expansion.ordering)
+                        .values(*child.columns, expansion.fk))
+            for child_row in children:
+                related.setdefault(child_row[expansion.fk], []).append(child.item(child_row))
+            for row, item in zip(rows, data):
+                item[name] = related.get(row[self.pk_column], [])
+        return data
+
+    def item(self, row):
+        item = {}
+        for name, column, convert in self.fields:
+            if column is None:
+                item[name] = None if row[convert.pk_column] is None else convert.item(row)
+                continue
+            value = row[column]
+            item[name] = value if convert is None or value is None else convert(value)
+        return item
+
+    def models(self):
+        # Models whose rows end up in the output through expansions.
+        found = [expansion.serializer_class.Meta.model for _, expansion in self.many]
+        for _, column, nested in self.fields:
+            if column is None:
+                found.append(nested.model)
+        return found
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    # Behaves like PrimaryKeyRelatedField, but when a BulkListSerializer has
+    # already fetched the related rows for the whole batch it looks the pk up
+    # in that dict instead of running one query per item.
+
+    def to_internal_value(self, data):
+        resolved = self.context.get('resolved_relations', {}).get(self.field_name)
+        if resolved is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = self.get_queryset().model._meta.pk.to_python(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return resolved[pk]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    # List serializer used by the batch endpoints. Every related pk in the batch
+    # is resolved with a single in_bulk() query per field, rows are written with
+    # bulk_create()/bulk_update(), and validation errors are reported per item,
+    # keyed by the item's index in the request.
+    #
+    # For updates, pass ``instance`` as a dict of pk -> object (e.g. the result
+    # of in_bulk()); each item must carry the model's primary key.
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            return super().to_internal_value(data)
+        if self.max_length is not None and len(data) > self.max_length:
+            message = self.error_messages['max_length'].format(max_length=self.max_length)
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [message]}, code='max_length')
+
+        self._resolve_relations(data)
+        pk_name = self.child.Meta.model._meta.pk.name
+        ret, errors, self._update_pks = [], {}, []
+        for index, item in enumerate(data):
+            if self.instance is not None:
+                pk = self._instance_pk(item, pk_name)
+                if pk not in self.instance:
+                    errors[index] = {pk_name: ['Object does not exist.']}
+                    continue
+                self.child.instance = self.instance[pk]
+                self._update_pks.append(pk)
+            try:
+                ret.append(self.run_child_validation(item))
+            except serializers.ValidationError as exc:
+                errors[index] = exc.detail
+        self.child.instance = None
+        if errors:
+            raise serializers.ValidationError(errors)
+        return ret
+
+    def _instance_pk(self, item, pk_name):
+        if not isinstance(item, dict):
+            return None
+        try:
+            return self.child.Meta.model._meta.pk.to_python(item.get(pk_name))
+        except DjangoValidationError:
+            return None
+
+    def _resolve_relations(self, data):
+        resolved = {}
+        for name, field in self.child.fields.items():
+            if field.read_only or not isinstance(field, BulkPrimaryKeyRelatedField):
+                continue
+            pk_field = field.get_queryset().model._meta.pk
+            pks = set()
+            for item in data:
+                value = item.get(name) if isinstance(item, dict) else None
+                if value is None or isinstance(value, bool):
+                    continue
+                try:
+                    pks.add(pk_field.to_python(value))
+                except (TypeError, ValueError, DjangoValidationError):
+                    continue
+            resolved[name] = field.get_queryset().in_bulk(pks) if pks else {}
+        self.context['resolved_relations'] = resolved
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        with transaction.atomic():
+            objs = model.objects.bulk_create([model(**attrs) for attrs in validated_data])
+            rows_bulk_saved.send(sender=model, instances=objs, created=True)
+        return objs
+
+    def update(self, instance, validated_data):
+        model = self.child.Meta.model
+        objs, previous, fields = [], [], set()
+        for pk, attrs in zip(self._update_pks, validated_data):
+            obj = instance[pk]
+            previous.append(copy.copy(obj))
+            for attr, value in attrs.items():
+                setattr(obj, attr, value)
+            fields.update(attrs)
+            objs.append(obj)
+        if fields:
+            # bulk_update() skips save(), so auto_now fields (updated_at) are
+            # stamped here or conditional GETs would keep answering 304.
+            for field in model._meta.concrete_fields:
+                if getattr(field, 'auto_now', False):
+                    for obj in objs:
+                        field.pre_save(obj, add=False)
+                    fields.add(field.name)
+        with transaction.atomic():
+            if fields:
+                model.objects.bulk_update(objs, sorted(fields))
+            rows_bulk_saved.send(sender=model, instances=objs, created=False, previous=previous)
+        return objs
 
 
 class RoleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Role
         fields = ['role_id', 'role_name']
+        # Roles are referenced by name when nested in UserSerializer, so the
+        # per-item uniqueness query would only reject existing roles.
+        extra_kwargs = {'role_name': {'validators': []}}
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -20,9 +260,7 @@ class UserSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         roles_data = validated_data.pop('roles', [])
         user = User.objects.create(**validated_data)
-        for role_data in roles_data:
-            role, _ = Role.objects.get_or_create(**role_data)
-            user.roles.add(role)
+        set_user_roles(user, [role_data['role_name'] for role_data in roles_data], created=True)
         return user
 
 
@@ -35,10 +273,7 @@ class UserSerializer(serializers.ModelSerializer):
 
 
         if roles_data:
-            instance.roles.clear()  # Clear existing roles
-            for role_data in roles_data:
-                role, _ = Role.objects.get_or_create(**role_data)
-                instance.roles.add(role)
+            set_user_roles(instance, [role_data['role_name'] for role_data in roles_data])
         return instance
 
 
@@ -91,13 +326,14 @@ class SubtaskSerializer(serializers.ModelSerializer):
 
 
 class SubmissionSerializer(serializers.ModelSerializer):
-    subtask = serializers.PrimaryKeyRelatedField(queryset=Subtask.objects.all())
-    reviewee = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+    subtask = BulkPrimaryKeyRelatedField(queryset=Subtask.objects.all())
+    reviewee = BulkPrimaryKeyRelatedField(queryset=User.objects.all())
 
 
     class Meta:
         model = Submission
         fields = ['submission_id', 'submission_description', 'files_link', 'submitted_at', 'subtask', 'reviewee']
+        list_serializer_class = BulkListSerializer
 
 
     def create(self, validated_data):
@@ -113,14 +349,23 @@ class SubmissionSerializer(serializers.ModelSerializer):
         return instance
 
 
+class ReviewQueueSerializer(SubmissionSerializer):
+    due_date = serializers.DateTimeField(read_only=True)
+
+
+    class Meta(SubmissionSerializer.Meta):
+        fields = SubmissionSerializer.Meta.fields + ['due_date']
+
+
 class ReviewSerializer(serializers.ModelSerializer):
-    submission = serializers.PrimaryKeyRelatedField(queryset=Submission.objects.all())
-    reviewer = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+    submission = BulkPrimaryKeyRelatedField(queryset=Submission.objects.all())
+    reviewer = BulkPrimaryKeyRelatedField(queryset=User.objects.all())
 
 
     class Meta:
         model = Review
         fields = ['review_id', 'review_content', 'additional_comments', 'reviewed_at', 'status', 'submission', 'reviewer']
+        list_serializer_class = BulkListSerializer
 
 
     def create(self, validated_data):
@@ -138,13 +383,14 @@ class ReviewSerializer(serializers.ModelSerializer):
 
 
 class ReviewCommentSerializer(serializers.ModelSerializer):
-    review = serializers.PrimaryKeyRelatedField(queryset=Review.objects.all())
-    commenter = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+    review = BulkPrimaryKeyRelatedField(queryset=Review.objects.all())
+    commenter = BulkPrimaryKeyRelatedField(queryset=User.objects.all())
 
 
     class Meta:
         model = ReviewComment
         fields = ['comment_id', 'comment', 'commented_at', 'review', 'commenter']
+        list_serializer_class = BulkListSerializer
 
 
     def create(self, validated_data):
@@ -167,7 +413,8 @@ class AttachmentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Attachment
-        fields = ['attachment_id', 'file', 'uploaded_at', 'submission', 'review', 'subtask']
+        fields = ['attachment_id', 'file', 'filename', 'uploaded_at', 'submission', 'review', 'subtask']
+        read_only_fields = ['filename']
 
 
     def create(self, validated_data):
@@ -181,3 +428,124 @@ class AttachmentSerializer(serializers.ModelSerializer):
         instance.subtask = validated_data.get('subtask', instance.subtask)
         instance.save()
         return instance
+
+
+# Read-only nested serializers for the assignment tree. These never issue
+# queries of their own: the views feed them querysets with every level
+# prefetched, see ``views.assignment_tree_queryset``.
+
+class ReviewTreeSerializer(ReviewSerializer):
+    comments = ReviewCommentSerializer(many=True, read_only=True)
+
+
+    class Meta(ReviewSerializer.Meta):
+        fields = ReviewSerializer.Meta.fields + ['comments']
+
+
+class SubmissionTreeSerializer(SubmissionSerializer):
+    reviews = ReviewTreeSerializer(many=True, read_only=True)
+
+
+    class Meta(SubmissionSerializer.Meta):
+        fields = SubmissionSerializer.Meta.fields + ['reviews']
+
+
+class SubtaskTreeSerializer(SubtaskSerializer):
+    submissions = SubmissionTreeSerializer(many=True, read_only=True)
+
+
+    class Meta(SubtaskSerializer.Meta):
+        fields = SubtaskSerializer.Meta.fields + ['submissions']
+
+
+class AssignmentTreeSerializer(AssignmentSerializer):
+    subtasks = SubtaskTreeSerializer(many=True, read_only=True)
+
+
+    class Meta(AssignmentSerializer.Meta):
+        fields = AssignmentSerializer.Meta.fields + ['subtasks']
+
+
+# Summary of a user for ?expand=, without contact details or roles.
+class UserSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['user_id', 'username', 'first_name', 'second_name']
+
+
+# What ?expand= may inline for each list serializer. A to-one expansion
+# replaces the serializer's primary key field of the same name; a to-many one
+# is added under its own name, with the rows whose ``fk`` points at the item.
+class Expansion(NamedTuple):
+    serializer_class: type
+    fk: str = None
+    ordering: tuple = ('pk',)
+
+    @property
+    def many(self):
+        return self.fk is not None
+
+
+EXPANSIONS = {
+    AssignmentSerializer: {
+        'created_by': Expansion(UserSummarySerializer),
+        'subtasks': Expansion(SubtaskSerializer, fk='assignment_id'),
+    },
+    SubtaskSerializer: {
+        'assignment': Expansion(AssignmentSerializer),
+        'submissions': Expansion(SubmissionSerializer, fk='subtask_id'),
+    },
+    SubmissionSerializer: {
+        'subtask': Expansion(SubtaskSerializer),
+        'reviewee': Expansion(UserSummarySerializer),
+        'reviews': Expansion(ReviewSerializer, fk='submission_id'),
+    },
+    ReviewSerializer: {
+        'submission': Expansion(SubmissionSerializer),
+        'reviewer': Expansion(UserSummarySerializer),
+        'comments': Expansion(ReviewCommentSerializer, fk='review_id'),
+    },
+    ReviewCommentSerializer: {
+        'review': Expansion(ReviewSerializer),
+        'commenter': Expansion(UserSummarySerializer),
+    },
+}
+
+
+def expansions_for(serializer_class):
+    # Subclasses (e.g. ReviewQueueSerializer) inherit their base's expansions.
+    for klass in serializer_class.__mro__:
+        if klass in EXPANSIONS:
+            return EXPANSIONS[klass]
+    return {}
+
+
+class ReviewBatchSerializer(serializers.Serializer):
+    # A review with its comments and attachments, created together by
+    # ReviewBatchView. Comments are written with one bulk INSERT.
+    review = ReviewSerializer()
+    comments = serializers.ListField(child=serializers.CharField(), max_length=100, required=False)
+    attachments = serializers.ListField(child=serializers.FileField(), max_length=20, required=False)
+
+
+    def create(self, validated_data):
+        commenter = validated_data['review']['reviewer']
+        with transaction.atomic():
+            review = Review.objects.create(**validated_data['review'])
+            comments = ReviewComment.objects.bulk_create([
+                ReviewComment(comment=comment, review=review, commenter=commenter)
+                for comment in validated_data.get('comments', [])
+            ])
+            if comments:
+                rows_bulk_saved.send(sender=ReviewComment, instances=comments, created=True)
+            attachments = [Attachment.objects.create(review=review, file=file)
+                           for file in validated_data.get('attachments', [])]
+        return {'review': review, 'comments': comments, 'attachments': attachments}
+
+
+    def to_representation(self, instance):
+        return {
+            'review': ReviewSerializer(instance['review']).data,
+            'comments': ReviewCommentSerializer(instance['comments'], many=True).data,
+            'attachments': AttachmentSerializer(instance['attachments'], many=True, context=self.context).data,
+        }
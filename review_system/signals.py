@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+# bulk_create()/bulk_update() do not send post_save, so the batch endpoints
+# send this once per write instead. Receivers get ``instances`` (the saved
+# objects) and ``created`` (True for inserts, False for updates). Updates also
+# pass ``previous``, shallow copies of the objects as they were loaded.
+rows_bulk_saved = Signal()
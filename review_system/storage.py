@@ -0,0 +1,114 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, storages
+
+# Content-addressed file storage for attachments. Every file is stored once,
+# at blobs/<aa>/<bb>/<sha256>, whatever name it was uploaded under; the
+# Attachment keeps the original name. Uploads are hashed in chunks, so memory
+# per upload is bounded by the chunk size:
+#   - an upload Django already spooled to disk is hashed in place and then
+#     moved into the blob path, or simply dropped if that content is stored;
+#   - anything else is streamed into a temporary file while being hashed.
+# Reference counts live in the Blob table (review_system.blobs); unreferenced
+# blobs are removed by the gc_blobs command, never by delete().
+
+BLOB_PREFIX = 'blobs'
+BLOB_NAME = re.compile(r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})$')
+TEMP_PREFIX = '.upload-'
+
+
+def blob_name(sha256):
+    return f'{BLOB_PREFIX}/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+
+def blob_sha256(name):
+    # The content hash a stored name refers to, or None for names that are not
+    # blobs (files uploaded before content addressing).
+    match = BLOB_NAME.match(name or '')
+    return match.group(1) if match else None
+
+
+def attachment_storage():
+    return storages['attachments']
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # The stored name is picked in _save() from the content.
+        return name
+
+    def _save(self, name, content):
+        os.makedirs(self.path(BLOB_PREFIX), exist_ok=True)
+        if hasattr(content, 'temporary_file_path'):
+            source, owned = content.temporary_file_path(), False
+            digest = self._hash_file(source)
+        else:
+            (digest, source), owned = self._spool(content), True
+        name = blob_name(digest)
+        path = self.path(name)
+        try:
+            try:
+                # Touching is also the existence check: a fresh mtime keeps the
+                # blob clear of gc_blobs, and one it already moved aside is
+                # stored again.
+                os.utime(path)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if owned:
+                    os.replace(source, path)
+                    source = None
+                else:
+                    file_move_safe(source, path, allow_overwrite=True)
+                os.chmod(path, self.file_permissions_mode or 0o644)
+        finally:
+            if owned and source is not None:
+                os.unlink(source)
+        return name
+
+    def delete(self, name):
+        # Blobs are shared between attachments; see purge().
+        if blob_sha256(name) is None:
+            super().delete(name)
+
+    def purge(self, name, cutoff):
+        # Delete ``name`` unless it was touched at or after ``cutoff`` (a
+        # timestamp); returns False if it was kept. The file is moved aside
+        # before its mtime is read, so an upload touching it either shows in
+        # that mtime or finds it gone and stores its own copy.
+        path = self.path(name)
+        retired = os.path.join(os.path.dirname(path), TEMP_PREFIX + os.path.basename(path))
+        try:
+            os.replace(path, retired)
+        except FileNotFoundError:
+            return True
+        if os.path.getmtime(retired) >= cutoff:
+            os.replace(retired, path)
+            return False
+        os.unlink(retired)
+        return True
+
+    def _hash_file(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _spool(self, content):
+        # Stream ``content`` into a temporary file next to the blobs while
+        # hashing it; returns (sha256, temporary path).
+        digest = hashlib.sha256()
+        fd, path = tempfile.mkstemp(dir=self.path(BLOB_PREFIX), prefix=TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            os.unlink(path)
+            raise
+        return digest.hexdigest(), path
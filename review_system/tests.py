@@ -1,3 +1,1805 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import timedelta
+from io import StringIO
+from urllib.parse import parse_qs, urlparse
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, OperationalError, connection, connections
+from django.http import HttpResponse
+from django.test import AsyncClient, Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import benchmarks, blobs, cache, db, export, hashing, jobs, oauth, push, reviewees, roles, rollup, search, seed, tokens
+from .metrics import registry
+from .middleware import PerformanceMiddleware, QueryRecorder, fingerprint
+from .models import User, Role, Team, Assignment, AssignmentReviewee, Attachment, AuthToken, Blob, Change, IdempotencyKey, Job, Subtask, Submission, Review, ReviewComment, SubtaskReviewSummary
+from .renderers import FastJSONRenderer
+from .storage import blob_name
+from .serializers import ReviewCommentSerializer, ReviewSerializer, SubmissionSerializer, UserSerializer, ValuesSerializer
+
+
+def make_user(username, password=None, **extra):
+    return User.objects.create_user(username=username, email=f'{username}@example.com', password=password, **extra)
+
+
+def login_as(client, user, *role_names):
+    roles.set_user_roles(user, role_names, created=True)
+    client.force_authenticate(user)
+    return client
+
+
+def make_assignment_tree(creator, reviewer, reviewee, subtasks=1, submissions=1, reviews=1, comments=1):
+    assignment = Assignment.objects.create(title='Assignment', description='Build it', created_by=creator)
+    for i in range(subtasks):
+        subtask = Subtask.objects.create(
+            title=f'Subtask {i}', description='Part', assignment=assignment,
+            due_date=timezone.now() + timedelta(days=i + 1),
+        )
+        for _ in range(submissions):
+            submission = Submission.objects.create(
+                submission_description='Done', files_link='https://example.com/files',
+                subtask=subtask, reviewee=reviewee,
+            )
+            for _ in range(reviews):
+                review = Review.objects.create(
+                    review_content='Looks good', status='passed', submission=submission, reviewer=reviewer,
+                )
+                for _ in range(comments):
+                    ReviewComment.objects.create(comment='Nice', review=review, commenter=reviewer)
+    return assignment
+
+
+class AssignmentTreeTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('staff', is_staff=True))
+        self.creator = make_user('creator')
+        self.reviewer = make_user('reviewer')
+        self.reviewee = make_user('reviewee')
+
+    def test_detail_returns_nested_tree(self):
+        assignment = make_assignment_tree(self.creator, self.reviewer, self.reviewee)
+        response = self.client.get(reverse('assignment-detail', args=[assignment.pk]))
+        self.assertEqual(response.status_code, 200)
+        subtask = response.data['subtasks'][0]
+        review = subtask['submissions'][0]['reviews'][0]
+        self.assertEqual(review['status'], 'passed')
+        self.assertEqual(review['comments'][0]['comment'], 'Nice')
+
+    def test_list_query_count_does_not_grow_with_rows(self):
+        make_assignment_tree(self.creator, self.reviewer, self.reviewee)
+        with self.assertNumQueries(6):
+            self.client.get(reverse('assignment-list'))
+
+        for _ in range(3):
+            make_assignment_tree(self.creator, self.reviewer, self.reviewee, subtasks=3, submissions=2, reviews=2, comments=2)
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('assignment-list'))
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_list_pages_newest_first(self):
+        assignments = [make_assignment_tree(self.creator, self.reviewer, self.reviewee) for _ in range(3)]
+        response = self.client.get(reverse('assignment-list'), {'page_size': 2})
+        self.assertEqual([row['assignment_id'] for row in response.data['results']],
+                         [assignments[2].pk, assignments[1].pk])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['assignment_id'] for row in response.data['results']], [assignments[0].pk])
+        self.assertIsNone(response.data['next'])
+
+    def test_trees_are_scoped_to_what_the_caller_may_read(self):
+        roles.invalidate()
+        given = make_assignment_tree(self.creator, self.reviewer, self.reviewee)
+        given.individual_reviewees.add(self.reviewee, make_user('classmate'))
+        classmate = User.objects.get(username='classmate')
+        other = make_assignment_tree(self.creator, self.reviewer, classmate)
+        Submission.objects.create(submission_description='Theirs', files_link='https://example.com/t',
+                                  subtask=given.subtasks.get(), reviewee=classmate)
+        self.assertEqual(APIClient().get(reverse('assignment-list')).status_code, 401)
+        self.assertEqual(APIClient().get(reverse('assignment-detail', args=[given.pk])).status_code, 401)
+
+        client = login_as(APIClient(), self.reviewee, 'reviewee')
+        results = client.get(reverse('assignment-list')).data['results']
+        self.assertEqual([row['assignment_id'] for row in results], [given.pk])
+        submissions = results[0]['subtasks'][0]['submissions']
+        self.assertEqual([row['reviewee'] for row in submissions], [self.reviewee.pk])
+        self.assertEqual(client.get(reverse('assignment-detail', args=[other.pk])).status_code, 404)
+
+        client = login_as(APIClient(), self.creator)
+        results = client.get(reverse('assignment-list')).data['results']
+        self.assertEqual({row['assignment_id'] for row in results}, {given.pk, other.pk})
+        self.assertEqual(len(client.get(reverse('assignment-detail', args=[given.pk])).data['subtasks'][0]['submissions']), 2)
+
+
+class BulkWriteTests(TestCase):
+    def setUp(self):
+        roles.invalidate()
+        self.client = APIClient()
+        self.creator = make_user('creator')
+        self.reviewer = make_user('reviewer')
+        self.reviewee = make_user('reviewee')
+        roles.set_user_roles(self.reviewer, ['reviewer'], created=True)
+        login_as(self.client, self.reviewee, 'reviewee')
+        self.assignment = make_assignment_tree(self.creator, self.reviewer, self.reviewee, reviews=0)
+        self.subtask = self.assignment.subtasks.get()
+
+    def submission_payload(self, count):
+        return [
+            {'submission_description': f'Iteration {i}', 'files_link': 'https://example.com/f',
+             'subtask': self.subtask.pk, 'reviewee': self.reviewee.pk}
+            for i in range(count)
+        ]
+
+    def test_bulk_create_query_count_is_constant(self):
+        url = reverse('submission-bulk')
+        with self.assertNumQueries(13):
+            response = self.client.post(url, self.submission_payload(2), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.client.force_authenticate(User.objects.get(pk=self.reviewee.pk))  # roles are cached per user object
+        with self.assertNumQueries(13):
+            response = self.client.post(url, self.submission_payload(50), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Submission.objects.count(), 53)
+
+    def test_bulk_create_reports_errors_per_item_and_writes_nothing(self):
+        payload = [
+            {'review_content': 'ok', 'status': 'passed', 'submission': Submission.objects.get().pk, 'reviewer': self.reviewer.pk},
+            {'review_content': 'bad', 'status': 'passed', 'submission': 9999, 'reviewer': self.reviewer.pk},
+        ]
+        self.client.force_authenticate(self.reviewer)
+        response = self.client.post(reverse('review-bulk'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.data['errors']), [1])
+        self.assertIn('submission', response.data['errors'][1])
+        self.assertFalse(Review.objects.exists())
+
+    def test_bulk_update(self):
+        submissions = Submission.objects.bulk_create(
+            Submission(submission_description='x', files_link='https://example.com/f', subtask=self.subtask, reviewee=self.reviewee)
+            for _ in range(3)
+        )
+        payload = [{'submission_id': s.pk, 'submission_description': 'updated'} for s in submissions]
+        payload.append({'submission_id': 9999, 'submission_description': 'missing'})
+        response = self.client.patch(reverse('submission-bulk'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.data['errors']), [3])
+
+        response = self.client.patch(reverse('submission-bulk'), payload[:3], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Submission.objects.filter(submission_description='updated').count(), 3)
+
+    def test_actor_is_the_requesting_user(self):
+        submission = Submission.objects.get()
+        payload = [{'review_content': 'ok', 'status': 'passed', 'submission': submission.pk, 'reviewer': self.creator.pk}]
+        self.assertEqual(self.client.post(reverse('review-bulk'), payload, format='json').status_code, 403)
+        self.assertEqual(APIClient().post(reverse('comment-bulk'), [], format='json').status_code, 401)
+
+        self.client.force_authenticate(self.reviewer)
+        response = self.client.post(reverse('review-bulk'), payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Review.objects.get().reviewer, self.reviewer)
+
+        login_as(self.client, self.creator, 'reviewee')
+        response = self.client.patch(reverse('submission-bulk'), [
+            {'submission_id': submission.pk, 'submission_description': 'hijacked'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Submission.objects.get().submission_description, 'Done')
+
+
+class RoleRegistryTests(TestCase):
+    def setUp(self):
+        roles.invalidate()
+        for name, _ in Role.ROLE_CHOICES:
+            Role.objects.create(role_name=name)
+
+    def test_registry_is_loaded_once_and_invalidated_on_save(self):
+        with self.assertNumQueries(1):
+            roles.get_role('reviewer')
+            roles.get_role('admin')
+        Role.objects.filter(role_name='admin').delete()
+        with self.assertNumQueries(1):
+            self.assertNotIn('admin', roles.get_roles())
+
+    def test_registry_is_dropped_again_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Role.objects.filter(role_name='admin').delete()
+            roles.get_roles()  # reloaded inside the writing transaction
+        with self.assertNumQueries(1):
+            roles.get_roles()
+
+    def test_user_serializer_writes_roles_with_constant_queries(self):
+        roles.get_roles()
+        data = {'first_name': 'Ada', 'second_name': 'L', 'email': 'ada@example.com',
+                'roles': [{'role_name': 'reviewer'}, {'role_name': 'reviewee'}]}
+        serializer = UserSerializer(data=data)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.assertNumQueries(2):
+            user = serializer.save()
+        self.assertEqual(set(user.roles.values_list('role_name', flat=True)), {'reviewer', 'reviewee'})
+
+        serializer = UserSerializer(user, data={'roles': [{'role_name': 'reviewer'}, {'role_name': 'admin'}]}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.assertNumQueries(4):
+            serializer.save()
+        self.assertEqual(set(user.roles.values_list('role_name', flat=True)), {'reviewer', 'admin'})
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('staff', is_staff=True))
+        creator, reviewer, reviewee = make_user('creator'), make_user('reviewer'), make_user('reviewee')
+        self.subtask = make_assignment_tree(creator, reviewer, reviewee, submissions=0).subtasks.get()
+        same_time = timezone.now()
+        submissions = Submission.objects.bulk_create(
+            Submission(submission_description=str(i), files_link='https://example.com/f', subtask=self.subtask, reviewee=reviewee)
+            for i in range(7)
+        )
+        # Ties on the timestamp must still page deterministically by pk.
+        Submission.objects.filter(pk__in=[s.pk for s in submissions]).update(submitted_at=same_time)
+
+    def test_pages_walk_every_row_once_in_order(self):
+        url = reverse('submission-list') + f'?subtask={self.subtask.pk}&page_size=3'
+        seen = []
+        while url:
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item['submission_id'] for item in response.data['results'])
+            url = response.data['next']
+        expected = list(Submission.objects.order_by('-submitted_at', '-submission_id').values_list('submission_id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_deep_page_query_uses_keyset_index(self):
+        queryset = Submission.objects.filter(subtask=self.subtask).order_by('-submitted_at', '-submission_id')
+        plan = queryset.explain()
+        self.assertIn('submission_subtask_keyset', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_creating_requires_a_role_and_records_the_user(self):
+        roles.invalidate()
+        reviewee = User.objects.get(username='reviewee')
+        payload = {'submission_description': 'New', 'files_link': 'https://example.com/n',
+                   'subtask': self.subtask.pk, 'reviewee': User.objects.get(username='creator').pk}
+        self.assertEqual(APIClient().post(reverse('submission-list'), payload).status_code, 401)
+        login_as(self.client, User.objects.get(username='reviewer'), 'reviewer')
+        self.assertEqual(self.client.post(reverse('submission-list'), payload).status_code, 403)
+        login_as(self.client, reviewee, 'reviewee')
+        response = self.client.post(reverse('submission-list'), payload)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['reviewee'], reviewee.pk)
+
+    def test_listing_is_scoped_to_what_the_caller_may_read(self):
+        roles.invalidate()
+        reviewee = User.objects.get(username='reviewee')
+        submission = Submission.objects.create(submission_description='Mine', files_link='https://example.com/m',
+                                               subtask=self.subtask, reviewee=reviewee)
+        review = Review.objects.create(review_content='secret feedback', status='passed', submission=submission,
+                                       reviewer=User.objects.get(username='reviewer'))
+        ReviewComment.objects.create(comment='Also secret', review=review, commenter=review.reviewer)
+        for name in ('submission-list', 'review-list', 'comment-list'):
+            self.assertEqual(APIClient().get(reverse(name)).status_code, 401)
+
+        stranger = login_as(APIClient(), make_user('stranger'), 'reviewee')
+        for name in ('submission-list', 'review-list', 'comment-list'):
+            self.assertEqual(stranger.get(reverse(name)).json()['results'], [])
+        owner = login_as(APIClient(), reviewee, 'reviewee')
+        self.assertEqual([row['review_id'] for row in owner.get(reverse('review-list')).json()['results']], [review.pk])
+        self.assertEqual(len(owner.get(reverse('comment-list')).json()['results']), 1)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('review-list') + '?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+    def test_non_ascii_digits_are_rejected(self):
+        self.assertEqual(self.client.get(reverse('submission-list'), {'subtask': '²'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('subtask-list'), {'assignment': '²'}).status_code, 400)
+
+
+class ReviewSummaryTests(TestCase):
+    def setUp(self):
+        self.creator, self.reviewer, self.reviewee = make_user('creator'), make_user('reviewer'), make_user('reviewee')
+        self.assignment = make_assignment_tree(self.creator, self.reviewer, self.reviewee, subtasks=2, submissions=2, reviews=0)
+        self.subtask = self.assignment.subtasks.order_by('pk').first()
+
+    def summary(self):
+        return SubtaskReviewSummary.objects.values('pending_count', 'passed_count', 'suggest_iteration_count').get(subtask=self.subtask)
+
+    def test_counts_follow_latest_review(self):
+        submission = self.subtask.submissions.first()
+        self.assertEqual(self.summary(), {'pending_count': 2, 'passed_count': 0, 'suggest_iteration_count': 0})
+
+        first = Review.objects.create(review_content='x', status='suggest_iteration', submission=submission, reviewer=self.reviewer)
+        self.assertEqual(self.summary(), {'pending_count': 1, 'passed_count': 0, 'suggest_iteration_count': 1})
+
+        latest = Review.objects.create(review_content='y', status='passed', submission=submission, reviewer=self.reviewer)
+        self.assertEqual(self.summary(), {'pending_count': 1, 'passed_count': 1, 'suggest_iteration_count': 0})
+
+        latest.delete()
+        self.assertEqual(self.summary(), {'pending_count': 1, 'passed_count': 0, 'suggest_iteration_count': 1})
+        first.status = 'passed'
+        first.save()
+        self.assertEqual(self.summary(), {'pending_count': 1, 'passed_count': 1, 'suggest_iteration_count': 0})
+
+        submission.delete()
+        self.assertEqual(self.summary(), {'pending_count': 1, 'passed_count': 0, 'suggest_iteration_count': 0})
+        self.assertEqual(rollup.verify(), {})
+
+    def test_bulk_writes_and_cascades_stay_consistent(self):
+        payload = [{'review_content': 'ok', 'status': 'passed', 'submission': s.pk, 'reviewer': self.reviewer.pk}
+                   for s in Submission.objects.all()]
+        roles.invalidate()
+        client = login_as(APIClient(), self.reviewer, 'reviewer')
+        self.assertEqual(client.post(reverse('review-bulk'), payload, format='json').status_code, 201)
+        self.assertEqual(self.summary()['passed_count'], 2)
+        self.assertEqual(rollup.verify(), {})
+
+        self.subtask.delete()
+        self.assertEqual(rollup.verify(), {})
+        self.assignment.delete()
+        self.assertFalse(SubtaskReviewSummary.objects.exists())
+
+    def test_bulk_updates_apply_deltas_without_rebuilding(self):
+        first, second = self.subtask.submissions.order_by('pk')
+        older = Review.objects.create(review_content='x', status='passed', submission=first, reviewer=self.reviewer)
+        newer = Review.objects.create(review_content='x', status='suggest_iteration', submission=first, reviewer=self.reviewer)
+        roles.invalidate()
+        client = login_as(APIClient(), self.reviewer, 'reviewer')
+        with mock.patch.object(rollup, 'rebuild', wraps=rollup.rebuild) as rebuild:
+            response = client.patch(reverse('review-bulk'), [
+                {'review_id': newer.pk, 'submission': second.pk},
+                {'review_id': older.pk, 'status': 'suggest_iteration'},
+            ], format='json')
+        self.assertEqual(response.status_code, 200)
+        rebuild.assert_not_called()
+        self.assertEqual(self.summary(), {'pending_count': 0, 'passed_count': 0, 'suggest_iteration_count': 2})
+        self.assertEqual(rollup.verify(), {})
+
+    def test_deleting_several_reviews_at_once_counts_each_submission_once(self):
+        first, second = self.subtask.submissions.order_by('pk')
+        for status in ('suggest_iteration', 'passed', 'passed'):
+            Review.objects.create(review_content='x', status=status, submission=first, reviewer=self.reviewer)
+        Review.objects.create(review_content='x', status='passed', submission=second, reviewer=self.reviewer)
+        self.assertEqual(self.summary(), {'pending_count': 0, 'passed_count': 2, 'suggest_iteration_count': 0})
+
+        Review.objects.filter(submission__subtask=self.subtask).delete()
+        self.assertEqual(self.summary(), {'pending_count': 2, 'passed_count': 0, 'suggest_iteration_count': 0})
+        for _ in range(2):
+            Review.objects.create(review_content='x', status='passed', submission=first, reviewer=self.reviewer)
+        first.delete()
+        self.assertEqual(self.summary(), {'pending_count': 1, 'passed_count': 0, 'suggest_iteration_count': 0})
+        self.assertEqual(rollup.verify(), {})
+        self.reviewer.delete()
+        self.assertEqual(rollup.verify(), {})
+
+    def test_command_rebuilds_and_verifies(self):
+        SubtaskReviewSummary.objects.update(pending_count=99)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_review_summary', '--verify', stdout=StringIO(), stderr=StringIO())
+        call_command('rebuild_review_summary', stdout=StringIO())
+        self.assertEqual(self.summary()['pending_count'], 2)
+        call_command('rebuild_review_summary', '--verify', stdout=StringIO())
+
+
+class ReviewQueueTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.creator, self.reviewer = make_user('creator'), make_user('reviewer')
+        self.reviewees = [make_user(f'reviewee{i}') for i in range(3)]
+        self.assignment = make_assignment_tree(self.creator, self.reviewer, self.reviewees[0], subtasks=2, submissions=0)
+        self.subtasks = list(self.assignment.subtasks.order_by('due_date'))
+        roles.invalidate()
+        roles.set_user_roles(self.reviewer, ['reviewer'], created=True)
+        token, _ = tokens.issue(self.reviewer)
+        tokens.resolve(token)  # warm the principal cache
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+
+    def submit(self, subtask, reviewee, iterations=1, reviewed=False):
+        latest = None
+        for _ in range(iterations):
+            latest = Submission.objects.create(submission_description='x', files_link='https://example.com/f',
+                                               subtask=subtask, reviewee=reviewee)
+        if reviewed:
+            Review.objects.create(review_content='x', status='passed', submission=latest, reviewer=self.reviewer)
+        return latest
+
+    def test_queue_holds_latest_unreviewed_iteration_ordered_by_due_date(self):
+        later = self.submit(self.subtasks[1], self.reviewees[0], iterations=3)
+        sooner = self.submit(self.subtasks[0], self.reviewees[1], iterations=2)
+        self.submit(self.subtasks[0], self.reviewees[2], reviewed=True)
+
+        response = self.client.get(reverse('review-queue'))
+        self.assertEqual([item['submission_id'] for item in response.data['results']], [sooner.pk, later.pk])
+
+        # A new iteration after a review puts the reviewee back in the queue.
+        again = self.submit(self.subtasks[0], self.reviewees[2])
+        response = self.client.get(reverse('review-queue') + f'?subtask={self.subtasks[0].pk}&page_size=1')
+        page = [item['submission_id'] for item in response.data['results']]
+        response = self.client.get(response.data['next'])
+        page += [item['submission_id'] for item in response.data['results']]
+        self.assertEqual(page, [sooner.pk, again.pk])
+
+    def test_etag_covers_due_dates_and_reviews(self):
+        submission = self.submit(self.subtasks[0], self.reviewees[0])
+        url = reverse('review-queue') + f'?assignment={self.assignment.pk}'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.subtasks[0].due_date += timedelta(days=3)
+        self.subtasks[0].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        Review.objects.create(review_content='x', status='passed', submission=submission, reviewer=self.reviewer)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+    def test_query_count_is_flat_as_history_grows(self):
+        for reviewee in self.reviewees:
+            self.submit(self.subtasks[0], reviewee)
+        with self.assertNumQueries(2):
+            self.client.get(reverse('review-queue'))
+        for reviewee in self.reviewees:
+            self.submit(self.subtasks[0], reviewee, iterations=5, reviewed=True)
+            self.submit(self.subtasks[0], reviewee)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('review-queue'))
+        self.assertEqual(len(response.data['results']), 3)
+
+
+class AssignmentRevieweeTests(TestCase):
+    def setUp(self):
+        self.creator = make_user('creator')
+        self.alice, self.bob = make_user('alice'), make_user('bob')
+        self.team = Team.objects.create(team_name='Team A')
+        self.assignment = Assignment.objects.create(title='A', description='d', created_by=self.creator)
+        self.other = Assignment.objects.create(title='B', description='d', created_by=self.creator)
+
+    def rows(self):
+        return set(AssignmentReviewee.objects.values_list('assignment_id', 'user_id', 'source'))
+
+    def test_rows_follow_individual_team_and_membership_changes(self):
+        self.assignment.individual_reviewees.add(self.alice)
+        self.assignment.team_reviewees.add(self.team)
+        self.team.members.add(self.alice, self.bob)
+        self.assertEqual(self.rows(), {
+            (self.assignment.pk, self.alice.pk, 'individual'),
+            (self.assignment.pk, self.alice.pk, 'team'),
+            (self.assignment.pk, self.bob.pk, 'team'),
+        })
+
+        self.bob.teams.remove(self.team)
+        self.team.assignments_as_team.add(self.other)
+        self.alice.assignments_as_individual.clear()
+        self.assertEqual(self.rows(), {
+            (self.assignment.pk, self.alice.pk, 'team'),
+            (self.other.pk, self.alice.pk, 'team'),
+        })
+
+        self.team.members.clear()
+        self.assertEqual(self.rows(), set())
+        call_command('check_assignment_reviewees', stdout=StringIO())
+
+    def test_my_assignments_is_a_single_lookup(self):
+        self.assignment.individual_reviewees.add(self.alice)
+        self.other.team_reviewees.add(self.team)
+        self.team.members.add(self.alice)
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        with self.assertNumQueries(2):
+            response = client.get(reverse('my-assignments'))
+        self.assertEqual({item['assignment_id'] for item in response.data}, {self.assignment.pk, self.other.pk})
+
+    def test_check_command_detects_and_fixes_drift(self):
+        self.assignment.individual_reviewees.add(self.alice)
+        AssignmentReviewee.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command('check_assignment_reviewees', stdout=StringIO(), stderr=StringIO())
+        call_command('check_assignment_reviewees', '--fix', stdout=StringIO())
+        self.assertEqual(self.rows(), {(self.assignment.pk, self.alice.pk, 'individual')})
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('staff', is_staff=True))
+        creator, reviewer, reviewee = make_user('creator'), make_user('reviewer'), make_user('reviewee')
+        self.reviewee = reviewee
+        self.assignment = Assignment.objects.create(title='Compiler project', description='Write a parser', created_by=creator)
+        self.subtask = Subtask.objects.create(title='Lexer', description='Tokenize the parser input',
+                                              assignment=self.assignment, due_date=timezone.now())
+        self.submission = Submission.objects.create(submission_description='Handwritten lexer', files_link='https://example.com/f',
+                                                    subtask=self.subtask, reviewee=reviewee)
+        self.review = Review.objects.create(review_content='Parser errors are unclear', additional_comments='Add recovery',
+                                            status='suggest_iteration', submission=self.submission, reviewer=reviewer)
+
+    def hits(self, query, **params):
+        response = self.client.get(reverse('search'), {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(hit['kind'], hit['id']) for hit in response.data['results']]
+
+    def test_ranked_search_across_kinds(self):
+        self.assertTrue(search.available())
+        hits = self.hits('parser')
+        self.assertEqual(hits[0], ('assignment', self.assignment.pk))
+        self.assertEqual(set(hits), {('assignment', self.assignment.pk), ('subtask', self.subtask.pk), ('review', self.review.pk)})
+        self.assertEqual(self.hits('pars', kind='review'), [('review', self.review.pk)])
+        self.assertEqual(self.hits('"unbalanced OR'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.review.additional_comments = 'Consider a tokenizer generator'
+        self.review.save()
+        self.assertEqual(self.hits('generator'), [('review', self.review.pk)])
+        self.assertEqual(self.hits('recovery'), [])
+        self.subtask.delete()
+        self.assertEqual(self.hits('lexer'), [])
+
+    def test_reindex_and_fallback(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.TABLE}')
+        self.assertEqual(self.hits('lexer'), [])
+        call_command('reindex_search', stdout=StringIO())
+        self.assertEqual(set(self.hits('lexer')), {('subtask', self.subtask.pk), ('submission', self.submission.pk)})
+
+        with mock.patch.object(search, '_available', False):
+            self.assertEqual(set(self.hits('lexer')), {('subtask', self.subtask.pk), ('submission', self.submission.pk)})
+
+    def test_hits_are_scoped_to_what_the_caller_may_read(self):
+        roles.invalidate()
+        self.assertEqual(APIClient().get(reverse('search'), {'q': 'parser'}).status_code, 401)
+        everything = {('assignment', self.assignment.pk), ('subtask', self.subtask.pk),
+                      ('submission', self.submission.pk), ('review', self.review.pk)}
+        login_as(self.client, make_user('stranger'), 'reviewee')
+        for fts in (True, False):
+            with self.subTest(fts=fts), mock.patch.object(search, '_available', fts):
+                self.assertEqual(self.hits('parser'), [])
+                self.assertEqual(self.hits('lexer'), [])
+        login_as(self.client, self.reviewee, 'reviewee')
+        self.assertEqual(self.hits('unclear'), [('review', self.review.pk)])
+        self.assertEqual(self.hits('lexer'), [('submission', self.submission.pk)])
+        self.assignment.individual_reviewees.add(self.reviewee)
+        self.assertEqual(set(self.hits('lexer')), everything - {('assignment', self.assignment.pk), ('review', self.review.pk)})
+        self.assertEqual(len(search.search('parser', limit=1, offset=1, reader=self.reviewee, batch_size=1)), 1)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.staff = make_user('staff', is_staff=True)
+        self.client.force_authenticate(self.staff)
+        creator, reviewer, reviewee = make_user('creator'), make_user('reviewer'), make_user('reviewee')
+        self.assignment = make_assignment_tree(creator, reviewer, reviewee, subtasks=2, submissions=2, reviews=1, comments=2)
+
+    def export(self, **params):
+        response = self.client.get(reverse('assignment-export', args=[self.assignment.pk]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_jsonl_export_streams_every_record_and_resumes(self):
+        lines = [json.loads(line) for line in self.export(output='jsonl').splitlines()]
+        self.assertEqual([line['record_type'] for line in lines[:4]], ['submission', 'review', 'comment', 'comment'])
+        self.assertEqual(len(lines), 4 * 4)
+
+        submission_ids = sorted({line['submission_id'] for line in lines})
+        resumed = [json.loads(line) for line in self.export(output='jsonl', after=submission_ids[1]).splitlines()]
+        self.assertEqual({line['submission_id'] for line in resumed}, set(submission_ids[2:]))
+
+    def test_csv_export_queries_per_chunk(self):
+        rows = list(export.records(self.assignment.pk, chunk_size=2))
+        self.assertEqual(len(rows), 16)
+        with self.assertNumQueries(1 + 2 * 2):
+            list(export.records(self.assignment.pk, chunk_size=2))
+        content = self.export(output='csv')
+        self.assertEqual(content.splitlines()[0].split(','), export.COLUMNS)
+        self.assertEqual(len(content.splitlines()), 17)
+
+    def test_asgi_export_is_an_async_stream(self):
+        async def export():
+            client = AsyncClient()
+            await client.aforce_login(self.staff)
+            response = await client.get(reverse('assignment-export', args=[self.assignment.pk]), {'output': 'jsonl'})
+            self.assertTrue(response.is_async)
+            return b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(async_to_sync(export)(), self.export(output='jsonl'))
+
+    def test_export_requires_staff(self):
+        client = APIClient()
+        client.force_authenticate(make_user('someone'))
+        response = client.get(reverse('assignment-export', args=[self.assignment.pk]))
+        self.assertEqual(response.status_code, 403)
+
+
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.client = APIClient()
+        self.staff = make_user('staff', is_staff=True)
+
+    def test_requests_are_recorded_and_exposed(self):
+        self.client.get(reverse('assignment-list'))
+        self.client.force_authenticate(self.staff)
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('review_request_duration_seconds_count{view="assignment-list",method="GET"} 1', body)
+        self.assertIn('review_request_sql_queries_bucket{view="assignment-list",method="GET",le="2"} 1', body)
+        self.assertIn('# TYPE review_response_size_bytes histogram', body)
+
+    def test_queries_are_counted_under_asgi(self):
+        # Sync views run on a worker thread with its own connections.
+        token, _ = tokens.issue(self.staff)
+        url, auth = reverse('submission-list'), f'Token {token}'
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=auth).status_code, 200)
+        self.assertEqual(async_to_sync(AsyncClient().get)(url, headers={'Authorization': auth}).status_code, 200)
+        body = registry.render()
+        self.assertIn('review_request_sql_queries_count{view="submission-list",method="GET"} 2', body)
+        self.assertIn('review_request_sql_queries_bucket{view="submission-list",method="GET",le="0"} 0', body)
+
+    def test_repeated_query_shapes_are_flagged(self):
+        recorder = QueryRecorder()
+        recorder.shapes[fingerprint('SELECT * FROM t WHERE id = 1')] += 1
+        recorder.shapes[fingerprint('SELECT * FROM t WHERE id = 2')] += 4
+        self.assertEqual(list(recorder.shapes), ['SELECT * FROM t WHERE id = ?'])
+        with self.assertLogs('review_system.performance', 'WARNING'):
+            PerformanceMiddleware(lambda request: None).record(
+                RequestFactory().get('/'), HttpResponse(b'ok'), 'some-view', recorder, 0.01,
+            )
+        self.assertIn('review_duplicate_queries_total{view="some-view"', registry.render())
+
+    @override_settings(PERF_PROFILE_HEADER_ENABLED=True)
+    def test_profile_header(self):
+        with self.assertLogs('review_system.performance', 'INFO') as logs:
+            self.client.get(reverse('home'), HTTP_X_PROFILE='1')
+        self.assertIn('function calls', logs.output[0])
+
+    def test_metrics_forbidden_for_other_users(self):
+        self.client.force_authenticate(make_user('someone'))
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_scraped_with_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer scrape-secret').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        # A proxied request looks local; the address alone grants nothing.
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='127.0.0.1').status_code, 403)
+
+
+class SeedAndBenchmarkTests(TestCase):
+    def setUp(self):
+        # Roles created by earlier tests were rolled back with their transaction.
+        roles.invalidate()
+
+    def test_seed_builds_consistent_dataset(self):
+        _, counts = seed.seed(users=40, teams=4, team_size=5, assignments=2, subtasks=2, reviewees_per_assignment=10,
+                              iterations=2, comments_per_review=1)
+        self.assertEqual(counts['submissions'], 2 * 2 * 10 * 2)
+        self.assertEqual(Submission.objects.count(), counts['submissions'])
+        self.assertEqual(ReviewComment.objects.count(), counts['comments'])
+        self.assertEqual(rollup.verify(), {})
+        self.assertEqual(reviewees.diff(), (set(), []))
+        self.assertTrue(search.search('lorem'))
+
+    # A fast hasher keeps the login cases from dominating the test run.
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_benchmarks_run_and_compare_against_baseline(self):
+        seed.seed(users=30, teams=3, assignments=1, subtasks=1, reviewees_per_assignment=5, iterations=2)
+        # Every case runs once, so one broken by an API change fails here.
+        results = benchmarks.run(repeat=1)
+        self.assertEqual(set(results), set(benchmarks.BENCHMARKS))
+        self.assertEqual(results['api.submission_list']['queries'], 2)
+
+        baseline = {name: dict(result) for name, result in results.items()}
+        self.assertEqual(benchmarks.compare(results, baseline, threshold=0.25), [])
+        baseline['api.review_queue'].update(seconds=results['api.review_queue']['seconds'] / 10 - 0.01, queries=0)
+        regressions = benchmarks.compare(results, baseline, threshold=0.25)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(line.startswith('api.review_queue') for line in regressions))
+
+
+class FastReadPathTests(TestCase):
+    def setUp(self):
+        creator, self.reviewer, reviewee = make_user('creator'), make_user('reviewer'), make_user('reviewee')
+        make_assignment_tree(creator, self.reviewer, reviewee, subtasks=2, submissions=3, reviews=1, comments=1)
+        Review.objects.filter(pk=Review.objects.first().pk).update(
+            review_content='Ünïcode \u2028 line sep "quoted"', additional_comments=None,
+        )
+
+    def assert_same_bytes(self, serializer_class, queryset):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        fast = ValuesSerializer.for_serializer(serializer_class)
+        actual = FastJSONRenderer().render(fast.to_representation(queryset.values(*fast.columns)))
+        self.assertEqual(actual, expected)
+
+    def test_output_is_byte_compatible_with_serializers(self):
+        self.assert_same_bytes(SubmissionSerializer, Submission.objects.order_by('pk'))
+        self.assert_same_bytes(ReviewSerializer, Review.objects.order_by('pk'))
+        self.assert_same_bytes(ReviewCommentSerializer, ReviewComment.objects.order_by('pk'))
+
+    def test_renderer_matches_drf_for_errors_and_nested_data(self):
+        data = {'errors': {1: {'submission': ['Invalid pk "9" - object does not exist.']}}, 'when': timezone.now()}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_list_endpoint_uses_fast_path(self):
+        client = APIClient()
+        client.force_authenticate(make_user('staff', is_staff=True))
+        response = client.get(reverse('review-list'))
+        expected = ReviewSerializer(Review.objects.order_by('-reviewed_at', '-review_id'), many=True).data
+        self.assertEqual(response.json()['results'], json.loads(JSONRenderer().render(expected)))
+
+
+class ShapedListTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('staff', is_staff=True))
+        self.creator, self.reviewer, self.reviewee = make_user('creator'), make_user('reviewer'), make_user('reviewee')
+        self.assignment = make_assignment_tree(self.creator, self.reviewer, self.reviewee, subtasks=2, comments=2)
+
+    def test_fields_trims_output_and_columns(self):
+        with self.assertNumQueries(2) as queries:
+            response = self.client.get(reverse('submission-list'), {'fields': 'submission_id,reviewee'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()['results'][0]), {'submission_id', 'reviewee'})
+        self.assertNotIn('submission_description', queries.captured_queries[-1]['sql'])
+
+    def test_to_one_expansions_join_in_the_same_query(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('submission-list'), {'expand': 'subtask,reviewee'})
+        submission = Submission.objects.order_by('-submitted_at', '-submission_id').first()
+        item = response.json()['results'][0]
+        self.assertEqual(item['subtask']['title'], submission.subtask.title)
+        self.assertEqual(item['subtask']['assignment'], self.assignment.pk)
+        self.assertEqual(item['reviewee'], {'user_id': self.reviewee.pk, 'username': 'reviewee',
+                                            'first_name': '', 'second_name': ''})
+
+    def test_to_many_expansion_adds_one_query_per_page(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('review-list'), {'expand': 'comments', 'fields': 'review_id'})
+        results = response.json()['results']
+        self.assertEqual(len(results), 2)
+        for item in results:
+            self.assertEqual(set(item), {'review_id', 'comments'})
+            comments = ReviewComment.objects.filter(review_id=item['review_id']).order_by('pk')
+            self.assertEqual([comment['comment_id'] for comment in item['comments']], [c.pk for c in comments])
+
+    def test_cached_lists_are_shaped(self):
+        url = reverse('subtask-list')
+        response = self.client.get(url, {'assignment': self.assignment.pk, 'fields': 'title', 'expand': 'assignment'})
+        self.assertEqual(response.json()[0], {'title': 'Subtask 0', 'assignment': {
+            'assignment_id': self.assignment.pk, 'title': 'Assignment', 'description': 'Build it',
+            'assigned_date': response.json()[0]['assignment']['assigned_date'], 'created_by': self.creator.pk}})
+        self.assertEqual(len(self.client.get(url, {'expand': 'submissions'}).json()[0]['submissions']), 1)
+
+    def test_user_changes_invalidate_expanded_users(self):
+        url = reverse('submission-list')
+        etag = self.client.get(url, {'expand': 'reviewee'})['ETag']
+        self.reviewee.first_name = 'Renamed'
+        self.reviewee.save()
+        response = self.client.get(url, {'expand': 'reviewee'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['reviewee']['first_name'], 'Renamed')
+
+    def test_unknown_names_are_rejected(self):
+        for params in ({'fields': 'nope'}, {'fields': ''}, {'expand': 'reviewer'}, {'expand': 'comments'}):
+            response = self.client.get(reverse('submission-list'), params)
+            self.assertEqual(response.status_code, 400, params)
+        self.assertEqual(self.client.get(reverse('subtask-list'), {'expand': 'reviews'}).status_code, 400)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.staff = make_user('staff', is_staff=True)
+        self.client.force_authenticate(self.staff)
+        self.creator, self.reviewer, self.reviewee = make_user('creator'), make_user('reviewer'), make_user('reviewee')
+        self.assignment = make_assignment_tree(self.creator, self.reviewer, self.reviewee)
+        self.subtask = self.assignment.subtasks.get()
+
+    def get_detail(self):
+        return self.client.get(reverse('assignment-detail', args=[self.assignment.pk])).json()
+
+    def test_hit_runs_no_queries(self):
+        self.get_detail()
+        self.client.get(reverse('subtask-list'), {'assignment': self.assignment.pk})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_detail()['title'], 'Assignment')
+            response = self.client.get(reverse('subtask-list'), {'assignment': self.assignment.pk})
+        self.assertEqual([row['title'] for row in response.json()], ['Subtask 0'])
+
+    def test_invalid_assignment_never_reaches_the_version_key(self):
+        with mock.patch.object(cache, 'versions', wraps=cache.versions) as versions:
+            response = self.client.get(reverse('subtask-list'), {'assignment': 'x:1'})
+        self.assertEqual(response.status_code, 400)
+        versions.assert_not_called()
+        with mock.patch.object(cache, 'versions', wraps=cache.versions) as versions:
+            self.client.get(reverse('subtask-list'), {'assignment': f'0{self.assignment.pk}'})
+        self.assertIn(cache.assignment(self.assignment.pk), [name for call in versions.call_args_list for name in call.args[0]])
+
+    def test_writes_anywhere_in_the_tree_invalidate(self):
+        self.get_detail()
+        self.subtask.title = 'Renamed'
+        self.subtask.save()
+        self.assertEqual(self.get_detail()['subtasks'][0]['title'], 'Renamed')
+
+        submission = self.subtask.submissions.get()
+        Review.objects.create(review_content='Again', status='suggest_iteration', submission=submission, reviewer=self.reviewer)
+        self.assertEqual(len(self.get_detail()['subtasks'][0]['submissions'][0]['reviews']), 2)
+
+        roles.invalidate()
+        login_as(self.client, self.reviewee, 'reviewee')
+        response = self.client.post(reverse('submission-bulk'), [
+            {'submission_description': 'Bulk', 'files_link': 'https://example.com/b', 'subtask': self.subtask.pk, 'reviewee': self.reviewee.pk},
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(len(self.get_detail()['subtasks'][0]['submissions']), 2)
+
+    def test_moving_a_subtask_invalidates_both_assignments(self):
+        other = Assignment.objects.create(title='Other', description='x', created_by=self.creator)
+        self.get_detail()
+        self.client.get(reverse('assignment-detail', args=[other.pk]))
+        self.subtask.assignment = other
+        self.subtask.save()
+        self.assertEqual(self.get_detail()['subtasks'], [])
+        self.assertEqual(len(self.client.get(reverse('assignment-detail', args=[other.pk])).json()['subtasks']), 1)
+
+    def test_my_assignments_is_per_user_and_follows_membership(self):
+        team = Team.objects.create(team_name='Team')
+        self.client.force_authenticate(self.reviewee)
+        self.assertEqual(self.client.get(reverse('my-assignments')).json(), [])
+        with self.assertNumQueries(0):
+            self.client.get(reverse('my-assignments'))
+        self.assignment.team_reviewees.add(team)
+        self.reviewee.teams.add(team)
+        self.assertEqual([row['title'] for row in self.client.get(reverse('my-assignments')).json()], ['Assignment'])
+        self.client.force_authenticate(self.reviewer)
+        self.assertEqual(self.client.get(reverse('my-assignments')).json(), [])
+
+    def test_evicted_version_never_reuses_old_entries(self):
+        self.get_detail()
+        cache.backend().delete(f'review-version:{cache.assignment(self.assignment.pk)}')
+        Assignment.objects.filter(pk=self.assignment.pk).update(title='Changed behind the signals')
+        self.assertEqual(self.get_detail()['title'], 'Changed behind the signals')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('staff', is_staff=True))
+        self.creator, self.reviewer, self.reviewee = make_user('creator'), make_user('reviewer'), make_user('reviewee')
+        self.assignment = make_assignment_tree(self.creator, self.reviewer, self.reviewee, submissions=2)
+        self.subtask = self.assignment.subtasks.get()
+
+    def test_detail_revalidates_without_queries(self):
+        url = reverse('assignment-detail', args=[self.assignment.pk])
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        ReviewComment.objects.first().delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_answers_304_from_the_aggregate_alone(self):
+        url = reverse('submission-list') + f'?subtask={self.subtask.pk}'
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(reverse('submission-list'))['ETag'], etag)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_deletion_is_not_hidden_by_if_modified_since(self):
+        url = reverse('submission-list') + f'?subtask={self.subtask.pk}'
+        since = http_date(time.time() + 60)
+        self.assertEqual(len(self.client.get(url).json()['results']), 2)
+        Submission.objects.order_by('pk').first().delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_bulk_update_moves_updated_at(self):
+        url = reverse('submission-list') + f'?subtask={self.subtask.pk}'
+        etag = self.client.get(url)['ETag']
+        before = Submission.objects.order_by('pk').first()
+        roles.invalidate()
+        login_as(self.client, self.reviewee, 'reviewee')
+        response = self.client.patch(reverse('submission-bulk'), [
+            {'submission_id': before.pk, 'submission_description': 'edited'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        before_updated = before.updated_at
+        before.refresh_from_db()
+        self.assertGreater(before.updated_at, before_updated)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.creator, self.reviewer, self.reviewee = make_user('creator'), make_user('reviewer'), make_user('reviewee')
+        self.start = Change.objects.order_by('-seq').values_list('seq', flat=True).first() or 0
+        roles.invalidate()
+        login_as(self.client, self.reviewer, 'reviewer')
+
+    def sync(self, since, **params):
+        response = self.client.get(reverse('sync'), {'since': since, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_changes_since_cursor_including_cascade_tombstones(self):
+        assignment = make_assignment_tree(self.creator, self.reviewer, self.reviewee)
+        page = self.sync(self.start)
+        self.assertEqual([(entry['type'], entry['deleted']) for entry in page['results']], [
+            ('assignment', False), ('subtask', False), ('submission', False), ('review', False), ('comment', False),
+        ])
+        self.assertEqual(page['results'][0]['data']['title'], 'Assignment')
+        cursor = page['cursor']
+        self.assertEqual(self.sync(cursor)['results'], [])
+
+        review = Review.objects.get()
+        review.status = 'suggest_iteration'
+        review.save()
+        assignment.delete()
+        page = self.sync(cursor)
+        self.assertEqual({(entry['type'], entry['deleted']) for entry in page['results']}, {
+            ('assignment', True), ('subtask', True), ('submission', True), ('review', True), ('comment', True),
+        })
+        self.assertTrue(all(entry['data'] is None for entry in page['results']))
+
+    def test_pages_by_sequence_and_collapses_repeated_changes(self):
+        assignment = make_assignment_tree(self.creator, self.reviewer, self.reviewee, comments=3)
+        for title in ('one', 'two'):
+            assignment.title = title
+            assignment.save()
+        # One query for the page of changes plus one per object type in it;
+        # the caller's roles are loaded on the first request.
+        seen, since, pages = [], self.start, 0
+        while True:
+            with self.assertNumQueries([5, 3, 3][pages]):
+                page = self.sync(since, limit=3)
+            seen.extend(page['results'])
+            since, pages = page['cursor'], pages + 1
+            if page['next'] is None:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual([entry['seq'] for entry in seen], sorted(entry['seq'] for entry in seen))
+        self.assertEqual(seen[-1]['data']['title'], 'two')
+        self.assertEqual(self.sync(self.start, limit=500)['results'][0]['type'], 'subtask')
+
+    def test_bulk_writes_and_prune(self):
+        subtask = make_assignment_tree(self.creator, self.reviewer, self.reviewee, submissions=0).subtasks.get()
+        cursor = self.sync(self.start)['cursor']
+        roles.invalidate()
+        login_as(APIClient(), self.reviewee, 'reviewee').post(reverse('submission-bulk'), [
+            {'submission_description': 'Bulk', 'files_link': 'https://example.com/b', 'subtask': subtask.pk, 'reviewee': self.reviewee.pk},
+        ], format='json')
+        self.assertEqual([entry['type'] for entry in self.sync(cursor)['results']], ['submission'])
+
+        subtask.save()
+        call_command('prune_changes', stdout=StringIO())
+        self.assertEqual(Change.objects.filter(object_type='subtask', object_id=subtask.pk).count(), 1)
+
+    def test_feed_is_scoped_to_what_the_caller_may_read(self):
+        stranger = make_user('stranger')
+        given = make_assignment_tree(self.creator, self.reviewer, self.reviewee)
+        given.individual_reviewees.add(self.reviewee, stranger)
+        other = make_assignment_tree(self.creator, self.reviewer, stranger)
+        tree = lambda assignment: {
+            ('assignment', assignment.pk), ('subtask', assignment.subtasks.get().pk),
+            ('submission', Submission.objects.get(subtask__assignment=assignment).pk),
+            ('review', Review.objects.get(submission__subtask__assignment=assignment).pk),
+            ('comment', ReviewComment.objects.get(review__submission__subtask__assignment=assignment).pk),
+        }
+        given_tree, other_tree = tree(given), tree(other)
+        self.assertEqual(APIClient().get(reverse('sync')).status_code, 401)
+
+        reviewer_client, self.client = self.client, login_as(APIClient(), self.reviewee, 'reviewee')
+        page = self.sync(self.start)
+        self.assertEqual({(entry['type'], entry['id']) for entry in page['results']}, given_tree)
+        cursor = page['cursor']
+        other.delete()
+        given.delete()
+        page = self.sync(cursor)
+        self.assertEqual({(entry['type'], entry['id']) for entry in page['results']}, given_tree)
+        self.assertTrue(all(entry['deleted'] for entry in page['results']))
+
+        self.client = reviewer_client
+        page = self.sync(cursor)
+        self.assertEqual({(entry['type'], entry['id']) for entry in page['results']}, given_tree | other_tree)
+
+        call_command('prune_changes', stdout=StringIO())
+        self.client = login_as(APIClient(), User.objects.get(pk=self.reviewee.pk))
+        self.assertEqual({(entry['type'], entry['id']) for entry in self.sync(cursor)['results']}, given_tree)
+
+    def test_rejects_bad_cursor(self):
+        self.assertEqual(self.client.get(reverse('sync'), {'since': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('sync'), {'since': '²'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('sync'), {'limit': '²'}).status_code, 400)
+
+
+class TokenAuthTests(TestCase):
+    def setUp(self):
+        roles.invalidate()
+        self.client = APIClient()
+        self.user = make_user('alice')
+
+    def login(self, user):
+        token, _ = tokens.issue(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        return token
+
+    def test_login_issues_a_working_token(self):
+        make_user('bob', password='secret-pass')
+        response = self.client.post(reverse('login'), {'username': 'bob', 'password': 'secret-pass'})
+        self.assertEqual(response.status_code, 200)
+        token = response.json()['token']
+        self.assertFalse(AuthToken.objects.filter(key_hash=token).exists())
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(self.client.get(reverse('my-assignments')).status_code, 200)
+
+        self.assertEqual(self.client.post(reverse('logout')).status_code, 204)
+        self.assertEqual(self.client.get(reverse('my-assignments')).status_code, 401)
+
+    def test_steady_state_requests_run_no_auth_queries(self):
+        self.login(self.user)
+        self.client.get(reverse('my-assignments'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('my-assignments')).status_code, 200)
+
+    def test_role_and_team_changes_reach_the_cached_principal(self):
+        token = self.login(self.user)
+        self.assertEqual(self.client.get(reverse('review-queue')).status_code, 403)
+        roles.set_user_roles(self.user, ['reviewer'])
+        self.assertEqual(self.client.get(reverse('review-queue')).status_code, 200)
+
+        team = Team.objects.create(team_name='Team')
+        team.members.add(self.user)
+        self.assertEqual(tokens.resolve(token).team_ids, {team.pk})
+        roles.get_role('reviewer').users.remove(self.user)
+        self.assertEqual(self.client.get(reverse('review-queue')).status_code, 403)
+
+    def test_expired_and_unknown_tokens_are_rejected(self):
+        token = self.login(self.user)
+        AuthToken.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        tokens.invalidate()
+        self.assertEqual(self.client.get(reverse('my-assignments')).status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION='Token nope')
+        self.assertEqual(self.client.get(reverse('my-assignments')).status_code, 401)
+        self.assertIsNone(tokens.resolve(token))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AsyncAuthViewTests(TestCase):
+    def test_signup_and_login_run_async(self):
+        async def flow():
+            client = AsyncClient()
+            response = await client.post(reverse('signup'), {'username': 'carol', 'password': 'pw', 'email': 'carol@example.com'},
+                                         content_type='application/json')
+            self.assertEqual(response.status_code, 201)
+            response = await client.post(reverse('signup'), {'username': 'carol', 'password': 'pw', 'email': 'other@example.com'})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'User already exists'})
+            self.assertEqual((await client.post(reverse('login'), {'username': 'carol', 'password': 'nope'})).status_code, 401)
+            self.assertEqual((await client.post(reverse('login'), {'username': 'nobody', 'password': 'pw'})).status_code, 401)
+            response = await client.post(reverse('login'), {'username': 'carol', 'password': 'pw'})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('token', response.json())
+        async_to_sync(flow)()
+        self.assertEqual(User.objects.filter(username='carol').count(), 1)
+        self.assertIn('review_request_duration_seconds_count{view="login",method="POST"}', registry.render())
+
+    def test_saturated_pool_answers_503(self):
+        pool = hashing.HashingPool(workers=1, queue=0)
+        pool.slots.acquire()  # a hash already in flight
+        with mock.patch.object(hashing, '_pool', pool), override_settings(PASSWORD_HASHING_RETRY_AFTER=3):
+            response = self.client.post(reverse('signup'), {'username': 'dave', 'password': 'pw', 'email': 'dave@example.com'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '3')
+        self.assertFalse(User.objects.filter(username='dave').exists())
+
+    def test_outdated_hashes_are_upgraded_on_login(self):
+        with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher',
+                                                 'django.contrib.auth.hashers.PBKDF2PasswordHasher']):
+            user = make_user('erin')
+            user.password = PBKDF2PasswordHasher().encode('pw', 'salt', iterations=1)
+            user.save(update_fields=['password'])
+            self.assertEqual(self.client.post(reverse('login'), {'username': 'erin', 'password': 'pw'}).status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('md5$'))
+
+
+class StubChanneliHandler(BaseHTTPRequestHandler):
+    # Local stand-in for the Channeli token and user data endpoints.
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+        self.server.token_requests.append(body)
+        if 'code=bad' in body:
+            return self.reply(400, {'error': 'invalid_grant'})
+        if 'code=html' in body:
+            return self.reply(200, '<html>maintenance</html>')
+        self.reply(200, {'access_token': 'access-' + body.split('code=')[1].split('&')[0]})
+
+    def do_GET(self):
+        self.server.data_requests.append(self.headers['Authorization'])
+        if self.server.failures:
+            self.server.failures -= 1
+            return self.reply(503, {})
+        self.reply(200, self.server.user_data)
+
+    def reply(self, status, payload):
+        body = payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ChanneliCallbackTests(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubChanneliHandler)
+        self.server.token_requests, self.server.data_requests, self.server.failures = [], [], 0
+        self.server.user_data = {'username': '21114001', 'person': {'fullName': 'Asha Verma'},
+                                 'contactInformation': {'instituteWebmailAddress': 'asha@iitr.ac.in'}}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        base = f'http://127.0.0.1:{self.server.server_port}'
+        settings_override = override_settings(CHANNELI_TOKEN_URL=f'{base}/token/', CHANNELI_USER_DATA_URL=f'{base}/user/',
+                                              CHANNELI_CLIENT_ID='id', CHANNELI_CLIENT_SECRET='secret')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        backoff = mock.patch.object(oauth, 'BACKOFF', 0)
+        backoff.start()
+        self.addCleanup(backoff.stop)
+
+    def start(self, client):
+        # Begin the flow like a browser: the authorize redirect carries the
+        # state stored in the client's session.
+        response = client.get(reverse('login-channeli'))
+        return parse_qs(urlparse(response['Location']).query)['state'][0]
+
+    def callback(self, code, state=None):
+        state = self.start(self.client) if state is None else state
+        return self.client.get(reverse('login-channeli-callback'), {'code': code, 'state': state})
+
+    def test_exchanges_code_and_upserts_user(self):
+        self.server.failures = 1  # the user data GET is retried
+        response = self.callback('abc')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('token', response.json())
+        user = User.objects.get(username='21114001')
+        self.assertEqual((user.email, user.first_name, user.second_name), ('asha@iitr.ac.in', 'Asha', 'Verma'))
+        self.assertFalse(user.has_usable_password())
+        self.assertIn('code=abc', self.server.token_requests[0])
+        self.assertEqual(self.server.data_requests, ['Bearer access-abc'] * 2)
+
+        self.server.user_data['person']['fullName'] = 'Asha V Verma'
+        self.assertEqual(self.callback('def').status_code, 200)
+        self.assertEqual(User.objects.get(username='21114001').second_name, 'V Verma')
+        self.assertEqual(AuthToken.objects.filter(user=user).count(), 2)
+
+    def test_concurrent_callbacks_share_the_client(self):
+        clients = []
+        for _ in range(5):
+            browser, client = Client(), AsyncClient()
+            client.state = self.start(browser)
+            client.cookies = browser.cookies
+            clients.append(client)
+
+        async def storm():
+            return await asyncio.gather(*(
+                client.get(reverse('login-channeli-callback'), {'code': f'c{i}', 'state': client.state})
+                for i, client in enumerate(clients)
+            ))
+        self.assertEqual({response.status_code for response in async_to_sync(storm)()}, {200})
+        self.assertEqual(len(self.server.token_requests), 5)
+        self.assertEqual(User.objects.filter(username='21114001').count(), 1)
+
+    def test_state_must_come_from_this_session(self):
+        self.assertEqual(self.client.get(reverse('login-channeli-callback'), {'code': 'abc', 'state': 'yay'}).status_code, 400)
+        self.start(self.client)
+        self.assertEqual(self.callback('abc', state='other').status_code, 400)
+        state = self.start(self.client)
+        self.assertEqual(self.callback('abc', state=state).status_code, 200)
+        self.assertEqual(self.callback('abc', state=state).status_code, 400)  # used up
+        self.assertEqual(self.callback('abc', state=self.start(Client())).status_code, 400)  # someone else's
+
+    def test_does_not_take_over_local_accounts(self):
+        local = make_user('21114001', password='secret')
+        self.assertEqual(self.callback('abc').status_code, 409)
+        local.refresh_from_db()
+        self.assertEqual((local.email, local.channeli_id), ('21114001@example.com', None))
+        self.assertFalse(AuthToken.objects.filter(user=local).exists())
+
+    def test_errors(self):
+        self.assertEqual(self.callback('html').status_code, 502)
+        self.assertEqual(self.callback('bad').status_code, 400)
+        self.server.failures = 10
+        self.assertEqual(self.callback('abc').status_code, 502)
+        self.assertEqual(len(self.server.data_requests), 3)
+        User.objects.create_user(username='someone-else', email='asha@iitr.ac.in')
+        self.server.failures = 0
+        self.assertEqual(self.callback('abc').status_code, 409)
+        self.assertFalse(User.objects.filter(username='21114001').exists())
+
+        with override_settings(CHANNELI_TOKEN_URL='http://127.0.0.1:9/token/'):
+            self.assertEqual(self.callback('abc').status_code, 502)
+
+
+def use_temporary_media(test):
+    # Point MEDIA_ROOT (and the attachment storage) at a directory removed
+    # after the test.
+    media = tempfile.TemporaryDirectory()
+    test.addCleanup(media.cleanup)
+    settings_override = override_settings(MEDIA_ROOT=media.name)
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+    storages._storages.pop('attachments', None)
+    test.addCleanup(storages._storages.pop, 'attachments', None)
+    return media.name
+
+
+class ContentAddressedAttachmentTests(TestCase):
+    def setUp(self):
+        self.root = use_temporary_media(self)
+        creator = make_user('creator')
+        self.submission = make_assignment_tree(creator, make_user('reviewer'), make_user('reviewee'),
+                                               reviews=0, comments=0).subtasks.get().submissions.get()
+
+    def attach(self, name, content):
+        return Attachment.objects.create(submission=self.submission, file=ContentFile(content, name=name))
+
+    def stored_files(self):
+        return sorted(os.path.relpath(os.path.join(d, f), self.root).replace(os.sep, '/')
+                      for d, _, files in os.walk(self.root) for f in files)
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.attach('report.pdf', b'same bytes')
+        second = self.attach('copy.pdf', b'same bytes')
+
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(self.stored_files(), [first.file.name])
+        self.assertEqual((first.filename, second.filename), ('report.pdf', 'copy.pdf'))
+        blob = Blob.objects.get()
+        self.assertEqual((blob.ref_count, blob.size), (2, len(b'same bytes')))
+        with first.file.open('rb') as f:
+            self.assertEqual(f.read(), b'same bytes')
+
+    def test_delete_releases_and_gc_removes_unreferenced_blobs(self):
+        first = self.attach('a.txt', b'shared')
+        second = self.attach('b.txt', b'shared')
+        name = first.file.name
+
+        first.delete()
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertEqual(blobs.collect(grace=0), 0)
+        self.assertEqual(self.stored_files(), [name])
+
+        second.delete()
+        self.assertEqual(Blob.objects.get().ref_count, 0)
+        self.assertEqual(self.stored_files(), [name])  # kept until collected
+        self.assertEqual(blobs.collect(grace=3600), 0)
+
+        out = StringIO()
+        call_command('gc_blobs', '--grace', '0', stdout=out)
+        self.assertIn('Removed 1 file(s).', out.getvalue())
+        self.assertFalse(Blob.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_replacing_a_file_moves_the_reference(self):
+        attachment = self.attach('v1.txt', b'version 1')
+        old = attachment.file.name
+        attachment.file = ContentFile(b'version 2', name='v2.txt')
+        attachment.save()
+
+        counts = dict(Blob.objects.values_list('sha256', 'ref_count'))
+        self.assertEqual(counts[old.rsplit('/', 1)[1]], 0)
+        self.assertEqual(counts[attachment.file.name.rsplit('/', 1)[1]], 1)
+        self.assertEqual(attachment.file.name, blob_name(attachment.file.name.rsplit('/', 1)[1]))
+        self.assertEqual(Attachment.objects.get().filename, 'v2.txt')
+
+    def collect_during_upload(self, content, upload_first):
+        # gc_blobs runs with an identical upload arriving just before or just
+        # after it moves the stale blob aside.
+        replace, calls = os.replace, []
+
+        def racing_replace(source, target):
+            if calls:
+                return replace(source, target)
+            calls.append(source)
+            if upload_first:
+                storages['attachments'].save('upload.txt', ContentFile(content))
+            replace(source, target)
+            if not upload_first:
+                storages['attachments'].save('upload.txt', ContentFile(content))
+
+        with mock.patch('os.replace', racing_replace):
+            return blobs.collect(grace=3600)
+
+    def test_gc_never_removes_a_blob_an_upload_just_found(self):
+        for upload_first in (True, False):
+            with self.subTest(upload_first=upload_first):
+                content = f'racing {upload_first}'.encode()
+                attachment = self.attach('a.txt', content)
+                name = attachment.file.name
+                attachment.delete()
+                stale = time.time() - 7200
+                os.utime(storages['attachments'].path(name), (stale, stale))
+
+                self.assertEqual(self.collect_during_upload(content, upload_first), 0 if upload_first else 1)
+                self.assertEqual(Blob.objects.filter(sha256=name.rsplit('/', 1)[1]).exists(), upload_first)
+                attachment = self.attach('b.txt', content)
+                self.assertEqual(Blob.objects.get(sha256=name.rsplit('/', 1)[1]).ref_count, 1)
+                with attachment.file.open('rb') as f:
+                    self.assertEqual(f.read(), content)
+                self.assertNotIn('.upload-', ' '.join(self.stored_files()))
+
+    def test_gc_removes_orphan_files_and_stale_temporary_uploads(self):
+        storage = storages['attachments']
+        orphan = storage.save('x', ContentFile(b'rolled back'))
+        os.makedirs(storage.path('blobs'), exist_ok=True)
+        open(storage.path('blobs/.upload-abandoned'), 'wb').close()
+
+        self.assertEqual(blobs.collect(grace=0), 2)
+        self.assertFalse(storage.exists(orphan))
+        self.assertEqual(self.stored_files(), [])
+
+
+class AttachmentDownloadTests(TestCase):
+    content = bytes(range(256)) * 40
+
+    def setUp(self):
+        self.root = use_temporary_media(self)
+        roles.invalidate()
+        self.reviewee = make_user('reviewee')
+        self.outsider = make_user('outsider')
+        assignment = make_assignment_tree(make_user('creator'), make_user('reviewer'), self.reviewee,
+                                          reviews=0, comments=0)
+        self.submission = assignment.subtasks.get().submissions.get()
+        self.attachment = Attachment.objects.create(submission=self.submission,
+                                                    file=ContentFile(self.content, name='report final.pdf'))
+        self.url = reverse('attachment-download', args=[self.attachment.pk])
+        self.client = APIClient()
+        self.client.force_authenticate(self.reviewee)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_downloads_whole_file_under_uploaded_name(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('filename="report final.pdf"', response['Content-Disposition'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], f'"{self.attachment.file.name.rsplit("/", 1)[1]}"')
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), self.content[10:20])
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(self.body(response), self.content[-5:])
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content) - 3}-')
+        self.assertEqual(self.body(response), self.content[-3:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-1,5-6')
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_requests(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MATCH='"other"').status_code, 412)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_access_follows_the_linked_objects(self):
+        self.client.force_authenticate(self.outsider)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+        roles.set_user_roles(self.outsider, ['reviewer'])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        self.client.force_authenticate(None)
+        self.assertIn(self.client.get(self.url).status_code, (401, 403))
+
+    @override_settings(ATTACHMENT_SENDFILE_HEADER='X-Accel-Redirect', ATTACHMENT_SENDFILE_PREFIX='/protected/')
+    def test_front_server_offload(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.attachment.file.name}')
+        self.assertEqual(response.content, b'')
+        self.assertIn('filename="report final.pdf"', response['Content-Disposition'])
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        roles.invalidate()
+        self.client = APIClient()
+        self.creator, self.reviewer, self.reviewee = make_user('creator'), make_user('reviewer'), make_user('reviewee')
+        roles.set_user_roles(self.reviewer, ['reviewer'], created=True)
+        self.client.force_authenticate(self.reviewer)
+        assignment = make_assignment_tree(self.creator, self.reviewer, self.reviewee, reviews=0)
+        self.submission = Submission.objects.get(subtask__assignment=assignment)
+
+    def post_review(self, key, content='Looks good'):
+        return self.client.post(reverse('review-list'), {
+            'review_content': content, 'status': 'passed', 'submission': self.submission.pk, 'reviewer': self.reviewer.pk,
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_stored_response_without_writing(self):
+        first = self.post_review('retry-1')
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(1):
+            replay = self.post_review('retry-1')
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(Review.objects.count(), 1)
+        self.assertEqual(self.post_review('retry-2').status_code, 201)
+        self.assertEqual(Review.objects.count(), 2)
+
+    def test_key_reused_for_another_request_is_rejected(self):
+        self.post_review('reused')
+        self.assertEqual(self.post_review('reused', content='Different').status_code, 422)
+        self.assertEqual(Review.objects.count(), 1)
+
+    def test_failures_are_not_stored(self):
+        response = self.client.post(reverse('comment-bulk'), [{'comment': 'x', 'review': 999, 'commenter': 1}],
+                                    format='json', HTTP_IDEMPOTENCY_KEY='bad')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_keys_are_per_user_and_expire(self):
+        self.post_review('shared')
+        login_as(self.client, make_user('other'), 'reviewer')
+        self.assertEqual(self.post_review('shared').status_code, 201)
+        self.assertEqual(Review.objects.count(), 2)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertNotIn('Idempotent-Replayed', self.post_review('shared'))
+        self.assertEqual(Review.objects.count(), 3)
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('Purged 1', out.getvalue())
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_batch_creates_review_comments_and_attachments_atomically(self):
+        use_temporary_media(self)
+        data = {
+            'review': json.dumps({'review_content': 'Mostly fine', 'status': 'passed', 'submission': self.submission.pk}),
+            'comments': json.dumps(['First', 'Second']),
+            'attachments': [ContentFile(b'notes', name='notes.txt'), ContentFile(b'diff', name='fix.diff')],
+        }
+        response = self.client.post(reverse('review-batch'), data, format='multipart', HTTP_IDEMPOTENCY_KEY='batch')
+        self.assertEqual(response.status_code, 201, response.content)
+        review = Review.objects.get()
+        self.assertEqual(review.reviewer, self.reviewer)
+        self.assertEqual([item['comment'] for item in response.json()['comments']], ['First', 'Second'])
+        self.assertEqual(sorted(review.attachments.values_list('filename', flat=True)), ['fix.diff', 'notes.txt'])
+        self.assertEqual(review.comments.filter(commenter=self.reviewer).count(), 2)
+
+        data['attachments'] = [ContentFile(b'notes', name='notes.txt'), ContentFile(b'diff', name='fix.diff')]
+        replay = self.client.post(reverse('review-batch'), data, format='multipart', HTTP_IDEMPOTENCY_KEY='batch')
+        self.assertEqual(replay.json(), response.json())
+        self.assertEqual(Review.objects.count(), 1)
+
+    def test_invalid_batch_writes_nothing(self):
+        response = self.client.post(reverse('review-batch'), {
+            'review': {'review_content': 'x', 'status': 'passed', 'submission': self.submission.pk},
+            'comments': ['ok', ''],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('comments', response.json())
+        self.assertFalse(Review.objects.exists())
+        self.client.force_authenticate(self.reviewee)
+        self.assertEqual(self.client.post(reverse('review-batch'), {}, format='json').status_code, 403)
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.reviewer = make_user('reviewer')
+        self.reviewee = make_user('reviewee')
+        assignment = make_assignment_tree(make_user('creator'), self.reviewer, self.reviewee, reviews=0, comments=0)
+        self.submission = assignment.subtasks.get().submissions.get()
+        Job.objects.all().delete()
+        self.calls = []
+        jobs.HANDLERS['test_job'] = (self.handler, 3)
+        self.addCleanup(jobs.HANDLERS.pop, 'test_job')
+
+    def handler(self, fail=False, **payload):
+        self.calls.append(payload)
+        if fail:
+            raise RuntimeError('boom')
+
+    def test_review_and_comment_writes_enqueue_notifications(self):
+        roles.invalidate()
+        client = login_as(APIClient(), self.reviewer, 'reviewer')
+        payload = [{'review_content': f'Looks good {i}', 'status': 'passed', 'submission': self.submission.pk,
+                    'reviewer': self.reviewer.pk} for i in range(3)]
+        response = client.post(reverse('review-bulk'), payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(mail.outbox)
+        job = Job.objects.get()
+        self.assertEqual((job.name, len(job.payload['review_ids'])), ('notify_reviews', 3))
+
+        review = Review.objects.first()
+        ReviewComment.objects.create(comment='Why?', review=review, commenter=self.reviewee)
+        self.assertEqual(Job.objects.count(), 2)
+
+        # claim (5, in a savepoint), then a load, a fan-out and a delete per job
+        with self.assertNumQueries(11):
+            self.assertEqual(jobs.run_pending(), 2)
+        self.assertFalse(mail.outbox)
+        self.assertEqual(Job.objects.filter(name='send_email').count(), 4)
+        self.assertEqual(jobs.run_pending(), 4)
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(mail.outbox[0].to, [self.reviewee.email])
+        self.assertEqual(mail.outbox[3].to, [self.reviewer.email])
+
+    def test_a_failed_send_only_retries_its_own_recipient(self):
+        reviewee = make_user('other')
+        Submission.objects.filter(pk=self.submission.pk).update(reviewee=reviewee)
+        review = Review.objects.create(review_content='Hm', status='passed', submission=self.submission,
+                                       reviewer=self.reviewer)
+        ReviewComment.objects.create(comment='See above', review=review, commenter=make_user('admin'))
+        Job.objects.filter(name='notify_reviews').delete()
+        jobs.run_pending()
+
+        send = mail.EmailMessage.send
+
+        def flaky(message, *args, **kwargs):
+            if message.to == [self.reviewer.email]:
+                raise ConnectionError('connection reset')
+            return send(message, *args, **kwargs)
+        with mock.patch.object(mail.EmailMessage, 'send', flaky), self.assertLogs('review_system.jobs', 'WARNING'):
+            self.assertEqual(jobs.run_pending(), 2)
+        self.assertEqual([message.to for message in mail.outbox], [[reviewee.email]])
+
+        Job.objects.update(run_after=timezone.now())
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual([message.to for message in mail.outbox], [[reviewee.email], [self.reviewer.email]])
+
+    def test_failed_jobs_are_retried_with_backoff_then_marked_failed(self):
+        job = jobs.enqueue('test_job', fail=True)
+        with override_settings(JOB_RETRY_BACKOFF=60), self.assertLogs('review_system.jobs', 'WARNING'):
+            self.assertEqual(jobs.run_pending(), 1)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ('queued', 1))
+            self.assertIn('RuntimeError: boom', job.last_error)
+            self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=29))
+            self.assertEqual(jobs.run_pending(), 0)  # not due yet
+
+            for attempt in (2, 3):
+                Job.objects.update(run_after=timezone.now())
+                self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 3))
+        self.assertEqual(jobs.run_pending(), 0)
+
+    def test_claims_are_exclusive_and_expired_leases_are_reclaimed(self):
+        jobs.enqueue_many('test_job', [{'n': i} for i in range(5)])
+        first = jobs.claim('a', 3)
+        second = jobs.claim('b', 10)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({j.pk for j in first} & {j.pk for j in second})
+        self.assertEqual(jobs.claim('c', 10), [])
+
+        Job.objects.filter(pk=first[0].pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        reclaimed = jobs.claim('c', 10)
+        self.assertEqual([j.pk for j in reclaimed], [first[0].pk])
+        jobs.run(first[0])  # the stale owner finishing must not touch the new lease
+        self.assertTrue(Job.objects.filter(pk=first[0].pk, locked_by=reclaimed[0].locked_by).exists())
+
+
+class JobWorkerTests(TransactionTestCase):
+    # Worker threads use their own connections, so jobs must be committed. One
+    # thread: SQLite's shared-cache test database fails table locks at once
+    # instead of waiting for them.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.calls = []
+        jobs.HANDLERS['test_job'] = (lambda **payload: self.calls.append(payload), 3)
+        self.addCleanup(jobs.HANDLERS.pop, 'test_job')
+
+    def test_run_jobs_command_drains_the_queue(self):
+        jobs.enqueue_many('test_job', [{'n': i} for i in range(6)])
+        out = StringIO()
+        call_command('run_jobs', '--once', '--threads', '1', stdout=out)
+        self.assertEqual(sorted(call['n'] for call in self.calls), list(range(6)))
+        self.assertFalse(Job.objects.exists())
+        self.assertIn('Worker stopped.', out.getvalue())
+
+    def test_worker_backs_off_when_the_queue_cannot_be_read(self):
+        jobs.enqueue('test_job', n=1)
+        claim = jobs.claim
+        outcomes = iter([OperationalError('database is locked')])
+
+        def locked_once(*args):
+            error = next(outcomes, None)
+            if error:
+                raise error
+            return claim(*args)
+        with mock.patch.object(jobs, 'claim', locked_once), self.assertLogs('review_system.jobs', 'WARNING') as logs:
+            jobs.Worker(threads=1, poll=0).serve(once=True)
+        self.assertIn('could not claim jobs', logs.output[0])
+        self.assertEqual(self.calls, [{'n': 1}])
+
+
+class EventStreamTests(TestCase):
+    def setUp(self):
+        roles.invalidate()
+        self.creator = make_user('creator')
+        self.reviewer = make_user('reviewer')
+        self.reviewee = make_user('reviewee')
+        self.assignment = make_assignment_tree(self.creator, self.reviewer, self.reviewee, reviews=0, comments=0)
+        self.submission = self.assignment.subtasks.get().submissions.get()
+        self.token, _ = tokens.issue(self.reviewee)
+        self.hub = push.Hub(queue_size=3, max_subscribers=10)
+        for name, value in (('_hub', self.hub), ('_backend', push.LocalBackend(self.hub))):
+            patcher = mock.patch.object(push, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def open(self, token=None, **params):
+        response = await AsyncClient().get(reverse('events'), {'token': token or self.token, **params})
+        if response.status_code != 200:
+            return response, None
+        chunks = response.streaming_content.__aiter__()
+        self.assertIn(': connected', (await chunks.__anext__()).decode())
+        return response, chunks
+
+    def test_committed_reviews_and_comments_reach_the_reviewee(self):
+        async def flow():
+            response, chunks = await self.open()
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            self.assertEqual(self.hub.count, 1)
+
+            def write():
+                with self.captureOnCommitCallbacks(execute=True):
+                    review = Review.objects.create(review_content='Nice', status='passed',
+                                                   submission=self.submission, reviewer=self.reviewer)
+                with self.captureOnCommitCallbacks(execute=True):
+                    ReviewComment.objects.create(comment='Thanks', review=review, commenter=self.reviewee)
+                with self.captureOnCommitCallbacks(execute=True):
+                    comment = ReviewComment.objects.create(comment='Also...', review=review, commenter=self.reviewer)
+                return review, comment
+            review, comment = await sync_to_async(write)()
+
+            chunk = (await chunks.__anext__()).decode()
+            self.assertTrue(chunk.startswith('event: review.created\n'))
+            data = json.loads(chunk.split('data: ', 1)[1])
+            self.assertEqual((data['review'], data['assignment']), (review.pk, self.assignment.pk))
+            # The reviewee's own comment is not pushed back to them.
+            chunk = (await chunks.__anext__()).decode()
+            self.assertTrue(chunk.startswith('event: comment.created\n'))
+            self.assertEqual(json.loads(chunk.split('data: ', 1)[1])['comment'], comment.pk)
+            await chunks.aclose()
+        async_to_sync(flow)()
+
+    def test_slow_consumers_are_dropped(self):
+        async def flow():
+            _, chunks = await self.open()
+            for n in range(4):
+                self.hub.dispatch([push.user_channel(self.reviewee.pk)], {'type': 'test', 'n': n})
+            self.assertEqual(await chunks.__anext__(), b'event: overflow\ndata: {}\n\n')
+            with self.assertRaises(StopAsyncIteration):
+                await chunks.__anext__()
+            self.assertEqual(self.hub.count, 0)
+        async_to_sync(flow)()
+
+    def test_idle_streams_send_keep_alives(self):
+        async def flow():
+            with override_settings(PUSH_HEARTBEAT=0.01):
+                _, chunks = await self.open()
+                self.assertEqual(await chunks.__anext__(), b': keep-alive\n\n')
+                await chunks.aclose()
+        async_to_sync(flow)()
+
+    def test_access(self):
+        async def flow():
+            response, _ = await self.open(token='bogus')
+            self.assertEqual(response.status_code, 401)
+            response, _ = await self.open(assignment=self.assignment.pk)
+            self.assertEqual(response.status_code, 403)
+
+            creator_token, _ = await sync_to_async(tokens.issue)(self.creator)
+            _, chunks = await self.open(token=creator_token, assignment=self.assignment.pk)
+            self.hub.dispatch([push.assignment_channel(self.assignment.pk)], {'type': 'test'})
+            self.assertEqual(await chunks.__anext__(), b'event: test\ndata: {"type": "test"}\n\n')
+            await chunks.aclose()
+
+            self.hub.max_subscribers = 0
+            response, _ = await self.open()
+            self.assertEqual(response.status_code, 503)
+        async_to_sync(flow)()
+        self.assertEqual(self.client.get(reverse('events'), {'token': self.token}).status_code, 501)
+
+
+class SQLiteProfileTests(TestCase):
+    def test_pragmas_are_applied_to_new_connections(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    def test_reads_go_to_the_replica_outside_transactions(self):
+        router = db.ReadWriteRouter()
+        self.assertEqual(router.db_for_write(Review), 'default')
+        self.assertEqual(router.db_for_read(Review), 'default')  # inside the test's transaction
+        with mock.patch.object(connection, 'in_atomic_block', False):
+            self.assertEqual(router.db_for_read(Review), 'replica')
+        self.assertFalse(router.allow_migrate('replica', 'review_system'))
+        self.assertTrue(router.allow_migrate('default', 'review_system'))
+        with override_settings(READ_DATABASE_ALIAS=None), mock.patch.object(connection, 'in_atomic_block', False):
+            self.assertEqual(router.db_for_read(Review), 'default')
+
+
+class SQLiteScratchDatabaseTests(unittest.TestCase):
+    # Scratch database files with their own connections, outside the test
+    # database (Django's TestCase only allows the configured aliases).
+
+    def test_read_only_alias_uses_wal_and_refuses_writes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            benchmarks.add_sqlite_alias('read-only-test', os.path.join(directory, 'db.sqlite3'), None, {}, read_only=True)
+            try:
+                with connections['read-only-test'].cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    with self.assertRaises(DatabaseError):
+                        cursor.execute('CREATE TABLE t (id integer)')
+            finally:
+                connections['read-only-test'].close()
+                del connections.settings['read-only-test']
+
+    def test_concurrency_benchmark_runs_both_profiles(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for profile in benchmarks.SQLITE_PROFILES:
+                result = benchmarks.sqlite_concurrency(profile, directory, threads=2, requests=5, rows=10)
+                self.assertGreater(result['requests_per_second'], 0)
+        self.assertNotIn('sqlite-bench', ' '.join(connections.settings))
@@ -0,0 +1,151 @@
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import AuthToken, Role, Team, User
+
+# Hashed API tokens with a process-local principal cache. The database only
+# holds SHA-256(token). A resolved token is cached with its user, role names
+# and team ids for AUTH_TOKEN_CACHE_TTL seconds, so a steady stream of
+# requests with the same token runs no authentication queries at all.
+#
+# Role, team and user changes drop the affected entries from this process's
+# cache straight away; other processes pick them up when their entries
+# expire, so the TTL bounds how long a revoked role can linger elsewhere.
+
+
+class Principal(NamedTuple):
+    user: User
+    role_names: frozenset
+    team_ids: frozenset
+    expires_at: object  # token expiry (datetime)
+
+
+_principals = OrderedDict()  # key_hash -> (Principal, cached until)
+_lock = threading.Lock()
+
+
+def _hash(raw):
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _cache_ttl():
+    return getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60)
+
+
+def _cache_max_entries():
+    return getattr(settings, 'AUTH_TOKEN_CACHE_MAX_ENTRIES', 10000)
+
+
+def issue(user):
+    # Returns (raw token, expiry). The raw token is only ever seen here.
+    now = timezone.now()
+    raw = secrets.token_urlsafe(32)
+    expires_at = now + getattr(settings, 'AUTH_TOKEN_TTL', timedelta(days=14))
+    AuthToken.objects.filter(user=user, expires_at__lte=now).delete()
+    AuthToken.objects.create(key_hash=_hash(raw), user=user, expires_at=expires_at)
+    return raw, expires_at
+
+
+def revoke(raw):
+    key_hash = _hash(raw)
+    AuthToken.objects.filter(key_hash=key_hash).delete()
+    with _lock:
+        _principals.pop(key_hash, None)
+
+
+def resolve(raw):
+    # The Principal for a raw token, or None if it is unknown, expired or
+    # belongs to an inactive user.
+    key_hash = _hash(raw)
+    now = time.monotonic()
+    with _lock:
+        entry = _principals.get(key_hash)
+    if entry is not None:
+        principal, cached_until = entry
+        if cached_until > now and principal.expires_at > timezone.now():
+            return principal
+
+    token = (AuthToken.objects.select_related('user')
+             .filter(key_hash=key_hash, expires_at__gt=timezone.now(), user__is_active=True).first())
+    if token is None:
+        with _lock:
+            _principals.pop(key_hash, None)
+        return None
+    user = token.user
+    principal = Principal(
+        user=user,
+        role_names=frozenset(user.roles.values_list('role_name', flat=True)),
+        team_ids=frozenset(user.teams.values_list('team_id', flat=True)),
+        expires_at=token.expires_at,
+    )
+    with _lock:
+        _principals[key_hash] = (principal, now + _cache_ttl())
+        _principals.move_to_end(key_hash)
+        while len(_principals) > _cache_max_entries():
+            _principals.popitem(last=False)
+    return principal
+
+
+def invalidate(user_ids=None):
+    # Drop cached principals for ``user_ids``, or all of them.
+    with _lock:
+        if user_ids is None:
+            _principals.clear()
+            return
+        user_ids = set(user_ids)
+        for key_hash in [key for key, (principal, _) in _principals.items() if principal.user.pk in user_ids]:
+            del _principals[key_hash]
+
+
+def role_names(request):
+    # Role names of request.user: from the token principal when there is one,
+    # otherwise loaded once per request.
+    if isinstance(request.auth, Principal):
+        return request.auth.role_names
+    user = request.user
+    if not user.is_authenticated:
+        return frozenset()
+    if not hasattr(user, '_role_names'):
+        user._role_names = frozenset(user.roles.values_list('role_name', flat=True))
+    return user._role_names
+
+
+@receiver(m2m_changed, sender=User.roles.through)
+@receiver(m2m_changed, sender=User.teams.through)
+def _memberships_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate([instance.pk])
+    elif pk_set is not None:
+        invalidate(pk_set)
+    else:
+        invalidate()  # cleared from the role/team side; members are gone
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _user_changed(sender, instance, **kwargs):
+    invalidate([instance.pk])
+
+
+@receiver(post_delete, sender=Role)
+@receiver(post_delete, sender=Team)
+def _group_deleted(sender, **kwargs):
+    invalidate()
+
+
+@receiver(post_delete, sender=AuthToken)
+def _token_deleted(sender, instance, **kwargs):
+    with _lock:
+        _principals.pop(instance.key_hash, None)
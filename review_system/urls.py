@@ -5,6 +5,26 @@ from . import views
 urlpatterns = [
     path('signup/', SignUpView.as_view(), name='signup'),
     path('login/', LoginView.as_view(), name='login'),
+    path('logout/', views.LogoutView.as_view(), name='logout'),
     path('login/channeli/', views.RequestAccessAPI.as_view(), name='login-channeli'),
+    path('login/channeli/callback/', views.ChanneliCallbackView.as_view(), name='login-channeli-callback'),
     path('home/', views.HelloWorldView.as_view(), name='home'),
+    path('assignments/', views.AssignmentTreeListView.as_view(), name='assignment-list'),
+    path('assignments/<int:pk>/', views.AssignmentTreeDetailView.as_view(), name='assignment-detail'),
+    path('assignments/<int:pk>/export/', views.AssignmentExportView.as_view(), name='assignment-export'),
+    path('subtasks/', views.SubtaskListView.as_view(), name='subtask-list'),
+    path('submissions/', views.SubmissionListView.as_view(), name='submission-list'),
+    path('reviews/', views.ReviewListView.as_view(), name='review-list'),
+    path('comments/', views.ReviewCommentListView.as_view(), name='comment-list'),
+    path('me/assignments/', views.MyAssignmentsView.as_view(), name='my-assignments'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+    path('attachments/<int:pk>/download/', views.AttachmentDownloadView.as_view(), name='attachment-download'),
+    path('events/', views.EventStreamView.as_view(), name='events'),
+    path('sync/', views.SyncView.as_view(), name='sync'),
+    path('search/', views.SearchView.as_view(), name='search'),
+    path('queue/', views.ReviewQueueView.as_view(), name='review-queue'),
+    path('submissions/bulk/', views.SubmissionBulkView.as_view(), name='submission-bulk'),
+    path('reviews/bulk/', views.ReviewBulkView.as_view(), name='review-bulk'),
+    path('reviews/batch/', views.ReviewBatchView.as_view(), name='review-batch'),
+    path('comments/bulk/', views.ReviewCommentBulkView.as_view(), name='comment-bulk'),
 ]
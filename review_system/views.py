@@ -3,58 +3,735 @@ from rest_framework.views import APIView
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .models import User
-from django.contrib.auth import authenticate
+from rest_framework import generics
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.authentication import get_authorization_header
+from rest_framework.exceptions import ValidationError as APIValidationError
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Subquery
+from .models import User, Assignment, AssignmentReviewee, Subtask, Submission, Review, ReviewComment
+from . import cache, changes, downloads, export, hashing, idempotency, oauth, push, search, tokens
+from .conditional import ConditionalGetMixin
+from .permissions import HasRole
+from .metrics import registry
+from .pagination import KeysetPagination
+from .storage import attachment_storage
+from .serializers import ValuesSerializer, AssignmentSerializer, AssignmentTreeSerializer, SubtaskSerializer, ReviewQueueSerializer, SubmissionSerializer, ReviewSerializer, ReviewCommentSerializer, ReviewBatchSerializer
 from django.shortcuts import redirect
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, QueryDict, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+import json
+import mimetypes
 import os
-from django.http import HttpResponse
-from dotenv import load_dotenv
-load_dotenv()
+import secrets
+from urllib.parse import urlencode
 
-client_id = os.getenv("CLIENT_ID")
-client_secret = os.getenv("CLIENT_SECRET")
-redirect_uri = 'http://127.0.0.1:8000/home'
-success_string1 = 'yay'
-request_token_url = 'https://channeli.in/open_auth/token/'
-request_data_url = 'https://channeli.in/open_auth/get_user_data/'
+def _is_int(value):
+    # str.isdigit() alone also accepts digits such as '²' that int() rejects.
+    return value.isascii() and value.isdigit()
 
+def _reader(request):
+    # None when the caller may read everything (staff, reviewers and admins),
+    # otherwise the user whose reads changes.readable() scopes.
+    if request.user.is_staff or tokens.role_names(request) & set(downloads.PRIVILEGED_ROLES):
+        return None
+    return request.user
 
-params = {'client_id': client_id,
-        'client_secret': client_secret, 
-        'grant_type': 'authorization_code',
-        'code': '' ,
-        'redirect_uri' : redirect_uri,
-        'state': success_string1}
+# Channeli OAuth settings live in settings.CHANNELI_*; the code exchange is
+# done by review_system.oauth.
 
 class RequestAccessAPI(APIView):
     def get(self, request):
-        print(client_id)
-        URL= 'https://channeli.in/oauth/authorise' + "?client_id=" + client_id + "&redirect_uri=" + redirect_uri + "&state=" + success_string1
-        return redirect(URL)
+        query = urlencode({'client_id': settings.CHANNELI_CLIENT_ID, 'redirect_uri': settings.CHANNELI_REDIRECT_URI,
+                           'state': oauth.new_state(request.session)})
+        return redirect(f'{settings.CHANNELI_AUTHORIZE_URL}?{query}')
+
+class ChanneliCallbackView(View):
+    # Channeli redirects here with ?code=&state= after RequestAccessAPI. The
+    # code is exchanged, the user upserted and an API token returned, as from
+    # LoginView.
+    async def get(self, request):
+        code = request.GET.get('code')
+        if not code or not await oauth.check_state(request.session, request.GET.get('state')):
+            return JsonResponse({'error': 'Missing code or invalid state'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            user, token, expires_at = await oauth.sign_in(code)
+        except oauth.OAuthError as exc:
+            return JsonResponse({'error': str(exc)}, status=exc.status)
+        return JsonResponse({'message': 'Login successful', 'token': token, 'expires_at': expires_at},
+                            status=status.HTTP_200_OK)
 
 class HelloWorldView(APIView):
     def get(self, request):
         return HttpResponse("Hello, World!")
 
-class SignUpView(APIView):
+def _credentials(request):
+    # username/password/email from a JSON or form body, as the DRF views used
+    # to accept.
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+def _saturated():
+    response = JsonResponse({'error': 'Too many sign-ins in progress, try again shortly'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = str(getattr(settings, 'PASSWORD_HASHING_RETRY_AFTER', 1))
+    return response
+
+@method_decorator(csrf_exempt, name='dispatch')
+class SignUpView(View):
+    # Async so PBKDF2 runs in the bounded hashing pool, not on the event loop.
+    # Duplicates are caught by the unique constraints on insert rather than a
+    # racy exists() check.
+    async def post(self, request):
+        data = _credentials(request)
+        if data is None:
+            return JsonResponse({'error': 'Malformed request body'}, status=status.HTTP_400_BAD_REQUEST)
+        username = data.get('username')
+        password = data.get('password')
+        email = data.get('email')
+        if not username or not password:
+            return JsonResponse({'error': 'username and password are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            password_hash = await hashing.pool().make_password(password)
+        except hashing.PoolSaturated:
+            return _saturated()
+        user = User(username=User.normalize_username(username), email=User.objects.normalize_email(email),
+                    password=password_hash)
+        try:
+            await sync_to_async(self.insert)(user)
+        except IntegrityError:
+            return JsonResponse({'error': 'User already exists'}, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse({'message': 'User created successfully'}, status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def insert(user):
+        # Savepoint, so a duplicate leaves any enclosing transaction usable.
+        with transaction.atomic():
+            user.save(force_insert=True)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class LoginView(View):
+    async def post(self, request):
+        data = _credentials(request)
+        if data is None:
+            return JsonResponse({'error': 'Malformed request body'}, status=status.HTTP_400_BAD_REQUEST)
+        username = data.get('username')
+        password = data.get('password')
+
+        user = await User.objects.filter(username=username).afirst() if username else None
+        try:
+            if user is None or not user.is_active:
+                # Hash anyway so unknown usernames take as long as wrong passwords.
+                await hashing.pool().make_password(password or '')
+                matches, upgraded = False, None
+            else:
+                matches, upgraded = await hashing.pool().check_password(password or '', user.password)
+        except hashing.PoolSaturated:
+            return _saturated()
+        if not matches:
+            return JsonResponse({'error': 'Invalid username or password'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        if upgraded is not None:
+            await User.objects.filter(pk=user.pk).aupdate(password=upgraded)
+        token, expires_at = await sync_to_async(tokens.issue)(user)
+        return JsonResponse({'message': 'Login successful', 'token': token, 'expires_at': expires_at},
+                            status=status.HTTP_200_OK)
+
+class LogoutView(APIView):
+    # Revokes the token the request was authenticated with.
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        token = get_authorization_header(request).split()
+        if len(token) == 2 and isinstance(request.auth, tokens.Principal):
+            tokens.revoke(token[1].decode())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def assignment_tree_queryset(reader=None):
+    # One query per level of the tree, however many rows each level has. With
+    # a ``reader`` every level keeps only the rows they may read.
+    def level(model, *ordering):
+        queryset = model.objects.order_by(*ordering)
+        if reader is not None:
+            queryset = queryset.filter(changes.readable(changes.OBJECT_TYPES[model], reader))
+        return queryset
+    return level(Assignment, 'assignment_id').prefetch_related(
+        Prefetch('subtasks', queryset=level(Subtask, 'due_date', 'subtask_id')),
+        Prefetch('subtasks__submissions', queryset=level(Submission, 'submitted_at', 'submission_id')),
+        Prefetch('subtasks__submissions__reviews', queryset=level(Review, 'reviewed_at', 'review_id')),
+        Prefetch('subtasks__submissions__reviews__comments', queryset=level(ReviewComment, 'commented_at', 'comment_id')),
+    )
+
+def assignment_tree_querysets(assignment_id=None):
+    # Every table an assignment tree is built from, for conditional GETs.
+    querysets = [Assignment.objects.all(), Subtask.objects.all(), Submission.objects.all(),
+                 Review.objects.all(), ReviewComment.objects.all()]
+    if assignment_id is None:
+        return querysets
+    paths = ['pk', 'assignment_id', 'subtask__assignment_id', 'submission__subtask__assignment_id',
+             'review__submission__subtask__assignment_id']
+    return [queryset.filter(**{path: assignment_id}) for queryset, path in zip(querysets, paths)]
+
+class AssignmentTreeMixin(cache.CachedResponseMixin):
+    # Staff, reviewers and admins read every tree and share cached responses;
+    # anyone else gets the assignments they created or were given, trimmed to
+    # what changes.readable() lets them read, cached per user.
+    serializer_class = AssignmentTreeSerializer
+    permission_classes = [IsAuthenticated]
+
+    @property
+    def per_user(self):
+        return _reader(self.request) is not None
+
+    def get_scope_versions(self):
+        return [cache.MEMBERSHIPS] if self.per_user else []
+
+    def get_validator_extra(self):
+        return cache.versions(self.get_scope_versions())
+
+    def get_queryset(self):
+        return assignment_tree_queryset(_reader(self.request))
+
+class AssignmentTreeListView(AssignmentTreeMixin, generics.ListAPIView):
+    # GET /assignments/?page_size=&cursor=, newest first.
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-assigned_date', '-assignment_id')
+
+    def get_cache_versions(self):
+        return [cache.ASSIGNMENTS, *self.get_scope_versions()]
+
+    def get_validator_querysets(self):
+        return assignment_tree_querysets()
+
+class AssignmentTreeDetailView(AssignmentTreeMixin, generics.RetrieveAPIView):
+    def get_cache_versions(self):
+        return [cache.assignment(self.kwargs['pk']), *self.get_scope_versions()]
+
+    def get_validator_querysets(self):
+        return assignment_tree_querysets(self.kwargs['pk'])
+
+class ShapedListMixin:
+    # ?fields=a,b returns only those fields and selects only their columns;
+    # ?expand=x,y inlines related objects (serializers.EXPANSIONS), to-one
+    # ones through a JOIN in the same query and to-many ones with one more
+    # query per page. Unknown names are a 400.
+
+    def get_shape(self):
+        if not hasattr(self, '_shape'):
+            def names(param):
+                value = self.request.query_params.get(param)
+                return None if value is None else [name for name in value.split(',') if name]
+            self._shape = ValuesSerializer.shape(self.get_serializer_class(), names('fields'), names('expand'))
+        return self._shape
+
+    def get_shape_querysets(self):
+        # Validators for the tables expansions read from. Users have no
+        # updated_at; the "users" version stands in for them.
+        return [model.objects.all() for model in self.get_shape().models() if model is not User]
+
+    def get_shape_versions(self):
+        return [cache.USERS] if User in self.get_shape().models() else []
+
+    def get_validator_extra(self):
+        return cache.versions(self.get_shape_versions())
+
+    def shaped_values(self, queryset, *columns):
+        shape = self.get_shape()
+        return queryset.values(*shape.columns, *(column for column in columns if column not in shape.columns))
+
+class SubtaskListView(ShapedListMixin, cache.CachedResponseMixin, generics.ListAPIView):
+    # GET /subtasks/?assignment=<id>
+    serializer_class = SubtaskSerializer
+
+    def get_assignment_id(self):
+        # Validated before it reaches the cache version key or the filter.
+        assignment_id = self.request.query_params.get('assignment')
+        if not assignment_id:
+            return None
+        if not _is_int(assignment_id):
+            raise APIValidationError({'assignment': 'Must be an assignment id.'})
+        return int(assignment_id)
+
+    def get_cache_versions(self):
+        assignment_id = self.get_assignment_id()
+        return [cache.ASSIGNMENTS if assignment_id is None else cache.assignment(assignment_id), *self.get_shape_versions()]
+
+    def get_validator_querysets(self):
+        return [self.get_queryset(), *self.get_shape_querysets()]
+
+    def list(self, request, *args, **kwargs):
+        return Response(self.get_shape().to_representation(self.shaped_values(self.get_queryset())))
+
+    def get_queryset(self):
+        queryset = Subtask.objects.order_by('due_date', 'subtask_id')
+        assignment_id = self.get_assignment_id()
+        if assignment_id is not None:
+            queryset = queryset.filter(assignment_id=assignment_id)
+        return queryset
+
+class BulkWriteView(APIView):
+    # POST a list of objects to create them, PATCH a list of partial objects
+    # (each carrying its primary key) to update them. The whole batch is
+    # validated first and written in one transaction; on failure nothing is
+    # written and the errors are returned keyed by item index. POSTs honour
+    # Idempotency-Key.
+    #
+    # ``actor_field`` (reviewer, commenter, ...) is always the requesting
+    # user, and PATCH only reaches the user's own rows.
+    serializer_class = None
+    actor_field = None
+    max_items = 1000
+
     def post(self, request):
-        username = request.data.get('username')
-        password = request.data.get('password')
-        email = request.data.get('email')
+        serializer = self.serializer_class(data=self.pin_actor(request.data), many=True, max_length=self.max_items)
+        return idempotency.respond(request, lambda: self.save(serializer, status.HTTP_201_CREATED))
+
+    def patch(self, request):
+        model = self.serializer_class.Meta.model
+        pk_name = model._meta.pk.name
+        pks = set()
+        if isinstance(request.data, list):
+            for item in request.data[:self.max_items]:
+                if not isinstance(item, dict):
+                    continue
+                try:
+                    pks.add(model._meta.pk.to_python(item.get(pk_name)))
+                except ValidationError:
+                    continue
+        pks.discard(None)
+        own = model.objects.filter(**{self.actor_field: request.user})
+        serializer = self.serializer_class(
+            own.in_bulk(pks), data=self.pin_actor(request.data), many=True, partial=True, max_length=self.max_items,
+        )
+        return self.save(serializer, status.HTTP_200_OK)
 
-        if User.objects.filter(username=username).exists():
-            return Response({'error': 'User already exists'}, status=status.HTTP_400_BAD_REQUEST)
+    def pin_actor(self, data):
+        if not isinstance(data, list):
+            return data
+        return [{**item, self.actor_field: self.request.user.pk} if isinstance(item, dict) else item
+                for item in data]
 
-        user = User.objects.create_user(username=username, password=password, email=email)
-        return Response({'message': 'User created successfully'}, status=status.HTTP_201_CREATED)
+    def save(self, serializer, success_status):
+        with transaction.atomic():
+            if not serializer.is_valid():
+                return Response({'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+            objs = serializer.save()
+        return Response(self.serializer_class(objs, many=True).data, status=success_status)
+
+class SubmissionBulkView(BulkWriteView):
+    serializer_class = SubmissionSerializer
+    actor_field = 'reviewee'
+    permission_classes = [HasRole('reviewee', 'admin')]
+
+class ReviewBulkView(BulkWriteView):
+    serializer_class = ReviewSerializer
+    actor_field = 'reviewer'
+    permission_classes = [HasRole('reviewer', 'admin')]
+
+class ReviewCommentBulkView(BulkWriteView):
+    serializer_class = ReviewCommentSerializer
+    actor_field = 'commenter'
+    permission_classes = [IsAuthenticated]
+
+class ReviewBatchView(APIView):
+    # POST a review together with its comments and attachments: one request
+    # and one transaction instead of a request per object. JSON bodies are
+    # {"review": {...}, "comments": ["..."]}; multipart bodies (needed for
+    # attachments) send review and comments as JSON-encoded fields alongside
+    # the "attachments" files. The requesting user is the reviewer and
+    # commenter. Honours Idempotency-Key.
+    permission_classes = [HasRole('reviewer', 'admin')]
 
-class LoginView(APIView):
     def post(self, request):
-        username = request.data.get('username')
-        password = request.data.get('password')
+        return idempotency.respond(request, lambda: self.create(request))
+
+    def create(self, request):
+        data = request.data
+        if isinstance(data, QueryDict):
+            try:
+                data = {'review': json.loads(data.get('review', 'null')),
+                        'comments': json.loads(data.get('comments', '[]')),
+                        'attachments': data.getlist('attachments')}
+            except ValueError:
+                raise APIValidationError({'detail': 'review and comments must be JSON-encoded.'})
+        if isinstance(data, dict) and isinstance(data.get('review'), dict):
+            data = {**data, 'review': {**data['review'], 'reviewer': request.user.pk}}
+        serializer = ReviewBatchSerializer(data=data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        user = authenticate(request, username=username, password=password)
-        if user is not None:
-            return Response({'message': 'Login successful'}, status=status.HTTP_200_OK)
+class KeysetListView(ShapedListMixin, idempotency.IdempotentCreateMixin, ConditionalGetMixin, generics.ListCreateAPIView):
+    # Newest-first listing paginated by a (timestamp, pk) cursor. Each entry in
+    # ``filter_params`` maps a query parameter to the foreign key it filters,
+    # matching the leading column of the model's keyset index. POSTs honour
+    # Idempotency-Key.
+    #
+    # Listing needs a login and, below staff, reviewers and admins, only
+    # returns what changes.readable() lets the user read. Creating needs
+    # ``create_permission_classes`` and always records the requesting user in
+    # ``actor_field``.
+    pagination_class = KeysetPagination
+    permission_classes = [IsAuthenticated]
+    keyset_ordering = None
+    filter_params = {}
+    actor_field = None
+    create_permission_classes = [IsAuthenticated]
+
+    @property
+    def per_user(self):
+        return _reader(self.request) is not None
+
+    def get_permissions(self):
+        if self.request.method == 'POST':
+            return [permission() for permission in self.create_permission_classes]
+        return super().get_permissions()
+
+    def get_serializer(self, *args, **kwargs):
+        data = kwargs.get('data')
+        if self.actor_field and isinstance(data, dict):
+            data = kwargs['data'] = data.copy()
+            data[self.actor_field] = self.request.user.pk
+        return super().get_serializer(*args, **kwargs)
+
+    def get_validator_querysets(self):
+        return [self.filter_queryset(self.get_queryset()), *self.get_shape_querysets()]
+
+    def get_queryset(self):
+        model = self.serializer_class.Meta.model
+        queryset = model.objects.all()
+        reader = _reader(self.request)
+        if reader is not None:
+            queryset = queryset.filter(changes.readable(changes.OBJECT_TYPES[model], reader))
+        for param, field in self.filter_params.items():
+            value = self.request.query_params.get(param)
+            if value is None:
+                continue
+            if not _is_int(value):
+                raise APIValidationError({param: ['A valid integer is required.']})
+            queryset = queryset.filter(**{field: int(value)})
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        # Read-only fast path: page over values() rows and build the same
+        # output as the serializer without instantiating models.
+        queryset = self.shaped_values(self.filter_queryset(self.get_queryset()),
+                                      *(field.lstrip('-') for field in self.keyset_ordering))
+        return self.get_paginated_response(self.get_shape().to_representation(self.paginate_queryset(queryset)))
+
+    def perform_create(self, serializer):
+        # Signal handlers (e.g. the review summary counters) write in the same
+        # transaction as the row itself.
+        with transaction.atomic():
+            serializer.save()
+
+class SubmissionListView(KeysetListView):
+    serializer_class = SubmissionSerializer
+    keyset_ordering = ('-submitted_at', '-submission_id')
+    filter_params = {'subtask': 'subtask_id'}
+    actor_field = 'reviewee'
+    create_permission_classes = [HasRole('reviewee', 'admin')]
+
+class ReviewListView(KeysetListView):
+    serializer_class = ReviewSerializer
+    keyset_ordering = ('-reviewed_at', '-review_id')
+    filter_params = {'submission': 'submission_id'}
+    actor_field = 'reviewer'
+    create_permission_classes = [HasRole('reviewer', 'admin')]
+
+class ReviewCommentListView(KeysetListView):
+    serializer_class = ReviewCommentSerializer
+    keyset_ordering = ('-commented_at', '-comment_id')
+    filter_params = {'review': 'review_id'}
+    actor_field = 'commenter'
+
+class ReviewQueueView(KeysetListView):
+    # Submissions still waiting for a reviewer: the newest iteration for each
+    # (subtask, reviewee) that has no review yet, soonest due first. Both the
+    # "newest iteration" and "no review" checks are correlated subqueries
+    # answered from indexes, so the cost does not grow with older iterations.
+    serializer_class = ReviewQueueSerializer
+    keyset_ordering = ('due_date', 'submission_id')
+    filter_params = {'subtask': 'subtask_id', 'assignment': 'subtask__assignment_id'}
+    http_method_names = ['get', 'head', 'options']
+    permission_classes = [HasRole('reviewer', 'admin')]
+    subtask_params = {'subtask': 'pk', 'assignment': 'assignment_id'}
+
+    def get_validator_querysets(self):
+        # Besides the queued submissions, the response depends on their
+        # subtasks (due_date is returned and sorted on) and on reviews, since
+        # a new review takes a submission out of the queue.
+        querysets = super().get_validator_querysets()
+        subtasks = Subtask.objects.filter(**{field: int(self.request.query_params[param])
+                                             for param, field in self.subtask_params.items()
+                                             if param in self.request.query_params})
+        return [*querysets, subtasks, Review.objects.filter(submission__subtask__in=subtasks)]
+
+    def get_queryset(self):
+        latest_iteration = (Submission.objects
+                            .filter(subtask=OuterRef('subtask'), reviewee=OuterRef('reviewee'))
+                            .order_by('-submitted_at', '-submission_id')
+                            .values('submission_id')[:1])
+        reviewed = Review.objects.filter(submission=OuterRef('submission_id'))
+        return (super().get_queryset()
+                .filter(submission_id=Subquery(latest_iteration))
+                .filter(~Exists(reviewed))
+                .annotate(due_date=F('subtask__due_date')))
+
+class MyAssignmentsView(ShapedListMixin, cache.CachedResponseMixin, generics.ListAPIView):
+    # Assignments that apply to the current user, individually or through a
+    # team, read from the materialized AssignmentReviewee index.
+    serializer_class = AssignmentSerializer
+    permission_classes = [IsAuthenticated]
+    per_user = True
+
+    def get_cache_versions(self):
+        return [cache.ASSIGNMENTS, cache.MEMBERSHIPS, *self.get_shape_versions()]
+
+    def get_validator_querysets(self):
+        return [self.get_queryset(), *self.get_shape_querysets()]
+
+    def list(self, request, *args, **kwargs):
+        return Response(self.get_shape().to_representation(self.shaped_values(self.get_queryset())))
+
+    def get_queryset(self):
+        assignment_ids = AssignmentReviewee.objects.filter(user=self.request.user).values('assignment_id')
+        return Assignment.objects.filter(assignment_id__in=assignment_ids).order_by('-assigned_date', '-assignment_id')
+
+class SearchView(APIView):
+    # GET /search/?q=...&kind=review&kind=submission&page=2
+    # Hits are limited to what the caller may read (see review_system.search).
+    permission_classes = [IsAuthenticated]
+    page_size = 20
+    max_page = 50
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'The q parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = max(1, min(int(request.query_params.get('page', 1)), self.max_page))
+        except ValueError:
+            page = 1
+        kinds = request.query_params.getlist('kind') or None
+        hits = search.search(query, kinds=kinds, limit=self.page_size + 1, offset=(page - 1) * self.page_size,
+                             reader=_reader(request))
+        next_page = None
+        if len(hits) > self.page_size and page < self.max_page:
+            next_page = replace_query_param(request.build_absolute_uri(), 'page', page + 1)
+        return Response({'next': next_page, 'results': hits[:self.page_size]})
+
+class AssignmentExportView(APIView):
+    # GET /assignments/<pk>/export/?output=csv|jsonl&after=<submission_id>
+    # Streams every submission, review and comment of the assignment; memory
+    # stays flat however large the export is.
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, pk):
+        output = request.query_params.get('output', 'csv')
+        if output not in export.FORMATS:
+            return Response({'error': f'output must be one of {", ".join(export.FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+        after = request.query_params.get('after')
+        if after is not None and not _is_int(after):
+            return Response({'error': 'after must be a submission id'}, status=status.HTTP_400_BAD_REQUEST)
+        if not Assignment.objects.filter(pk=pk).exists():
+            return Response({'error': 'Assignment not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        rows = export.records(pk, after=int(after) if after else None)
+        content = export.render(rows, output)
+        if isinstance(request._request, ASGIRequest):
+            content = export.in_batches(content)
+        response = StreamingHttpResponse(content, content_type=export.FORMATS[output])
+        response['Content-Disposition'] = f'attachment; filename="assignment-{pk}.{output}"'
+        return response
+
+class AttachmentDownloadView(APIView):
+    # GET /attachments/<pk>/download/
+    # The attachment's bytes under its uploaded filename. Honours Range (a
+    # single byte range; If-Range is respected), If-None-Match,
+    # If-Modified-Since, If-Match and If-Unmodified-Since. Attachments the
+    # user may not read are reported as missing.
+    permission_classes = [IsAuthenticated]
+
+    def perform_content_negotiation(self, request, force=False):
+        # Any Accept header is fine for the file; errors still render as JSON.
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, pk):
+        privileged = None
+        if isinstance(request.auth, tokens.Principal):
+            privileged = bool(request.auth.role_names & set(downloads.PRIVILEGED_ROLES))
+        row = downloads.attachment_for(request.user, pk, privileged)
+        if row is None or not row[3]:
+            raise Http404
+        name, filename, updated_at, _ = row
+        path = attachment_storage().path(name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise Http404
+
+        etag = downloads.etag(name, stat.st_size, stat.st_mtime)
+        last_modified = int(updated_at.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.file_response(request, path, stat.st_size, etag, last_modified,
+                                          filename or os.path.basename(name))
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def file_response(self, request, path, size, etag, last_modified, filename):
+        byte_range = None
+        if_range = request.headers.get('If-Range')
+        if if_range is None or if_range == etag or parse_http_date_safe(if_range) == last_modified:
+            byte_range = downloads.byte_range(request.headers.get('Range'), size)
+        if byte_range is False:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        header = getattr(settings, 'ATTACHMENT_SENDFILE_HEADER', None)
+        if header:
+            # The front server reads the file and handles Range itself.
+            response = HttpResponse(content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+            response[header] = downloads.sendfile_target(path, settings.MEDIA_ROOT, header,
+                                                         getattr(settings, 'ATTACHMENT_SENDFILE_PREFIX', '/protected-media/'))
+            response['Content-Disposition'] = content_disposition_header(True, filename)
+            return response
+
+        if byte_range is None:
+            response = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename)
         else:
-            return Response({'error': 'Invalid username or password'}, status=status.HTTP_401_UNAUTHORIZED)
+            start, end = byte_range
+            response = FileResponse(downloads.open_range(path, start, end), as_attachment=True, filename=filename,
+                                    status=status.HTTP_206_PARTIAL_CONTENT)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+class EventStreamView(View):
+    # GET /events/?assignment=<id>&assignment=<id>
+    # Server-sent events for the signed-in user: review.created and
+    # comment.created on their submissions and reviews, plus everything under
+    # the listed assignments for their creators, reviewers and admins. Since
+    # EventSource cannot send headers, the API token may also be passed as
+    # ?token=. Needs the ASGI entry point; a stream that falls behind ends
+    # with an "overflow" event and should resume through /sync/.
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse({'error': 'The event stream is only served over ASGI'},
+                                status=status.HTTP_501_NOT_IMPLEMENTED)
+        user = await self.authenticate(request)
+        if user is None:
+            return JsonResponse({'error': 'Authentication credentials were not provided.'},
+                                status=status.HTTP_401_UNAUTHORIZED)
+        assignment_ids = request.GET.getlist('assignment')
+        if not all(_is_int(value) for value in assignment_ids):
+            return JsonResponse({'error': 'assignment must be an assignment id'}, status=status.HTTP_400_BAD_REQUEST)
+        assignment_ids = {int(value) for value in assignment_ids}
+        if assignment_ids and not await sync_to_async(self.may_follow)(user, assignment_ids):
+            return JsonResponse({'error': 'Only creators, reviewers and admins can follow an assignment'},
+                                status=status.HTTP_403_FORBIDDEN)
+
+        hub = push.hub()
+        if hub.full():
+            response = JsonResponse({'error': 'Too many open event streams'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = '5'
+            return response
+        channels = [push.user_channel(user.pk), *(push.assignment_channel(pk) for pk in sorted(assignment_ids))]
+        response = StreamingHttpResponse(self.stream(hub, channels), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def authenticate(self, request):
+        header = request.headers.get('Authorization', '').split()
+        raw = header[1] if len(header) == 2 and header[0].lower() == 'token' else request.GET.get('token')
+        if raw:
+            principal = await sync_to_async(tokens.resolve)(raw)
+            return principal.user if principal else None
+        user = await request.auser()
+        return user if user.is_authenticated else None
+
+    @staticmethod
+    def may_follow(user, assignment_ids):
+        if user.is_staff or user.roles.filter(role_name__in=('reviewer', 'admin')).exists():
+            return True
+        created = Assignment.objects.filter(pk__in=assignment_ids, created_by=user).count()
+        return created == len(assignment_ids)
+
+    async def stream(self, hub, channels):
+        heartbeat = getattr(settings, 'PUSH_HEARTBEAT', 15)
+        subscription = hub.subscribe(channels)
+        try:
+            yield f'retry: {getattr(settings, "PUSH_RETRY_MS", 5000)}\n: connected\n\n'
+            while True:
+                event = await subscription.get(heartbeat)
+                if event is None:
+                    yield ': keep-alive\n\n'
+                elif event is push.OVERFLOW:
+                    yield 'event: overflow\ndata: {}\n\n'
+                    return
+                else:
+                    yield f'event: {event["type"]}\ndata: {json.dumps(event)}\n\n'
+        finally:
+            hub.unsubscribe(subscription)
+
+class SyncView(APIView):
+    # GET /sync/?since=<seq>&limit=<n>
+    # Assignments, subtasks, submissions, reviews and comments created, changed
+    # or deleted after ``since``, in change order; deletions come back as
+    # tombstones with ``deleted`` set. Clients keep ``cursor`` and send it back
+    # as ``since``; ``next`` is set while more changes are waiting. Staff,
+    # reviewers and admins get every change, anyone else what they may read
+    # (see review_system.changes).
+    permission_classes = [IsAuthenticated]
+    default_limit = 500
+    max_limit = 1000
+
+    def get(self, request):
+        since = request.query_params.get('since', '0')
+        limit = request.query_params.get('limit', str(self.default_limit))
+        if not _is_int(since):
+            return Response({'error': 'since must be a change sequence number'}, status=status.HTTP_400_BAD_REQUEST)
+        if not _is_int(limit) or int(limit) < 1:
+            return Response({'error': 'limit must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        entries, cursor, has_more = changes.since(int(since), min(int(limit), self.max_limit), _reader(request))
+        next_url = replace_query_param(request.build_absolute_uri(), 'since', cursor) if has_more else None
+        return Response({'next': next_url, 'cursor': cursor, 'results': entries})
+
+class MetricsView(APIView):
+    # Prometheus scrape endpoint for the PerformanceMiddleware histograms.
+    # Open to staff users and to scrapers sending "Authorization: Bearer <METRICS_TOKEN>".
+    # Client addresses are not trusted: behind a proxy every request looks local.
+
+    def get(self, request):
+        if not (request.user.is_staff or self.has_scrape_token(request)):
+            return Response({'error': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    def has_scrape_token(self, request):
+        header = get_authorization_header(request).split()
+        if not settings.METRICS_TOKEN or len(header) != 2 or header[0].lower() != b'bearer':
+            return False
+        return secrets.compare_digest(header[1], settings.METRICS_TOKEN.encode())